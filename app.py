@@ -2,10 +2,18 @@ import streamlit as st
 from pathlib import Path
 
 from src.data_loader import ReviewLoader
+from src.embedding_cache import EmbeddingCache
+from src.embeddings import LocalEmbedder
+from src.pipeline import IngestionPipeline
 from src.preprocessor import ReviewPreprocessor
+from src.response_cache import ResponseCache
 from src.vector_store import ReviewVectorStore
+from src.context_builder import ContextBuilder
+from src.reranker import CrossEncoderReranker
 from src.retriever import ReviewRetriever
 from src.llm_chain import ReviewQAChain
+from src.materialized_answers import MaterializedAnswers
+from src.metrics import metriques
 import config
 
 
@@ -16,9 +24,19 @@ st.caption("Posez des questions sur un produit à partir de vrais avis clients 
 
 @st.cache_resource
 def charger_chaine():
-    store = ReviewVectorStore()
-    retriever = ReviewRetriever(store=store)
-    return ReviewQAChain(retriever=retriever), store
+    if config.METRICS_PORT is not None:
+        metriques.servir(config.METRICS_PORT)
+    store = ReviewVectorStore(embedder=LocalEmbedder(cache=EmbeddingCache()))
+    retriever = ReviewRetriever(
+        store=store,
+        reranker=CrossEncoderReranker() if config.RERANK else None,
+        constructeur=ContextBuilder() if config.CONTEXT_PACKING else None,
+    )
+    cache = ResponseCache(seuil_similarite=config.RESPONSE_CACHE_SIMILARITY_THRESHOLD)
+    chaine = ReviewQAChain(retriever=retriever, cache=cache, materialisees=MaterializedAnswers())
+    # Les modèles se chargent pendant que la page s'affiche
+    chaine.prechauffer()
+    return chaine, store
 
 
 chaine, store = charger_chaine()
@@ -27,34 +45,37 @@ chaine, store = charger_chaine()
 with st.sidebar:
     st.header("Indexer les avis")
 
-    fichier = st.file_uploader("Importer un fichier d'avis (CSV ou JSON)", type=["csv", "json"])
+    fichier = st.file_uploader("Importer un fichier d'avis (CSV, JSON ou JSON Lines)", type=["csv", "json", "jsonl"])
 
     utiliser_exemple = st.checkbox("Utiliser les avis exemples (data/sample_reviews.json)", value=True)
 
     if st.button("Indexer"):
-        loader = ReviewLoader()
-        preprocessor = ReviewPreprocessor()
-
         if fichier is not None:
-            suffix = Path(fichier.name).suffix.lower()
             tmp_path = Path(config.RAW_DATA_PATH) / fichier.name
             tmp_path.parent.mkdir(parents=True, exist_ok=True)
             with open(tmp_path, "wb") as f:
                 f.write(fichier.read())
-            df = loader.load(fichier.name)
+            loader, nom_fichier = ReviewLoader(), fichier.name
         elif utiliser_exemple:
-            import json, pandas as pd
-            with open("data/sample_reviews.json", "r") as f:
-                df = pd.DataFrame(json.load(f))
+            loader, nom_fichier = ReviewLoader(data_path="data"), "sample_reviews.json"
         else:
             st.warning("Aucun fichier sélectionné.")
             st.stop()
 
-        df = preprocessor.nettoyer(df)
-        docs = preprocessor.vers_documents(df)
-        store.reinitialiser()
-        store.ajouter_documents(docs)
-        st.success(f"{len(docs)} morceaux indexés depuis {len(df)} avis.")
+        suivi = st.empty()
+        pipeline = IngestionPipeline(
+            store,
+            loader=loader,
+            preprocessor=ReviewPreprocessor(),
+            progression=lambda s: suivi.caption(
+                f"{s.avis_lus} avis lus, {s.morceaux} morceaux ({s.avis_par_seconde:.0f} avis/s)"
+            ),
+        )
+        stats = pipeline.executer(nom_fichier, supprimer_absents=True)
+        st.success(
+            f"{stats.morceaux} morceaux depuis {stats.avis_retenus} avis : {stats.ajoutes} ajoutés, "
+            f"{stats.modifies} modifiés, {stats.supprimes} supprimés."
+        )
 
     st.metric("Morceaux dans la base", store.compter())
 
@@ -65,6 +86,7 @@ with st.sidebar:
         format_func=lambda x: {"qa": "Q&R", "faq": "FAQ", "summarize": "Résumé"}.get(x, x),
     )
     filtre_note = st.slider("Filtre note minimale (0 = pas de filtre)", 0, 5, 0)
+    filtre_asin = st.text_input("Produit (asin, vide = tous les produits)").strip()
 
 
 question = st.text_input("Votre question", placeholder="Ce produit convient-il aux débutants ?")
@@ -73,18 +95,35 @@ if st.button("Demander", type="primary") and question:
     if store.compter() == 0:
         st.error("Aucun avis indexé. Utilisez le panneau latéral pour indexer des avis d'abord.")
     else:
-        with st.spinner("Analyse en cours..."):
-            resultat = chaine.executer(
-                question=question,
-                mode=mode,
-                filtre_note=filtre_note if filtre_note > 0 else None,
-            )
+        flux = chaine.executer_flux(
+            question=question,
+            mode=mode,
+            filtre_note=filtre_note if filtre_note > 0 else None,
+            asin=filtre_asin or None,
+        )
+        with st.spinner("Recherche des avis..."):
+            evenement = next(flux)
+            sources = evenement["sources"]
 
         st.subheader("Réponse")
-        st.write(resultat["answer"])
+        if evenement.get("materialized"):
+            st.caption("Réponse pré-calculée (python materialize.py)")
+        durees = {}
+
+        def textes():
+            for evenement in flux:
+                if evenement["type"] == "timings":
+                    durees.update(evenement["timings"])
+                else:
+                    yield evenement["texte"]
+
+        st.write_stream(textes())
+        metriques.ecrire()
+        if durees:
+            st.caption(" · ".join(f"{etape} {ms:.0f} ms" for etape, ms in durees.items()))
 
         with st.expander("Avis sources utilisés"):
-            for i, src in enumerate(resultat["sources"], 1):
+            for i, src in enumerate(sources, 1):
                 note = src["metadata"].get("note", "?")
                 st.markdown(f"**Avis {i}** (note {note}/5)")
                 st.write(src["text"])
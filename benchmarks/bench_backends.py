@@ -0,0 +1,110 @@
+"""
+Benchmark des backends vectoriels : Chroma (HNSW) contre mmap (exact, partitionné par asin, IVF optionnel).
+
+Mesure l'écriture, l'ouverture, la latence (p50/p95) et le rappel@k par rapport à une recherche exacte,
+sur des requêtes filtrées par produit et sur le catalogue complet.
+Lancer avec :  python -m benchmarks.bench_backends [--n 50000] [--asins 50] [--dimension 384]
+"""
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from src.mmap_backend import BackendMmap
+from src.vector_backends import BackendChroma
+
+
+def generer_vecteurs(n: int, dimension: int, n_asins: int, graine: int = 0):
+    rng = np.random.default_rng(graine)
+    # Vecteurs groupés autour de thèmes, comme des embeddings d'avis
+    themes = rng.normal(size=(64, dimension)).astype(np.float32)
+    vecteurs = themes[rng.integers(0, len(themes), size=n)] + 0.6 * rng.normal(size=(n, dimension)).astype(np.float32)
+    vecteurs /= np.linalg.norm(vecteurs, axis=1, keepdims=True)
+    ids = [f"{i:032x}" for i in range(n)]
+    metadonnees = [{"asin": f"B{i % n_asins:05d}", "note": float(i % 5 + 1)} for i in range(n)]
+    return ids, vecteurs, metadonnees
+
+
+def exact(vecteurs: np.ndarray, requete: np.ndarray, lignes: np.ndarray, k: int) -> set[str]:
+    sims = vecteurs[lignes] @ requete
+    return {f"{lignes[i]:032x}" for i in np.argsort(-sims)[:k]}
+
+
+def mesurer(libelle: str, backend, requetes, filtres, attendus, k: int) -> None:
+    latences, rappels = [], []
+    for requete, filtre, attendu in zip(requetes, filtres, attendus):
+        debut = time.perf_counter()
+        ids = backend.query(requete[np.newaxis, :], n_results=k, where=filtre, include=["distances"])["ids"][0]
+        latences.append(time.perf_counter() - debut)
+        rappels.append(len(set(ids) & attendu) / k)
+    p50, p95 = np.percentile(np.array(latences) * 1000, [50, 95])
+    print(f"  {libelle:<22} p50 {p50:7.2f} ms  p95 {p95:7.2f} ms  rappel@{k} {np.mean(rappels):.3f}")
+
+
+def taille_dossier(chemin: str) -> float:
+    return sum(f.stat().st_size for f in Path(chemin).rglob("*") if f.is_file()) / 2**20
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=50_000)
+    parser.add_argument("--asins", type=int, default=50)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--requetes", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    ids, vecteurs, metadonnees = generer_vecteurs(args.n, args.dimension, args.asins)
+    documents = [f"avis {i}" for i in range(args.n)]
+    rng = np.random.default_rng(1)
+    requetes = vecteurs[rng.integers(0, args.n, size=args.requetes)] + 0.3 * rng.normal(
+        size=(args.requetes, args.dimension)
+    ).astype(np.float32)
+    requetes /= np.linalg.norm(requetes, axis=1, keepdims=True)
+    asins = np.array([m["asin"] for m in metadonnees])
+    asins_requetes = [f"B{a:05d}" for a in rng.integers(0, args.asins, size=args.requetes)]
+    tout = np.arange(args.n)
+
+    with tempfile.TemporaryDirectory() as dossier:
+        backends = {}
+        for nom, fabrique in (
+            ("chroma", lambda: BackendChroma(f"{dossier}/chroma", "bench")),
+            ("mmap", lambda: BackendMmap(f"{dossier}/mmap")),
+        ):
+            backend = fabrique()
+            debut = time.perf_counter()
+            taille = backend.taille_lot_max()
+            for i in range(0, args.n, taille):
+                backend.upsert(ids[i: i + taille], vecteurs[i: i + taille], documents[i: i + taille], metadonnees[i: i + taille])
+            ecriture = time.perf_counter() - debut
+            debut = time.perf_counter()
+            backends[nom] = fabrique()
+            backends[nom].count()
+            ouverture = time.perf_counter() - debut
+            print(
+                f"{nom:<7} écriture {ecriture:6.1f} s ({args.n / ecriture:,.0f} vecteurs/s)  "
+                f"ouverture {ouverture * 1000:7.1f} ms  disque {taille_dossier(f'{dossier}/{nom}'):7.1f} Mo"
+            )
+
+        print(f"Requêtes filtrées par produit (~{args.n // args.asins} morceaux par asin)")
+        filtres = [{"asin": {"$eq": a}} for a in asins_requetes]
+        attendus = [exact(vecteurs, q, np.flatnonzero(asins == a), args.k) for q, a in zip(requetes, asins_requetes)]
+        for nom, backend in backends.items():
+            mesurer(nom, backend, requetes, filtres, attendus, args.k)
+
+        print("Catalogue complet")
+        attendus = [exact(vecteurs, q, tout, args.k) for q in requetes]
+        sans_filtre = [None] * args.requetes
+        mesurer("chroma (HNSW)", backends["chroma"], requetes, sans_filtre, attendus, args.k)
+        mesurer("mmap (exact)", backends["mmap"], requetes, sans_filtre, attendus, args.k)
+        debut = time.perf_counter()
+        backends["mmap"].construire_ivf()
+        print(f"  construction IVF en {time.perf_counter() - debut:.1f} s")
+        mesurer(f"mmap (IVF, {backends['mmap'].n_sondes} sondes)", backends["mmap"], requetes, sans_filtre, attendus, args.k)
+
+
+if __name__ == "__main__":
+    main()
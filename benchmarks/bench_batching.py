@@ -0,0 +1,62 @@
+"""
+Benchmark des lots d'encodage à l'ingestion : lots fixes dans l'ordre d'origine contre lots triés par longueur
+et limités par un budget de tokens.
+
+Le corpus imite la distribution des morceaux d'avis : beaucoup de textes courts (à partir des 20 caractères
+gardés par le nettoyage) et une traîne jusqu'à CHUNK_SIZE. Pour chaque budget sont mesurés le débit,
+l'efficacité du remplissage (part des tokens utiles) et l'écart maximal aux vecteurs des lots fixes.
+Lancer avec :  python -m benchmarks.bench_batching [--n 5000] [--budgets 1024 2048 8192] [--modele all-MiniLM-L6-v2]
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+import config
+from benchmarks.bench_quantization import generer_avis
+from src.embeddings import LocalEmbedder
+
+
+def corpus_asymetrique(n: int, graine: int = 0) -> list[str]:
+    """Textes de longueur log-normale entre 20 caractères et CHUNK_SIZE."""
+    textes, _ = generer_avis(n, graine=graine)
+    rng = np.random.default_rng(graine)
+    longueurs = np.clip(rng.lognormal(mean=4.3, sigma=0.9, size=n), 20, config.CHUNK_SIZE).astype(int)
+    return [(t * (config.CHUNK_SIZE // max(1, len(t)) + 1))[:l] for t, l in zip(textes, longueurs)]
+
+
+def mesurer(embedder: LocalEmbedder, textes: list[str]) -> tuple[np.ndarray, float]:
+    embedder.encoder(textes[:256])
+    debut = time.perf_counter()
+    vecteurs = embedder.encoder(textes)
+    return vecteurs, len(textes) / (time.perf_counter() - debut)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=5_000)
+    parser.add_argument("--lot", type=int, default=config.EMBEDDING_BATCH_SIZE, help="Textes par lot fixe")
+    parser.add_argument("--budgets", type=int, nargs="+", default=[1_024, 2_048, 8_192])
+    parser.add_argument("--modele", default=config.EMBEDDING_MODEL)
+    args = parser.parse_args()
+
+    textes = corpus_asymetrique(args.n)
+    print(f"{len(textes):,} textes, {np.mean([len(t) for t in textes]):.0f} caractères en moyenne")
+
+    reference, debit_fixe = mesurer(LocalEmbedder(args.modele, taille_lot=args.lot, budget_tokens=None), textes)
+    print(f"{'lots':<18}{'débit':>12}{'gain':>8}{'remplissage':>13}{'écart max':>11}")
+    print(f"{'fixes de ' + str(args.lot):<18}{debit_fixe:>10.0f}/s{'':>8}{'':>13}{'':>11}")
+    for budget in args.budgets:
+        embedder = LocalEmbedder(args.modele, taille_lot=args.lot, budget_tokens=budget)
+        vecteurs, debit = mesurer(embedder, textes)
+        stats = embedder.statistiques_lots()
+        ecart = float(np.abs(vecteurs - reference).max())
+        print(
+            f"{str(budget) + ' tokens':<18}{debit:>10.0f}/s{debit / debit_fixe:>7.2f}x"
+            f"{stats['efficacite']:>7.0%} ({stats['efficacite_lots_fixes']:.0%}){ecart:>11.1e}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""
+Benchmark de bout en bout : ingestion, embedding, recherche et pipeline RAG avec un LLM factice.
+
+Un corpus synthétique au format de data/sample_reviews.json (JSON Lines) est généré puis indexé par le
+pipeline d'ingestion. Sont mesurés : le débit d'ingestion, le débit d'embedding, la latence des requêtes
+(p50/p95/p99, catalogue complet et filtrées par produit) et le rappel@k par rapport à une recherche exacte.
+Le LLM est remplacé par un LLM factice : le benchmark tourne hors ligne et la latence de bout en bout
+couvre tout le pipeline sauf la génération. Les résultats sont écrits en JSON pour comparer les runs.
+Lancer avec :  python -m benchmarks.bench_e2e [--avis 10000] [--embedder modele|hache] [--backend chroma|mmap]
+                                               [--sortie bench_e2e.json] [--comparer precedent.json]
+"""
+
+import argparse
+import json
+import re
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+from langchain_community.llms.fake import FakeListLLM
+
+import config
+from benchmarks.bench_quantization import EmbedderHache
+from src.data_loader import ReviewLoader
+from src.llm_chain import ReviewQAChain
+from src.metrics import metriques
+from src.pipeline import IngestionPipeline
+from src.retriever import ReviewRetriever
+from src.vector_backends import creer_backend
+from src.vector_store import ReviewVectorStore
+
+
+def ecrire_corpus(
+    chemin: Path, n_avis: int, n_asins: int, graine: int = 0, exemples: str = "data/sample_reviews.json"
+) -> None:
+    """Écrit n_avis avis synthétiques en JSON Lines, par lots, sans tout garder en mémoire."""
+    with open(exemples, encoding="utf-8") as f:
+        modeles = json.load(f)
+    phrases = np.array([p for m in modeles for p in re.split(r"(?<=[.!?])\s+", m[config.REVIEW_TEXT_COL]) if p])
+    resumes = np.array([m[config.REVIEW_SUMMARY_COL] for m in modeles])
+    mots = np.array(sorted({m for p in phrases for m in p.split()}))
+    rng = np.random.default_rng(graine)
+    with open(chemin, "w", encoding="utf-8") as f:
+        for debut in range(0, n_avis, 10_000):
+            taille = min(10_000, n_avis - debut)
+            # De 1 à 8 phrases par avis : les plus longs donnent plusieurs morceaux
+            longueurs = rng.integers(1, 9, size=taille)
+            asins = rng.integers(0, n_asins, size=taille)
+            notes = rng.integers(1, 6, size=taille)
+            lignes = []
+            for i in range(taille):
+                texte = " ".join(rng.choice(phrases, size=longueurs[i])) + " " + " ".join(
+                    rng.choice(mots, size=rng.integers(0, 12))
+                )
+                lignes.append(
+                    json.dumps(
+                        {
+                            config.REVIEW_PRODUCT_COL: f"B{asins[i]:09d}",
+                            config.REVIEW_TEXT_COL: texte,
+                            config.REVIEW_SUMMARY_COL: str(rng.choice(resumes)),
+                            config.REVIEW_RATING_COL: int(notes[i]),
+                            config.REVIEW_ID_COL: f"R{debut + i:012d}",
+                        },
+                        ensure_ascii=False,
+                    )
+                )
+            f.write("\n".join(lignes) + "\n")
+
+
+def generer_requetes(n: int, n_asins: int, graine: int = 1) -> tuple[list[str], list[str]]:
+    with tempfile.TemporaryDirectory() as dossier:
+        chemin = Path(dossier) / "requetes.jsonl"
+        ecrire_corpus(chemin, n, n_asins, graine)
+        lignes = [json.loads(l) for l in chemin.read_text(encoding="utf-8").splitlines()]
+    return [l[config.REVIEW_TEXT_COL] for l in lignes], [l[config.REVIEW_PRODUCT_COL] for l in lignes]
+
+
+def percentiles(latences: list[float]) -> dict:
+    p50, p95, p99 = np.percentile(np.array(latences) * 1000, [50, 95, 99])
+    return {"p50_ms": float(p50), "p95_ms": float(p95), "p99_ms": float(p99), "moyenne_ms": float(np.mean(latences) * 1000)}
+
+
+def verite_exacte(store: ReviewVectorStore, requetes: np.ndarray, asins: list[str | None], k: int) -> list[set[str]]:
+    """Top-k exact (cosinus) de chaque requête, page par page, restreint au produit si un asin est donné."""
+    requetes = requetes / (np.linalg.norm(requetes, axis=1, keepdims=True) + 1e-10)
+    meilleurs = [([], np.empty(0, dtype=np.float32)) for _ in requetes]
+    taille, offset = store.backend.taille_lot_max(), 0
+    while True:
+        page = store.backend.get(limit=taille, offset=offset, include=["embeddings", "metadatas"])
+        if not page["ids"]:
+            break
+        embeddings = np.asarray(page["embeddings"], dtype=np.float32)
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True) + 1e-10
+        asins_page = np.array([m.get("asin", "") for m in page["metadatas"]])
+        similarites = requetes @ embeddings.T
+        for q, asin in enumerate(asins):
+            ligne = similarites[q] if asin is None else np.where(asins_page == asin, similarites[q], -np.inf)
+            ids = meilleurs[q][0] + list(page["ids"])
+            scores = np.concatenate([meilleurs[q][1], ligne])
+            garder = np.argsort(-scores)[:k]
+            garder = garder[np.isfinite(scores[garder])]
+            meilleurs[q] = ([ids[i] for i in garder], scores[garder])
+        offset += taille
+        if len(page["ids"]) < taille:
+            break
+    return [set(ids) for ids, _ in meilleurs]
+
+
+def mesurer_recherche(
+    retriever: ReviewRetriever, requetes: list[str], asins: list[str | None], attendus: list[set[str]], k: int
+) -> dict:
+    latences, rappels = [], []
+    for requete, asin, attendu in zip(requetes, asins, attendus):
+        debut = time.perf_counter()
+        resultats = retriever.rechercher(requete, asin=asin)
+        latences.append(time.perf_counter() - debut)
+        trouves = {ReviewVectorStore.identifiant(r["text"], r["metadata"]) for r in resultats}
+        rappels.append(len(trouves & attendu) / max(1, min(k, len(attendu))))
+    return {**percentiles(latences), f"rappel@{k}": float(np.mean(rappels)), "requetes": len(requetes)}
+
+
+def aplatir(resultats: dict, prefixe: str = "") -> dict[str, float]:
+    plats = {}
+    for cle, valeur in resultats.items():
+        if isinstance(valeur, dict):
+            plats.update(aplatir(valeur, f"{prefixe}{cle}."))
+        elif isinstance(valeur, (int, float)) and not isinstance(valeur, bool):
+            plats[f"{prefixe}{cle}"] = valeur
+    return plats
+
+
+def comparer(precedent: dict, actuel: dict) -> None:
+    anciens, nouveaux = aplatir(precedent["mesures"]), aplatir(actuel["mesures"])
+    print(f"\nComparaison avec le run du {precedent['date']} :")
+    for cle, valeur in nouveaux.items():
+        if cle in anciens:
+            ecart = (valeur - anciens[cle]) / anciens[cle] * 100 if anciens[cle] else 0.0
+            print(f"  {cle:<40} {anciens[cle]:>12.3f} -> {valeur:>12.3f}  ({ecart:+.1f} %)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--avis", type=int, default=10_000, help="Avis générés (un ou plusieurs morceaux chacun)")
+    parser.add_argument("--asins", type=int, default=100)
+    parser.add_argument("--requetes", type=int, default=200)
+    parser.add_argument("--k", type=int, default=config.MAX_RESULTS)
+    parser.add_argument("--embedder", choices=["modele", "hache"], default="modele")
+    parser.add_argument("--backend", choices=["chroma", "mmap"], default=config.VECTOR_BACKEND)
+    parser.add_argument("--hybride", action="store_true", help="Recherche hybride (vectorielle + BM25)")
+    parser.add_argument("--dossier", help="Dossier de travail (temporaire par défaut)")
+    parser.add_argument("--sortie", default="bench_e2e.json")
+    parser.add_argument("--comparer", help="Résultats JSON d'un run précédent")
+    parser.add_argument("--etapes", action="store_true", help="Active les métriques et ajoute la durée moyenne par étape")
+    args = parser.parse_args()
+    metriques.actif = metriques.actif or args.etapes
+
+    if args.embedder == "modele":
+        from src.embeddings import LocalEmbedder
+
+        embedder = LocalEmbedder()
+    else:
+        embedder = EmbedderHache()
+
+    with tempfile.TemporaryDirectory() as temporaire:
+        dossier = Path(args.dossier or temporaire)
+        dossier.mkdir(parents=True, exist_ok=True)
+        mesures = {}
+
+        debut = time.perf_counter()
+        ecrire_corpus(dossier / "avis.jsonl", args.avis, args.asins)
+        print(f"{args.avis:,} avis générés en {time.perf_counter() - debut:.1f} s")
+
+        chemin_store = str(dossier / "store")
+        backend = creer_backend(args.backend, chemin_store, ReviewVectorStore.NOM_COLLECTION)
+        store = ReviewVectorStore(persist_path=chemin_store, embedder=embedder, backend=backend)
+        stats = IngestionPipeline(store, loader=ReviewLoader(data_path=str(dossier))).executer("avis.jsonl")
+        mesures["ingestion"] = {
+            "avis": stats.avis_lus,
+            "morceaux": stats.morceaux,
+            "duree_s": stats.duree,
+            "avis_par_seconde": stats.avis_par_seconde,
+            "morceaux_par_seconde": stats.morceaux_par_seconde,
+        }
+        print(f"Ingestion : {stats.morceaux:,} morceaux, {stats.avis_par_seconde:,.0f} avis/s, {stats.morceaux_par_seconde:,.0f} morceaux/s")
+
+        requetes, asins = generer_requetes(args.requetes, args.asins)
+        debut = time.perf_counter()
+        vecteurs = embedder.encoder_requetes(requetes)
+        duree = time.perf_counter() - debut
+        textes = requetes * max(1, 2_000 // len(requetes))
+        debut = time.perf_counter()
+        embedder.encoder(textes)
+        mesures["embedding"] = {
+            "textes_par_seconde": len(textes) / (time.perf_counter() - debut),
+            "requetes_par_seconde": len(requetes) / duree,
+        }
+        print(f"Embedding : {mesures['embedding']['textes_par_seconde']:,.0f} textes/s")
+
+        retriever = ReviewRetriever(store=store, max_results=args.k, hybride=args.hybride)
+        for libelle, filtres in (("recherche", [None] * len(requetes)), ("recherche_produit", asins)):
+            attendus = verite_exacte(store, vecteurs, filtres, args.k)
+            mesures[libelle] = mesurer_recherche(retriever, requetes, filtres, attendus, args.k)
+            m = mesures[libelle]
+            print(
+                f"{libelle:<18} p50 {m['p50_ms']:7.2f} ms  p95 {m['p95_ms']:7.2f} ms  p99 {m['p99_ms']:7.2f} ms  "
+                f"rappel@{args.k} {m[f'rappel@{args.k}']:.3f}"
+            )
+
+        chaine = ReviewQAChain(retriever=retriever, llm=FakeListLLM(responses=["Réponse factice."]))
+        latences = []
+        for requete in requetes:
+            debut = time.perf_counter()
+            chaine.executer(requete)
+            latences.append(time.perf_counter() - debut)
+        mesures["bout_en_bout"] = percentiles(latences)
+        print(f"Bout en bout (LLM factice) : p50 {mesures['bout_en_bout']['p50_ms']:.2f} ms")
+        if metriques.actif:
+            mesures["etapes"] = metriques.statistiques()
+
+    resultats = {
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "parametres": {
+            **vars(args),
+            "embedding_model": getattr(embedder, "model_name", None),
+            "mmap_quantization": config.MMAP_QUANTIZATION,
+            "chunk_size": config.CHUNK_SIZE,
+        },
+        "mesures": mesures,
+    }
+    with open(args.sortie, "w", encoding="utf-8") as f:
+        json.dump(resultats, f, indent=2, ensure_ascii=False)
+    print(f"Résultats sauvegardés dans {args.sortie}")
+
+    if args.comparer:
+        with open(args.comparer, encoding="utf-8") as f:
+            comparer(json.load(f), resultats)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Benchmark de l'index lexical BM25 : construction et latence par requête.
+
+Lancer avec :  python -m benchmarks.bench_lexical [--n 200000] [--requetes 1000]
+"""
+
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.bench_preprocessor import MOTS
+from src.lexical_index import LexicalIndex
+
+
+def generer_corpus(n: int, graine: int = 0) -> list[str]:
+    rng = np.random.default_rng(graine)
+    # Vocabulaire de Zipf : quelques mots très fréquents et une longue traîne de références
+    vocabulaire = np.array(MOTS + [f"ref{i}" for i in range(50_000)])
+    probabilites = 1.0 / np.arange(1, len(vocabulaire) + 1)
+    probabilites /= probabilites.sum()
+    longueurs = rng.integers(5, 80, size=n)
+    return [" ".join(rng.choice(vocabulaire, size=l, p=probabilites)) for l in longueurs]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=200_000)
+    parser.add_argument("--requetes", type=int, default=1_000)
+    args = parser.parse_args()
+
+    textes = generer_corpus(args.n)
+    ids = [str(i) for i in range(args.n)]
+    metadonnees = [{"asin": str(i % 1000), "note": float(i % 5 + 1)} for i in range(args.n)]
+
+    with tempfile.TemporaryDirectory() as dossier:
+        index = LexicalIndex(dossier)
+        debut = time.perf_counter()
+        for i in range(0, args.n, 2_000):
+            index.ajouter(ids[i: i + 2_000], textes[i: i + 2_000], metadonnees[i: i + 2_000])
+        index.sauvegarder()
+        duree = time.perf_counter() - debut
+        print(f"{args.n:,} documents indexés en {duree:.1f} s ({args.n / duree:,.0f} docs/s)")
+        print(f"  {index.statistiques()}")
+
+        rng = np.random.default_rng(1)
+        requetes = [" ".join(rng.choice(textes[j].split(), size=3)) for j in rng.integers(0, args.n, args.requetes)]
+        for libelle, filtres in (("sans filtre", {}), ("asin + note", {"asin": "42", "note_min": 4})):
+            latences = []
+            for requete in requetes:
+                debut = time.perf_counter()
+                index.rechercher(requete, 20, **filtres)
+                latences.append(time.perf_counter() - debut)
+            p50, p95, p99 = np.percentile(np.array(latences) * 1000, [50, 95, 99])
+            print(f"  {libelle:<12} p50 {p50:.3f} ms  p95 {p95:.3f} ms  p99 {p99:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Benchmark des backends d'inférence de LocalEmbedder sur CPU : PyTorch, ONNX Runtime et ONNX quantifié int8.
+
+Chaque backend tourne dans un processus neuf pour isoler sa mémoire. Sont mesurés : le temps de chargement,
+la mémoire résidente maximale (après chargement, puis après encodage), le débit par taille de lot, la latence
+d'une requête seule et l'écart aux vecteurs PyTorch (similarité cosinus minimale et moyenne).
+Le premier run avec --quantification exporte le modèle quantifié dans EMBEDDING_ONNX_PATH.
+Lancer avec :  python -m benchmarks.bench_onnx [--n 2000] [--lots 1 8 32 128] [--threads 4]
+                                                [--quantification avx2] [--sortie bench_onnx.json]
+"""
+
+import argparse
+import json
+import multiprocessing
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+
+import config
+from benchmarks.bench_quantization import generer_avis
+from src.embeddings import PHRASES_CONTROLE, LocalEmbedder
+
+
+def rss_max_mo() -> float:
+    # ru_maxrss est en Ko sous Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def mesurer_backend(
+    backend: str, quantification: str | None, threads: int | None, tailles_lot: list[int], textes: list[str]
+) -> dict:
+    embedder = LocalEmbedder(backend=backend, quantification=quantification, threads=threads, normaliser=True)
+    debut = time.perf_counter()
+    embedder.model
+    chargement = time.perf_counter() - debut
+    rss_chargement = rss_max_mo()
+
+    debits = {}
+    for taille in tailles_lot:
+        embedder.taille_lot = taille
+        embedder.encoder_requetes(textes[:taille])
+        debut = time.perf_counter()
+        embedder.encoder_requetes(textes)
+        debits[str(taille)] = len(textes) / (time.perf_counter() - debut)
+
+    latences = []
+    for texte in textes[:100]:
+        debut = time.perf_counter()
+        embedder.encoder_requete(texte)
+        latences.append(time.perf_counter() - debut)
+
+    return {
+        "chargement_s": chargement,
+        "rss_chargement_mo": rss_chargement,
+        "rss_max_mo": rss_max_mo(),
+        "textes_par_seconde": debits,
+        "requete_p50_ms": float(np.percentile(latences, 50) * 1000),
+        "vecteurs": embedder.encoder_requetes(PHRASES_CONTROLE + textes[:200]).tolist(),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=2_000, help="Textes encodés par taille de lot")
+    parser.add_argument("--lots", type=int, nargs="+", default=[1, 8, 32, 128])
+    parser.add_argument("--threads", type=int, default=config.EMBEDDING_THREADS)
+    parser.add_argument("--quantification", default="avx2", choices=["avx2", "avx512", "avx512_vnni", "arm64"])
+    parser.add_argument("--sortie", default="bench_onnx.json")
+    args = parser.parse_args()
+
+    textes, _ = generer_avis(args.n)
+    variantes = {
+        "torch": ("torch", None),
+        "onnx": ("onnx", None),
+        f"onnx_qint8_{args.quantification}": ("onnx", args.quantification),
+    }
+    mesures = {}
+    for nom, (backend, quantification) in variantes.items():
+        # Un processus neuf par backend : la mémoire de l'un ne fausse pas celle de l'autre
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executeur:
+            mesures[nom] = executeur.submit(
+                mesurer_backend, backend, quantification, args.threads, args.lots, textes
+            ).result()
+
+    reference = np.asarray(mesures["torch"].pop("vecteurs"), dtype=np.float32)
+    lots = "".join(f"{'lot ' + str(t):>11}" for t in args.lots)
+    print(f"{'backend':<22}{'chargement':>11}{'RSS':>9}{'RSS max':>9}{'p50':>9}{lots}{'cos min':>9}{'cos moy':>9}")
+    for nom, m in mesures.items():
+        if "vecteurs" in m:
+            similarites = np.sum(np.asarray(m.pop("vecteurs"), dtype=np.float32) * reference, axis=1)
+            m["similarite_min"], m["similarite_moyenne"] = float(similarites.min()), float(similarites.mean())
+        else:
+            m["similarite_min"] = m["similarite_moyenne"] = 1.0
+        debits = "".join(f"{m['textes_par_seconde'][str(t)]:>9.0f}/s" for t in args.lots)
+        print(
+            f"{nom:<22}{m['chargement_s']:>10.1f}s{m['rss_chargement_mo']:>7.0f}Mo{m['rss_max_mo']:>7.0f}Mo"
+            f"{m['requete_p50_ms']:>7.1f}ms{debits}{m['similarite_min']:>9.4f}{m['similarite_moyenne']:>9.4f}"
+        )
+
+    resultats = {
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "parametres": {**vars(args), "embedding_model": config.EMBEDDING_MODEL},
+        "mesures": mesures,
+    }
+    with open(args.sortie, "w", encoding="utf-8") as f:
+        json.dump(resultats, f, indent=2, ensure_ascii=False)
+    print(f"Résultats sauvegardés dans {args.sortie}")
+
+
+if __name__ == "__main__":
+    main()
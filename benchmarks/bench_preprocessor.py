@@ -0,0 +1,110 @@
+"""
+Benchmark du nettoyage et de la construction des documents de ReviewPreprocessor.
+
+Compare le chemin vectorisé à l'implémentation ligne par ligne d'origine (apply + iterrows).
+Lancer avec :  python -m benchmarks.bench_preprocessor [--n 1000000]
+"""
+
+import argparse
+import re
+import time
+
+import numpy as np
+import pandas as pd
+
+import config
+from src.preprocessor import ReviewPreprocessor
+
+
+MOTS = "produit facile nettoyer bruyant solide durable café machine qualité prix livraison".split()
+
+
+def generer_avis(n: int, graine: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(graine)
+    longueurs = rng.integers(5, 120, size=n)
+    vocabulaire = np.array(MOTS)
+    textes = [
+        "<p>" + " ".join(vocabulaire[rng.integers(0, len(MOTS), size=l)]) + "</p> http://exemple.fr"
+        for l in longueurs
+    ]
+    return pd.DataFrame(
+        {
+            config.REVIEW_PRODUCT_COL: rng.integers(0, 1000, size=n).astype(str),
+            config.REVIEW_TEXT_COL: textes,
+            config.REVIEW_SUMMARY_COL: rng.choice(["Très bien", "Déçu", "", None], size=n),
+            config.REVIEW_RATING_COL: rng.integers(1, 6, size=n),
+        }
+    )
+
+
+def nettoyer_reference(df: pd.DataFrame) -> pd.DataFrame:
+    def nettoyer_texte(texte):
+        texte = str(texte)
+        texte = re.sub(r"<[^>]+>", " ", texte)
+        texte = re.sub(r"http\S+", "", texte)
+        texte = re.sub(r"\s+", " ", texte)
+        return texte.strip()
+
+    df = df.dropna(subset=[config.REVIEW_TEXT_COL]).copy()
+    df[config.REVIEW_TEXT_COL] = df[config.REVIEW_TEXT_COL].apply(nettoyer_texte)
+    return df[df[config.REVIEW_TEXT_COL].str.len() > 20].reset_index(drop=True)
+
+
+def textes_reference(preprocessor: ReviewPreprocessor, df: pd.DataFrame) -> list[tuple[str, dict]]:
+    sortie = []
+    for _, row in df.iterrows():
+        texte = preprocessor._construire_texte(row)
+        metadonnees = {
+            "asin": str(row.get(config.REVIEW_PRODUCT_COL, "")),
+            "note": float(row.get(config.REVIEW_RATING_COL, 0)),
+            "resume": str(row.get(config.REVIEW_SUMMARY_COL, "")),
+            "avis_id": preprocessor._identifiant_avis(row.get(config.REVIEW_ID_COL), texte),
+        }
+        sortie.append((texte, metadonnees))
+    return sortie
+
+
+def textes_vectorises(preprocessor: ReviewPreprocessor, df: pd.DataFrame) -> list[tuple[str, dict]]:
+    textes = preprocessor._construire_textes(df)
+    asins = [str(a) for a in preprocessor._colonne(df, config.REVIEW_PRODUCT_COL, "")]
+    notes = [float(n) for n in preprocessor._colonne(df, config.REVIEW_RATING_COL, 0)]
+    resumes = [str(r) for r in preprocessor._colonne(df, config.REVIEW_SUMMARY_COL, "")]
+    identifiants = preprocessor._colonne(df, config.REVIEW_ID_COL, None)
+    return [
+        (t, {"asin": a, "note": n, "resume": r, "avis_id": preprocessor._identifiant_avis(i, t)})
+        for t, a, n, r, i in zip(textes, asins, notes, resumes, identifiants)
+    ]
+
+
+def chronometrer(libelle: str, n: int, fonction, *args):
+    debut = time.perf_counter()
+    resultat = fonction(*args)
+    duree = time.perf_counter() - debut
+    print(f"  {libelle:<28} {duree:8.2f} s  {n / duree:12,.0f} avis/s")
+    return resultat, duree
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    df = generer_avis(args.n)
+    preprocessor = ReviewPreprocessor(min_rating=None)
+    print(f"{args.n:,} avis synthétiques")
+
+    print("Nettoyage")
+    ref, t_ref = chronometrer("référence (apply + re.sub)", args.n, nettoyer_reference, df)
+    vec, t_vec = chronometrer("vectorisé (str.replace)", args.n, preprocessor.nettoyer, df)
+    assert ref.equals(vec)
+    print(f"  gain x{t_ref / t_vec:.1f}")
+
+    print("Textes et métadonnées")
+    ref, t_ref = chronometrer("référence (iterrows)", len(vec), textes_reference, preprocessor, vec)
+    res, t_vec = chronometrer("vectorisé (colonnes)", len(vec), textes_vectorises, preprocessor, vec)
+    assert ref == res
+    print(f"  gain x{t_ref / t_vec:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Benchmark mémoire / rappel de la quantification du backend mmap (float32, int8, binaire).
+
+Le corpus est obtenu en recombinant les phrases de data/sample_reviews.json à grande échelle.
+Les embeddings viennent du modèle configuré ; --embedder hache utilise un sac de mots haché
+(projection aléatoire déterministe) quand le modèle n'est pas disponible hors ligne.
+Lancer avec :  python -m benchmarks.bench_quantization [--n 100000] [--embedder modele|hache]
+"""
+
+import argparse
+import hashlib
+import json
+import re
+import tempfile
+import time
+
+import numpy as np
+
+import config
+from src.mmap_backend import BackendMmap
+
+
+def generer_avis(n: int, chemin: str = "data/sample_reviews.json", graine: int = 0) -> tuple[list[str], list[str]]:
+    with open(chemin, encoding="utf-8") as f:
+        exemples = json.load(f)
+    phrases = [p for e in exemples for p in re.split(r"(?<=[.!?])\s+", e[config.REVIEW_TEXT_COL]) if p]
+    asins = sorted({e[config.REVIEW_PRODUCT_COL] for e in exemples})
+    mots = sorted({m for p in phrases for m in p.split()})
+    rng = np.random.default_rng(graine)
+    # Phrases recombinées, plus quelques mots tirés au hasard pour varier les avis
+    textes = [
+        " ".join(rng.choice(phrases, size=rng.integers(1, 4), replace=False))
+        + " " + " ".join(rng.choice(mots, size=rng.integers(0, 12)))
+        for _ in range(n)
+    ]
+    return textes, [asins[i] for i in rng.integers(0, len(asins), size=n)]
+
+
+class EmbedderHache:
+    """Sac de mots projeté : chaque mot a un vecteur aléatoire fixe dérivé de son hash."""
+
+    model_name = "hache"
+
+    def __init__(self, dimension: int = 384):
+        self.dimension = dimension
+        self._mots: dict[str, np.ndarray] = {}
+
+    def encoder(self, textes: list[str]) -> np.ndarray:
+        sortie = np.zeros((len(textes), self.dimension), dtype=np.float32)
+        for i, texte in enumerate(textes):
+            for mot in re.findall(r"\w+", texte.lower()):
+                sortie[i] += self._vecteur(mot)
+        return sortie / (np.linalg.norm(sortie, axis=1, keepdims=True) + 1e-10)
+
+    def encoder_requete(self, texte: str) -> np.ndarray:
+        return self.encoder([texte])[0]
+
+    def encoder_requetes(self, textes: list[str]) -> np.ndarray:
+        return self.encoder(textes)
+
+    def _vecteur(self, mot: str) -> np.ndarray:
+        if mot not in self._mots:
+            graine = int.from_bytes(hashlib.blake2b(mot.encode("utf-8"), digest_size=8).digest(), "little")
+            self._mots[mot] = np.random.default_rng(graine).normal(size=self.dimension).astype(np.float32)
+        return self._mots[mot]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=100_000)
+    parser.add_argument("--requetes", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--embedder", choices=["modele", "hache"], default="modele")
+    args = parser.parse_args()
+
+    textes, asins = generer_avis(args.n + args.requetes)
+    if args.embedder == "modele":
+        from src.embeddings import LocalEmbedder
+
+        embedder = LocalEmbedder()
+    else:
+        embedder = EmbedderHache()
+    debut = time.perf_counter()
+    vecteurs = embedder.encoder(textes)
+    print(f"{len(textes):,} textes encodés en {time.perf_counter() - debut:.1f} s ({vecteurs.shape[1]} dimensions)")
+    requetes, vecteurs = vecteurs[args.n:], vecteurs[: args.n]
+    ids = [f"{i:032x}" for i in range(args.n)]
+    metadonnees = [{"asin": a, "note": 5.0} for a in asins[: args.n]]
+
+    normes = vecteurs / (np.linalg.norm(vecteurs, axis=1, keepdims=True) + 1e-10)
+    requetes = requetes / (np.linalg.norm(requetes, axis=1, keepdims=True) + 1e-10)
+    # Le corpus recombiné contient des doublons : un résultat compte s'il atteint la k-ième similarité exacte
+    seuils = [np.partition(-(normes @ q), args.k - 1)[args.k - 1] for q in requetes]
+
+    print(f"{'représentation':<16}{'reclassement':>13}{'mémoire':>12}{'gain':>7}{'rappel@' + str(args.k):>11}{'p50':>10}")
+    for quantification in (None, "int8", "binaire"):
+        with tempfile.TemporaryDirectory() as dossier:
+            backend = BackendMmap(dossier, quantification=quantification)
+            for i in range(0, args.n, backend.taille_lot_max()):
+                fin = i + backend.taille_lot_max()
+                backend.upsert(ids[i:fin], vecteurs[i:fin], textes[i:fin], metadonnees[i:fin])
+            octets = backend.octets_index()
+            for facteur in ([1] if quantification is None else [1, 4, 10]):
+                backend.facteur_reclassement = facteur
+                latences, rappels = [], []
+                for q, seuil in zip(requetes, seuils):
+                    t = time.perf_counter()
+                    trouves = backend.query(q[np.newaxis, :], n_results=args.k, include=["distances"])["ids"][0]
+                    latences.append(time.perf_counter() - t)
+                    similarites = normes[[int(i, 16) for i in trouves]] @ q
+                    rappels.append(np.sum(-similarites <= seuil + 1e-6) / args.k)
+                print(
+                    f"{quantification or 'float32':<16}{'-' if quantification is None else 'x' + str(facteur):>13}"
+                    f"{octets / 2**20:>9.1f} Mo{vecteurs.nbytes / octets:>6.1f}x{np.mean(rappels):>11.3f}"
+                    f"{np.median(latences) * 1000:>7.2f} ms"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Benchmark du découpage en shards : latence p50/p99 d'une requête sur un produit selon la taille du catalogue.
+
+Chaque produit a le même nombre de morceaux ; seul le nombre de produits varie. Avec une collection
+unique, la latence d'une requête filtrée par asin croît avec le catalogue ; avec un shard par asin,
+elle doit rester stable. Le LRU borne le nombre de shards ouverts. Les shards reposent sur le backend mmap.
+Lancer avec :  python -m benchmarks.bench_shards [--catalogues 10 100 1000] [--par-produit 200]
+"""
+
+import argparse
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.bench_backends import generer_vecteurs
+from src.vector_backends import creer_backend
+
+
+def remplir(backend, ids, vecteurs, documents, metadonnees) -> None:
+    taille = backend.taille_lot_max()
+    for i in range(0, len(ids), taille):
+        backend.upsert(ids[i: i + taille], vecteurs[i: i + taille], documents[i: i + taille], metadonnees[i: i + taille])
+
+
+def mesurer(backend, requetes: np.ndarray, asins: list[str], k: int) -> tuple[float, float]:
+    latences = []
+    for requete, asin in zip(requetes, asins):
+        debut = time.perf_counter()
+        backend.query(requete[np.newaxis, :], n_results=k, where={"asin": {"$eq": asin}}, include=["distances"])
+        latences.append(time.perf_counter() - debut)
+    p50, p99 = np.percentile(np.array(latences) * 1000, [50, 99])
+    return p50, p99
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--catalogues", type=int, nargs="+", default=[10, 100, 1_000])
+    parser.add_argument("--par-produit", type=int, default=200)
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--requetes", type=int, default=300)
+    parser.add_argument("--ouverts", type=int, default=32)
+    parser.add_argument("--k", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    for n_asins in args.catalogues:
+        n = n_asins * args.par_produit
+        ids, vecteurs, metadonnees = generer_vecteurs(n, args.dimension, n_asins)
+        documents = [f"avis {i}" for i in range(n)]
+        requetes = vecteurs[rng.integers(0, n, size=args.requetes)]
+        # Trafic concentré : 80 % des requêtes portent sur 10 % des produits
+        chauds = max(1, n_asins // 10)
+        tirages = np.where(
+            rng.random(args.requetes) < 0.8,
+            rng.integers(0, chauds, args.requetes),
+            rng.integers(0, n_asins, args.requetes),
+        )
+        asins = [f"B{a:05d}" for a in tirages]
+
+        ligne = f"{n_asins:>6} produits ({n:>8,} morceaux)"
+        for libelle, cle in (("collection unique", None), ("shards par asin", "asin")):
+            with tempfile.TemporaryDirectory() as dossier:
+                backend = creer_backend("mmap", dossier, "bench", cle)
+                if cle is not None:
+                    backend.max_ouverts = args.ouverts
+                remplir(backend, ids, vecteurs, documents, metadonnees)
+                p50, p99 = mesurer(backend, requetes, asins, args.k)
+                ligne += f"  {libelle} p50 {p50:6.2f} ms  p99 {p99:6.2f} ms"
+        print(ligne)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Benchmark du démarrage à froid : temps d'import des modules et des premières opérations, chacun dans un
+interpréteur neuf, ainsi que les bibliothèques lourdes (torch, chromadb, langchain...) qu'ils chargent.
+
+Sert à détecter les régressions d'imports : un module qui charge de nouveau sentence-transformers à
+l'import se voit immédiatement. --modele mesure aussi le premier encodage (chargement du modèle compris).
+Lancer avec :  python -m benchmarks.bench_startup [--repetitions 5] [--modele] [--sortie bench_startup.json]
+                                                   [--comparer precedent.json]
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timezone
+
+import numpy as np
+
+from benchmarks.bench_e2e import comparer
+
+MODULES_LOURDS = ["torch", "sentence_transformers", "transformers", "chromadb", "langchain", "langchain_community"]
+
+SCENARIOS = {
+    "import_config": "import config",
+    "import_vector_store": "from src.vector_store import ReviewVectorStore",
+    "import_pipeline": "from src.pipeline import IngestionPipeline",
+    "import_llm_chain": "from src.llm_chain import ReviewQAChain",
+    "compter_chroma": (
+        "from src.vector_store import ReviewVectorStore\n"
+        "from src.vector_backends import creer_backend\n"
+        "ReviewVectorStore(persist_path=DOSSIER, backend=creer_backend('chroma', DOSSIER, 'avis')).compter()"
+    ),
+    "compter_mmap": (
+        "from src.vector_store import ReviewVectorStore\n"
+        "from src.vector_backends import creer_backend\n"
+        "ReviewVectorStore(persist_path=DOSSIER, backend=creer_backend('mmap', DOSSIER, 'avis')).compter()"
+    ),
+    "construire_chaine": (
+        "from src.llm_chain import ReviewQAChain\n"
+        "from src.retriever import ReviewRetriever\n"
+        "from src.vector_store import ReviewVectorStore\n"
+        "ReviewQAChain(retriever=ReviewRetriever(ReviewVectorStore(persist_path=DOSSIER)))"
+    ),
+}
+
+SCENARIO_MODELE = (
+    "premier_encodage",
+    "from src.embeddings import LocalEmbedder\nLocalEmbedder().encoder_requete('Est-il bruyant ?')",
+)
+
+# Le code mesuré s'exécute dans un interpréteur neuf ; seul le temps du code lui-même est compté
+GABARIT = """
+import sys, time
+DOSSIER = {dossier!r}
+debut = time.perf_counter()
+{code}
+duree = time.perf_counter() - debut
+print(duree, ",".join(m for m in {lourds!r} if m in sys.modules))
+"""
+
+
+def mesurer(code: str, repetitions: int) -> dict:
+    durees, charges = [], ""
+    for _ in range(repetitions):
+        with tempfile.TemporaryDirectory() as dossier:
+            sortie = subprocess.run(
+                [sys.executable, "-c", GABARIT.format(dossier=dossier, code=code, lourds=MODULES_LOURDS)],
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout.strip().splitlines()[-1]
+        duree, _, charges = sortie.partition(" ")
+        durees.append(float(duree))
+    return {"median_ms": float(np.median(durees) * 1000), "max_ms": max(durees) * 1000, "modules_lourds": charges}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repetitions", type=int, default=5)
+    parser.add_argument("--modele", action="store_true", help="Mesure aussi le premier encodage")
+    parser.add_argument("--sortie", default="bench_startup.json")
+    parser.add_argument("--comparer", help="Résultats JSON d'un run précédent")
+    args = parser.parse_args()
+
+    scenarios = dict(SCENARIOS)
+    if args.modele:
+        scenarios[SCENARIO_MODELE[0]] = SCENARIO_MODELE[1]
+
+    mesures = {}
+    for nom, code in scenarios.items():
+        mesures[nom] = mesurer(code, args.repetitions)
+        m = mesures[nom]
+        print(f"{nom:<22} {m['median_ms']:>8.0f} ms (max {m['max_ms']:>6.0f} ms)  {m['modules_lourds'] or '-'}")
+
+    resultats = {
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "parametres": vars(args),
+        "mesures": mesures,
+    }
+    with open(args.sortie, "w", encoding="utf-8") as f:
+        json.dump(resultats, f, indent=2, ensure_ascii=False)
+    print(f"Résultats sauvegardés dans {args.sortie}")
+
+    if args.comparer:
+        with open(args.comparer, encoding="utf-8") as f:
+            comparer(json.load(f), resultats)
+
+
+if __name__ == "__main__":
+    main()
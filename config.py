@@ -1,19 +1,83 @@
 OLLAMA_BASE_URL = "http://localhost:11434"
 OLLAMA_MODEL = "llama3.2"
+OLLAMA_MAX_CONCURRENCY = 4  # générations simultanées envoyées à Ollama
+OLLAMA_TIMEOUT_SECONDS = 120
+OLLAMA_KEEP_ALIVE = "30m"  # durée pendant laquelle Ollama garde le modèle chargé après une requête
+WARMUP_OLLAMA_PING = True  # au préchauffage, demande à Ollama de charger le modèle
 
 EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+EMBEDDING_DIMENSION = 384  # taille des vecteurs de EMBEDDING_MODEL, connue sans charger le modèle
+EMBEDDING_NORMALIZE = True  # vecteurs unitaires : la similarité cosinus devient un produit scalaire
+EMBEDDING_CACHE_PATH = "data/embedding_cache"
+EMBEDDING_CACHE_MAX_ENTRIES = 500_000
+EMBEDDING_SCHEDULER_WINDOW_MS = 5  # attente maximale pour regrouper les requêtes concurrentes
+EMBEDDING_SCHEDULER_MAX_BATCH = 32
+EMBEDDING_BACKEND = "torch"  # "torch" (PyTorch) ou "onnx" (ONNX Runtime, CPU)
+EMBEDDING_ONNX_QUANTIZATION = None  # "avx2", "avx512", "avx512_vnni" ou "arm64" : poids int8 (backend onnx)
+EMBEDDING_ONNX_PATH = "data/onnx"  # modèles ONNX quantifiés exportés
+EMBEDDING_ONNX_TOLERANCE = 0.99  # similarité cosinus minimale avec les vecteurs PyTorch après quantification
+EMBEDDING_THREADS = None  # threads intra-op de l'inférence ; None = valeur par défaut du runtime
 
 CHUNK_SIZE = 512
 CHUNK_OVERLAP = 50
 
 VECTOR_STORE_PATH = "data/vector_store"
+VECTOR_BACKEND = "chroma"  # "chroma" (HNSW) ou "mmap" (matrices float32 partitionnées par asin)
+MMAP_IVF_PROBES = 8  # listes IVF parcourues par requête sans filtre produit
+MMAP_QUANTIZATION = None  # None, "int8" (mémoire / 4) ou "binaire" (mémoire / 32)
+MMAP_RERANK_FACTOR = 4  # candidats reclassés en float32 : k * facteur
+VECTOR_SHARD_KEY = None  # "asin" (ou une autre métadonnée) : une collection par valeur, requêtes routées par filtre (backend mmap uniquement)
+VECTOR_SHARDS_MAX_OPEN = 32  # shards gardés ouverts (LRU) ; les moins récemment utilisés sont fermés
 RAW_DATA_PATH = "data/raw"
 PROCESSED_DATA_PATH = "data/processed"
+PROCESSED_STAGE_ENABLED = False  # à l'indexation, écrit aussi avis nettoyés et morceaux encodés en Parquet
+PROCESSED_BUFFER_ROWS = 50_000  # lignes accumulées avant écriture : moins de petits fichiers par produit
 
 MAX_RESULTS = 5
 MIN_RATING_FILTER = None  # set to 1-5 to filter by minimum rating
+RESPONSE_CACHE_MAX_ENTRIES = 1_000
+RESPONSE_CACHE_TTL_SECONDS = 3_600
+RESPONSE_CACHE_SIMILARITY_THRESHOLD = None  # ex. 0.95 pour réutiliser la réponse d'une question proche
+HYBRID_SEARCH = False  # fusionne recherche vectorielle et BM25 (reciprocal rank fusion)
+HYBRID_CANDIDATES = 20  # candidats retenus avant fusion hybride ou reclassement
+HYBRID_RRF_K = 60
+BM25_K1 = 1.2
+BM25_B = 0.75
+BM25_MAX_POSTINGS_PER_TERM = 2_000  # postings lus au plus par terme, par impact décroissant
+RERANK = False  # reclasse les HYBRID_CANDIDATES candidats avec un cross-encoder local
+RERANKER_MODEL = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+RERANKER_BUDGET_MS = 150  # au-delà, les candidats restants gardent leur rang initial
+RERANKER_BATCH_SIZE = 16
+RERANKER_CACHE_MAX_ENTRIES = 10_000
+CONTEXT_PACKING = True  # dédoublonne, regroupe par avis et borne le contexte envoyé au LLM
+CONTEXT_TOKEN_BUDGET = 1_500
+CONTEXT_DEDUP_THRESHOLD = 0.8  # similarité de Jaccard (3-grammes de mots) au-delà de laquelle un morceau est un doublon
+CONTEXT_TOKENIZER = None  # tokenizer Hugging Face du modèle Ollama (ex. "meta-llama/Llama-3.2-1B") ; None : estimation
+MATERIALIZED_PATH = "data/materialized"  # résumés et FAQ pré-calculés par produit (python materialize.py)
+MATERIALIZATION_MAP_CHUNKS = 10  # morceaux par appel au LLM ; au-delà, le résumé est hiérarchique
+MATERIALIZATION_REDUCE_FANIN = 8  # résumés partiels fusionnés par appel
+MATERIALIZED_FAQ_QUESTIONS = [
+    "Ce produit est-il facile à utiliser ?",
+    "Ce produit est-il solide et durable ?",
+    "Ce produit est-il bruyant ?",
+    "Est-il facile à nettoyer et à entretenir ?",
+    "Le rapport qualité-prix est-il bon ?",
+    "Quels sont les défauts les plus signalés ?",
+]
+METRICS_ENABLED = False  # durées par étape (requêtes et ingestion), histogrammes et détail par réponse
+METRICS_FILE_PATH = None  # fichier au format texte Prometheus (collecteur textfile), ex. "data/metrics/rag.prom"
+METRICS_PORT = None  # si défini, l'application expose http://127.0.0.1:<port>/metrics
+METRICS_BUCKETS_MS = [1, 5, 10, 25, 50, 100, 250, 500, 1_000, 2_500, 5_000, 10_000, 30_000, 60_000]
+FILTER_EXACT_SEARCH_THRESHOLD = 2_000  # sous ce nombre de morceaux filtrés, recherche exacte plutôt que HNSW
 
 REVIEW_TEXT_COL = "reviewText"
 REVIEW_SUMMARY_COL = "summary"
 REVIEW_RATING_COL = "rating"
 REVIEW_PRODUCT_COL = "asin"
+REVIEW_ID_COL = "reviewerID"  # optionnelle : à défaut, l'avis est identifié par le hash de son contenu
+
+INGESTION_BATCH_ROWS = 10_000  # avis lus et nettoyés par lot
+INGESTION_BATCH_CHUNKS = 2_000  # morceaux encodés et écrits par lot
+INDEXING_WORKERS = 1  # > 1 : découpage et encodage répartis sur plusieurs processus
+EMBEDDING_BATCH_SIZE = 32
+EMBEDDING_BATCH_TOKENS = 2_048  # ingestion : tokens par lot (remplissage compris) ; None = lots fixes
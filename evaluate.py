@@ -2,17 +2,27 @@
 Script d'évaluation du pipeline RAG.
 
 Mesure la pertinence de la récupération et la qualité des réponses sur un petit jeu de données annoté.
+La récupération est évaluée avec et sans reclassement par cross-encoder (qualité et latence ajoutée).
 Lancer avec :  python evaluate.py
 """
 
 import json
-from dataclasses import dataclass, field
+import time
+from dataclasses import asdict, dataclass, field
 
+import numpy as np
+
+import config
+
+from src.context_builder import ContextBuilder
+from src.embedding_cache import EmbeddingCache
+from src.embeddings import LocalEmbedder
 from src.vector_store import ReviewVectorStore
 from src.retriever import ReviewRetriever
 from src.llm_chain import ReviewQAChain
 from src.data_loader import ReviewLoader
 from src.preprocessor import ReviewPreprocessor
+from src.reranker import CrossEncoderReranker
 
 
 # ---------------------------------------------------------------------------
@@ -48,6 +58,14 @@ class ResultatEval:
     score_mots_cles: float = 0.0
 
 
+@dataclass
+class ResultatRecuperation:
+    configuration: str
+    rappel_mots_cles: float
+    latence_p50_ms: float
+    latence_max_ms: float
+
+
 def rappel_mots_cles(reponse: str, mots_cles: list[str]) -> tuple[list[str], float]:
     reponse_lower = reponse.lower()
     trouves = [m for m in mots_cles if m.lower() in reponse_lower]
@@ -55,6 +73,41 @@ def rappel_mots_cles(reponse: str, mots_cles: list[str]) -> tuple[list[str], flo
     return trouves, score
 
 
+def evaluer_recuperation(retriever: ReviewRetriever, configuration: str) -> ResultatRecuperation:
+    """Rappel des mots-clés attendus dans les avis récupérés, et latence de la récupération."""
+    # Premier appel hors mesure : chargement des modèles
+    retriever.rechercher(JEU_EVALUATION[0]["question"])
+    latences, scores = [], []
+    for item in JEU_EVALUATION:
+        debut = time.perf_counter()
+        sources = retriever.rechercher(item["question"])
+        latences.append((time.perf_counter() - debut) * 1000)
+        contexte = " ".join(s["text"] for s in sources)
+        scores.append(rappel_mots_cles(contexte, item["mots_cles_attendus"])[1])
+    return ResultatRecuperation(
+        configuration=configuration,
+        rappel_mots_cles=sum(scores) / len(scores),
+        latence_p50_ms=float(np.median(latences)),
+        latence_max_ms=max(latences),
+    )
+
+
+def comparer_reclassement(store: ReviewVectorStore, reranker: CrossEncoderReranker) -> list[ResultatRecuperation]:
+    comparaison = [
+        evaluer_recuperation(ReviewRetriever(store=store), "sans reranker"),
+        evaluer_recuperation(ReviewRetriever(store=store, reranker=reranker), "avec reranker"),
+    ]
+    print("Récupération :")
+    for r in comparaison:
+        print(
+            f"  {r.configuration:<14} rappel mots-clés {r.rappel_mots_cles:.0%}  "
+            f"latence p50 {r.latence_p50_ms:.1f} ms (max {r.latence_max_ms:.1f} ms)"
+        )
+    surcout = comparaison[1].latence_p50_ms - comparaison[0].latence_p50_ms
+    print(f"  latence ajoutée par le reranker : {surcout:+.1f} ms (p50)\n")
+    return comparaison
+
+
 def lancer_evaluation() -> None:
     # Indexation des avis exemples
     loader = ReviewLoader(data_path="data")
@@ -63,22 +116,32 @@ def lancer_evaluation() -> None:
     df = preprocessor.nettoyer(df)
     docs = preprocessor.vers_documents(df)
 
-    store = ReviewVectorStore()
-    store.reinitialiser()
-    store.ajouter_documents(docs)
-    print(f"{len(docs)} morceaux indexés.\n")
-
-    retriever = ReviewRetriever(store=store)
+    embedder = LocalEmbedder(cache=EmbeddingCache())
+    store = ReviewVectorStore(embedder=embedder)
+    store.synchroniser(docs)
+    print(f"{len(docs)} morceaux indexés (cache embeddings : {embedder.cache.statistiques()}).\n")
+
+    reranker = CrossEncoderReranker()
+    comparaison = comparer_reclassement(store, reranker)
+    with open("eval_recuperation.json", "w", encoding="utf-8") as f:
+        json.dump([asdict(r) for r in comparaison], f, indent=2, ensure_ascii=False)
+
+    retriever = ReviewRetriever(
+        store=store,
+        reranker=reranker if config.RERANK else None,
+        constructeur=ContextBuilder() if config.CONTEXT_PACKING else None,
+    )
     chaine = ReviewQAChain(retriever=retriever)
 
     resultats: list[ResultatEval] = []
 
-    for item in JEU_EVALUATION:
+    sorties = chaine.executer_lot([item["question"] for item in JEU_EVALUATION], mode="qa")
+
+    for item, sortie in zip(JEU_EVALUATION, sorties):
         question = item["question"]
         mots_cles = item["mots_cles_attendus"]
         print(f"Q : {question}")
 
-        sortie = chaine.executer(question=question, mode="qa")
         reponse = sortie["answer"]
         sources = sortie["sources"]
 
@@ -94,10 +157,16 @@ def lancer_evaluation() -> None:
 
         print(f"  Réponse : {reponse[:120]}...")
         print(f"  Rappel mots-clés : {score:.0%} ({trouves})")
-        print(f"  Récupérés : {resultat.nb_recuperes} morceaux\n")
+        print(f"  Récupérés : {resultat.nb_recuperes} morceaux")
+        if "context_stats" in sortie:
+            mesures = sortie["context_stats"]
+            print(f"  Contexte : {mesures['tokens']} tokens ({mesures['tokens_economises']} économisés)")
+        print()
 
     score_moyen = sum(r.score_mots_cles for r in resultats) / len(resultats)
     print(f"Rappel moyen des mots-clés : {score_moyen:.0%}")
+    if retriever.constructeur is not None:
+        print(f"Contexte : {retriever.constructeur.statistiques()}")
 
     with open("eval_resultats.json", "w", encoding="utf-8") as f:
         json.dump(
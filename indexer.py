@@ -0,0 +1,94 @@
+"""
+Indexation en flux de gros fichiers d'avis (CSV, JSON ou JSON Lines).
+
+La mémoire reste bornée par la taille des lots ; la progression et le débit sont affichés au fil de l'eau.
+Avec --donnees-traitees, avis nettoyés et morceaux encodés sont aussi écrits en Parquet dans PROCESSED_DATA_PATH ;
+--depuis-traitees réindexe ensuite depuis ces tables, sans relire le fichier brut (--redecouper pour redécouper).
+Lancer avec :  python indexer.py data/raw/avis.jsonl [--lot-avis 10000] [--lot-morceaux 2000] [--workers 8] [--supprimer-absents]
+                                                     [--donnees-traitees] [--depuis-traitees [--redecouper]]
+"""
+
+import argparse
+from pathlib import Path
+
+import config
+from src.data_loader import ReviewLoader
+from src.embedding_cache import EmbeddingCache
+from src.embeddings import LocalEmbedder
+from src.metrics import metriques
+from src.pipeline import IngestionPipeline, StatsIngestion
+from src.processed_store import ProcessedReviews
+from src.vector_store import ReviewVectorStore
+
+
+def afficher_progression(stats: StatsIngestion) -> None:
+    print(
+        f"\r{stats.avis_lus} avis lus, {stats.morceaux} morceaux "
+        f"({stats.avis_par_seconde:.0f} avis/s, {stats.morceaux_par_seconde:.0f} morceaux/s)",
+        end="",
+        flush=True,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("fichier", help="Chemin du fichier d'avis")
+    parser.add_argument("--lot-avis", type=int, default=config.INGESTION_BATCH_ROWS)
+    parser.add_argument("--lot-morceaux", type=int, default=config.INGESTION_BATCH_CHUNKS)
+    parser.add_argument("--workers", type=int, default=config.INDEXING_WORKERS, help="Processus de découpage et d'encodage")
+    parser.add_argument("--lot-embedding", type=int, default=config.EMBEDDING_BATCH_SIZE)
+    parser.add_argument(
+        "--budget-tokens", type=int, default=config.EMBEDDING_BATCH_TOKENS, help="Tokens par lot d'encodage (0 : lots fixes)"
+    )
+    parser.add_argument("--supprimer-absents", action="store_true", help="Supprime les morceaux absents du fichier")
+    parser.add_argument(
+        "--donnees-traitees",
+        action=argparse.BooleanOptionalAction,
+        default=config.PROCESSED_STAGE_ENABLED,
+        help="Écrit aussi avis nettoyés et morceaux encodés en Parquet",
+    )
+    parser.add_argument("--depuis-traitees", action="store_true", help="Réindexe depuis les données traitées")
+    parser.add_argument("--redecouper", action="store_true", help="Avec --depuis-traitees : redécoupe les avis nettoyés")
+    args = parser.parse_args()
+
+    chemin = Path(args.fichier)
+    embedder = LocalEmbedder(
+        cache=EmbeddingCache(), workers=args.workers, taille_lot=args.lot_embedding, budget_tokens=args.budget_tokens
+    )
+    store = ReviewVectorStore(embedder=embedder)
+    pipeline = IngestionPipeline(
+        store,
+        loader=ReviewLoader(data_path=str(chemin.parent)),
+        taille_lot_avis=args.lot_avis,
+        taille_lot_morceaux=args.lot_morceaux,
+        progression=afficher_progression,
+        workers=args.workers,
+        etape_traitee=ProcessedReviews() if args.donnees_traitees or args.depuis_traitees else None,
+    )
+    try:
+        if args.depuis_traitees:
+            stats = pipeline.reindexer(
+                chemin.name, redecouper=args.redecouper, supprimer_absents=args.supprimer_absents
+            )
+        else:
+            stats = pipeline.executer(chemin.name, supprimer_absents=args.supprimer_absents)
+    finally:
+        embedder.fermer()
+    print(
+        f"\n{stats.avis_retenus}/{stats.avis_lus} avis retenus, {stats.morceaux} morceaux en {stats.duree:.1f} s : "
+        f"{stats.ajoutes} ajoutés, {stats.modifies} modifiés, {stats.supprimes} supprimés."
+    )
+    lots = embedder.statistiques_lots()
+    if lots["lots"]:
+        print(
+            f"Lots d'encodage : {lots['lots']} lots, {lots['efficacite']:.0%} de tokens utiles "
+            f"({lots['efficacite_lots_fixes']:.0%} avec des lots fixes)."
+        )
+    if metriques.actif:
+        for etape, mesure in metriques.statistiques().items():
+            print(f"  {etape:<16} {mesure['appels']:>8} appels  {mesure['moyenne_ms']:>10.2f} ms en moyenne")
+        metriques.ecrire()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""
+Matérialisation hors ligne des résumés et de la FAQ standard de chaque produit indexé.
+
+Seuls les produits dont les avis ont changé depuis la dernière exécution sont régénérés ;
+l'application sert ensuite ces réponses sans appel au LLM.
+Lancer avec :  python materialize.py [--asin B001 B002] [--forcer]
+"""
+
+import argparse
+
+from src.embedding_cache import EmbeddingCache
+from src.embeddings import LocalEmbedder
+from src.llm_chain import ReviewQAChain
+from src.materializer import MaterializationJob
+from src.retriever import ReviewRetriever
+from src.vector_store import ReviewVectorStore
+
+
+def afficher_progression(asin: str, i: int, total: int) -> None:
+    print(f"\r{i}/{total} produits ({asin})", end="", flush=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--asin", nargs="+", help="Produits à matérialiser (par défaut : tous)")
+    parser.add_argument("--forcer", action="store_true", help="Régénère même les produits inchangés")
+    args = parser.parse_args()
+
+    store = ReviewVectorStore(embedder=LocalEmbedder(cache=EmbeddingCache()))
+    job = MaterializationJob(ReviewQAChain(retriever=ReviewRetriever(store=store)))
+    stats = job.executer(args.asin, forcer=args.forcer, progression=afficher_progression)
+    print(
+        f"\n{stats['produits']} produits : {stats['generes']} générés, {stats['inchanges']} inchangés, "
+        f"{stats['supprimes']} supprimés."
+    )
+
+
+if __name__ == "__main__":
+    main()
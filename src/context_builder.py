@@ -0,0 +1,190 @@
+import re
+import threading
+from typing import Callable
+
+import config
+
+
+_MOTS = re.compile(r"\w+")
+
+
+class ContextBuilder:
+    """Construit le contexte envoyé au LLM dans un budget de tokens.
+
+    Les morceaux quasi identiques (similarité de Jaccard des 3-grammes de mots
+    au-delà du seuil) ne sont gardés qu'une fois, au meilleur rang. Les morceaux
+    d'un même avis sont regroupés dans l'ordre du texte, le chevauchement entre
+    morceaux consécutifs étant retiré. Les avis sont ensuite ajoutés par rang
+    tant que le budget le permet ; le premier avis, s'il dépasse à lui seul le
+    budget, est tronqué plutôt qu'exclu.
+    """
+
+    CARACTERES_PAR_TOKEN = 3.5  # estimation sans tokenizer
+    CHEVAUCHEMENT_MIN = 10  # en dessous, une coïncidence plutôt qu'un chevauchement
+
+    def __init__(
+        self,
+        budget_tokens: int = config.CONTEXT_TOKEN_BUDGET,
+        seuil_doublon: float = config.CONTEXT_DEDUP_THRESHOLD,
+        tokenizer: str | None = config.CONTEXT_TOKENIZER,
+        chevauchement_max: int = config.CHUNK_OVERLAP,
+        compteur: Callable[[str], int] | None = None,
+    ):
+        self.budget_tokens = budget_tokens
+        self.seuil_doublon = seuil_doublon
+        self.chevauchement_max = chevauchement_max
+        self.compter = compteur or self._creer_compteur(tokenizer)
+        self.requetes = 0
+        self.tokens_initiaux = 0
+        self.tokens_envoyes = 0
+        self.doublons = 0
+        self.fusions = 0
+        self.exclus = 0
+        self._verrou = threading.Lock()
+
+    def construire(self, resultats: list[dict]) -> dict:
+        """
+        Construit le contexte pour une liste de résultats classés.
+
+        Returns:
+            Dict avec les clés : contexte, tokens, tokens_initiaux (contexte sans
+            traitement), tokens_economises, doublons, fusions, exclus (avis hors budget).
+        """
+        uniques, doublons = self._dedoublonner(resultats)
+        avis, fusions = self._regrouper(uniques)
+
+        blocs, total, exclus = [], 0, 0
+        separateur = self.compter("\n\n")
+        for metadata, texte in avis:
+            entete = self._entete(len(blocs) + 1, metadata)
+            bloc = entete + texte
+            cout = self.compter(bloc) + (separateur if blocs else 0)
+            if total + cout > self.budget_tokens:
+                if blocs:
+                    exclus += 1
+                    continue
+                # Le meilleur avis ne tient pas seul : tronqué, pour ne jamais envoyer un contexte vide
+                bloc = entete + self._tronquer(texte, self.budget_tokens - self.compter(entete))
+                cout = self.compter(bloc)
+            blocs.append(bloc)
+            total += cout
+
+        contexte = "\n\n".join(blocs)
+        tokens = self.compter(contexte) if blocs else 0
+        initiaux = self.compter(
+            "\n\n".join(self._entete(i, r["metadata"]) + r["text"] for i, r in enumerate(resultats, 1))
+        )
+        with self._verrou:
+            self.requetes += 1
+            self.tokens_initiaux += initiaux
+            self.tokens_envoyes += tokens
+            self.doublons += doublons
+            self.fusions += fusions
+            self.exclus += exclus
+        return {
+            "contexte": contexte,
+            "tokens": tokens,
+            "tokens_initiaux": initiaux,
+            "tokens_economises": initiaux - tokens,
+            "doublons": doublons,
+            "fusions": fusions,
+            "exclus": exclus,
+        }
+
+    # Alias pour compatibilité avec l'interface existante
+    def build(self, resultats: list[dict]) -> dict:
+        return self.construire(resultats)
+
+    def statistiques(self) -> dict:
+        return {
+            "requetes": self.requetes,
+            "tokens_initiaux": self.tokens_initiaux,
+            "tokens_envoyes": self.tokens_envoyes,
+            "tokens_economises": self.tokens_initiaux - self.tokens_envoyes,
+            "economie_moyenne": (self.tokens_initiaux - self.tokens_envoyes) / self.requetes if self.requetes else 0.0,
+            "doublons": self.doublons,
+            "fusions": self.fusions,
+            "exclus": self.exclus,
+        }
+
+    def _creer_compteur(self, tokenizer: str | None) -> Callable[[str], int]:
+        if tokenizer is None:
+            return lambda texte: round(len(texte) / self.CARACTERES_PAR_TOKEN)
+        from transformers import AutoTokenizer
+
+        modele = AutoTokenizer.from_pretrained(tokenizer)
+        return lambda texte: len(modele.encode(texte, add_special_tokens=False))
+
+    def _dedoublonner(self, resultats: list[dict]) -> tuple[list[dict], int]:
+        """Retire les quasi-doublons d'un morceau mieux classé."""
+        uniques, bardeaux = [], []
+        for r in resultats:
+            b = self._bardeaux(r["text"])
+            if any(self._jaccard(b, autre) >= self.seuil_doublon for autre in bardeaux):
+                continue
+            uniques.append(r)
+            bardeaux.append(b)
+        return uniques, len(resultats) - len(uniques)
+
+    def _regrouper(self, resultats: list[dict]) -> tuple[list[tuple[dict, str]], int]:
+        """Un texte par avis, au rang de son meilleur morceau ; retourne aussi le nombre de fusions.
+
+        Un avis est identifié par (asin, avis_id) : avis_id est l'auteur, qui peut avoir
+        noté plusieurs produits.
+        """
+        groupes: dict[tuple, list[dict]] = {}
+        for i, r in enumerate(resultats):
+            avis_id = r["metadata"].get("avis_id")
+            cle = (r["metadata"].get("asin"), avis_id) if avis_id else (None, f"#{i}")
+            groupes.setdefault(cle, []).append(r)
+
+        avis, fusions = [], 0
+        for morceaux in groupes.values():
+            morceaux = sorted(morceaux, key=lambda r: r["metadata"].get("morceau", 0))
+            texte = morceaux[0]["text"]
+            for precedent, suivant in zip(morceaux, morceaux[1:]):
+                if suivant["metadata"].get("morceau", 0) == precedent["metadata"].get("morceau", 0) + 1:
+                    texte = self._raccorder(texte, suivant["text"])
+                else:
+                    texte = f"{texte} […] {suivant['text']}"
+                fusions += 1
+            avis.append((morceaux[0]["metadata"], texte))
+        return avis, fusions
+
+    def _raccorder(self, texte: str, suivant: str) -> str:
+        """Concatène deux morceaux consécutifs en retirant leur chevauchement."""
+        for n in range(min(len(texte), len(suivant), self.chevauchement_max), self.CHEVAUCHEMENT_MIN - 1, -1):
+            if texte.endswith(suivant[:n]):
+                return texte + suivant[n:]
+        return f"{texte} {suivant.lstrip()}"
+
+    def _tronquer(self, texte: str, budget: int) -> str:
+        """Plus long début du texte, coupé entre deux mots et suivi de « … », qui tient dans budget tokens."""
+        bas, haut = 0, len(texte)
+        while bas < haut:
+            milieu = (bas + haut + 1) // 2
+            if self.compter(texte[:milieu] + "…") <= budget:
+                bas = milieu
+            else:
+                haut = milieu - 1
+        debut = texte[:bas]
+        if " " in debut:
+            debut = debut.rsplit(" ", 1)[0]
+        return debut.rstrip() + "…" if debut else ""
+
+    @staticmethod
+    def _entete(rang: int, metadata: dict) -> str:
+        return f"[Avis {rang} - Note {metadata.get('note', '?')}/5]\n"
+
+    @staticmethod
+    def _bardeaux(texte: str) -> set[tuple[str, ...]]:
+        mots = _MOTS.findall(texte.lower())
+        if len(mots) < 3:
+            return {tuple(mots)}
+        return set(zip(mots, mots[1:], mots[2:]))
+
+    @staticmethod
+    def _jaccard(a: set, b: set) -> float:
+        if not a or not b:
+            return 0.0
+        return len(a & b) / len(a | b)
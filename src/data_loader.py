@@ -1,12 +1,21 @@
 import json
+import re
+from itertools import islice
+from typing import Iterator
+
 import pandas as pd
 from pathlib import Path
 
 import config
 
 
+_SEPARATEURS_JSON = re.compile(r"[\s,]*")
+
+
 class ReviewLoader:
-    """Charge les avis produits depuis des fichiers CSV ou JSON."""
+    """Charge les avis produits depuis des fichiers CSV, JSON ou JSON Lines."""
+
+    FORMATS = {".csv", ".json", ".jsonl"}
 
     REQUIRED_COLS = [
         config.REVIEW_TEXT_COL,
@@ -31,14 +40,48 @@ class ReviewLoader:
         self._valider(df)
         return df
 
+    def load_jsonl(self, filename: str) -> pd.DataFrame:
+        filepath = self.data_path / filename
+        df = pd.read_json(filepath, lines=True, dtype=False)
+        self._valider(df)
+        return df
+
     def load(self, filename: str) -> pd.DataFrame:
         suffix = Path(filename).suffix.lower()
         if suffix == ".csv":
             return self.load_csv(filename)
         if suffix == ".json":
             return self.load_json(filename)
+        if suffix == ".jsonl":
+            return self.load_jsonl(filename)
         raise ValueError(f"Format de fichier non supporté : {suffix}")
 
+    def iterer(self, filename: str, taille_lot: int = config.INGESTION_BATCH_ROWS) -> Iterator[pd.DataFrame]:
+        """
+        Lit le fichier par lots de taille_lot avis, sans le charger entièrement.
+
+        Les tableaux JSON sont décodés objet par objet ; CSV et JSON Lines
+        utilisent la lecture par morceaux de pandas.
+        """
+        filepath = self.data_path / filename
+        suffix = Path(filename).suffix.lower()
+        if suffix == ".csv":
+            lots = pd.read_csv(filepath, chunksize=taille_lot, low_memory=False)
+        elif suffix == ".jsonl":
+            lots = pd.read_json(filepath, lines=True, chunksize=taille_lot, dtype=False)
+        elif suffix == ".json":
+            avis = self._iterer_tableau_json(filepath)
+            lots = (pd.DataFrame(lot) for lot in iter(lambda: list(islice(avis, taille_lot)), []))
+        else:
+            raise ValueError(f"Format de fichier non supporté : {suffix}")
+        for df in lots:
+            self._valider(df)
+            yield df
+
+    # Alias pour compatibilité avec l'interface existante
+    def iter_batches(self, filename: str, batch_size: int = config.INGESTION_BATCH_ROWS) -> Iterator[pd.DataFrame]:
+        return self.iterer(filename, taille_lot=batch_size)
+
     def _valider(self, df: pd.DataFrame) -> None:
         manquantes = [c for c in self.REQUIRED_COLS if c not in df.columns]
         if manquantes:
@@ -48,5 +91,30 @@ class ReviewLoader:
         return [
             f.name
             for f in self.data_path.iterdir()
-            if f.suffix.lower() in {".csv", ".json"}
+            if f.suffix.lower() in self.FORMATS
         ]
+
+    @staticmethod
+    def _iterer_tableau_json(filepath: Path, taille_bloc: int = 1 << 20) -> Iterator[dict]:
+        """Décode un tableau JSON d'avis objet par objet, par blocs de taille_bloc caractères."""
+        decodeur = json.JSONDecoder()
+        with open(filepath, "r", encoding="utf-8") as f:
+            tampon = f.read(taille_bloc).lstrip()
+            if not tampon.startswith("["):
+                raise ValueError("Le fichier JSON doit contenir un tableau d'avis")
+            pos = 1
+            while True:
+                pos = _SEPARATEURS_JSON.match(tampon, pos).end()
+                if tampon.startswith("]", pos):
+                    return
+                try:
+                    objet, pos_fin = decodeur.raw_decode(tampon, pos)
+                except json.JSONDecodeError:
+                    bloc = f.read(taille_bloc)
+                    if not bloc:
+                        raise
+                    tampon = tampon[pos:] + bloc
+                    pos = 0
+                    continue
+                yield objet
+                pos = pos_fin
@@ -0,0 +1,208 @@
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+import config
+
+
+class EmbeddingCache:
+    """Cache disque des embeddings, indexé par (modèle, hash du texte normalisé).
+
+    Les vecteurs sont stockés en float32 dans un fichier mappé en mémoire ;
+    l'index (clé -> ligne du fichier) est conservé dans l'ordre LRU. La clé de
+    chaque ligne est écrite à côté du vecteur et vérifiée à la lecture : si un
+    autre processus partageant le cache a réutilisé la ligne, l'entrée est
+    traitée comme absente plutôt que de retourner le vecteur d'un autre texte.
+    """
+
+    FICHIER_VECTEURS = "vecteurs.f32"
+    FICHIER_CLES = "cles.s32"
+    FICHIER_INDEX = "index.npz"
+    CAPACITE_INITIALE = 1024
+
+    def __init__(
+        self,
+        chemin: str = config.EMBEDDING_CACHE_PATH,
+        max_entrees: int = config.EMBEDDING_CACHE_MAX_ENTRIES,
+    ):
+        self.chemin = Path(chemin)
+        self.chemin.mkdir(parents=True, exist_ok=True)
+        self.max_entrees = max_entrees
+        self.hits = 0
+        self.misses = 0
+        self.dimension: int | None = None
+        self._slots: OrderedDict[str, int] = OrderedDict()
+        self._libres: list[int] = []
+        self._prochain = 0
+        self._capacite = 0
+        self._vecteurs: np.memmap | None = None
+        self._cles: np.memmap | None = None
+        self._verrou = threading.Lock()
+        self._charger()
+
+    @staticmethod
+    def cle(nom_modele: str, texte: str) -> str:
+        normalise = " ".join(unicodedata.normalize("NFC", texte).split())
+        donnees = f"{nom_modele}\x00{normalise}".encode("utf-8")
+        return hashlib.blake2b(donnees, digest_size=16).hexdigest()
+
+    def chercher(self, cles: list[str]) -> tuple[np.ndarray | None, list[int]]:
+        """
+        Cherche les vecteurs associés aux clés.
+
+        Returns:
+            Tuple (vecteurs, manquants) : matrice (n, dim) remplie pour les clés
+            trouvées (None si le cache est vide) et positions des clés absentes.
+        """
+        with self._verrou:
+            if self.dimension is None:
+                self.misses += len(cles)
+                return None, list(range(len(cles)))
+            positions, slots, manquants = [], [], []
+            for i, c in enumerate(cles):
+                slot = self._slots.get(c)
+                if slot is None:
+                    manquants.append(i)
+                else:
+                    self._slots.move_to_end(c)
+                    positions.append(i)
+                    slots.append(slot)
+            vecteurs = np.zeros((len(cles), self.dimension), dtype=np.float32)
+            if slots:
+                vecteurs[positions] = self._vecteurs[np.asarray(slots)]
+                # Vérifiée après la copie : une ligne en cours de réécriture a déjà perdu sa clé
+                reutilisees = self._cles[np.asarray(slots)] != np.array([cles[i] for i in positions], dtype="S32")
+                if reutilisees.any():
+                    perdues = np.asarray(positions)[reutilisees]
+                    for i in perdues:
+                        self._slots.pop(cles[i], None)
+                    vecteurs[perdues] = 0
+                    positions = np.asarray(positions)[~reutilisees].tolist()
+                    manquants = sorted(manquants + perdues.tolist())
+            self.hits += len(positions)
+            self.misses += len(manquants)
+            return vecteurs, manquants
+
+    def stocker(self, cles: list[str], vecteurs: np.ndarray) -> None:
+        """Ajoute des vecteurs au cache, en évinçant les entrées les moins récentes."""
+        if not cles:
+            return
+        vecteurs = np.asarray(vecteurs, dtype=np.float32)
+        with self._verrou:
+            if self.dimension is None:
+                self.dimension = int(vecteurs.shape[1])
+            elif vecteurs.shape[1] != self.dimension:
+                raise ValueError(
+                    f"Dimension incompatible avec le cache : {vecteurs.shape[1]} != {self.dimension}"
+                )
+            for c, v in zip(cles, vecteurs):
+                slot = self._slots.get(c)
+                if slot is None:
+                    slot = self._allouer_slot()
+                self._slots[c] = slot
+                self._slots.move_to_end(c)
+                # Clé effacée pendant l'écriture du vecteur : un lecteur concurrent voit un absent
+                self._cles[slot] = b""
+                self._vecteurs[slot] = v
+                self._cles[slot] = c.encode("ascii")
+
+    def sauvegarder(self) -> None:
+        with self._verrou:
+            if self.dimension is None:
+                return
+            self._vecteurs.flush()
+            self._cles.flush()
+            tmp = self.chemin / (self.FICHIER_INDEX + ".tmp")
+            with open(tmp, "wb") as f:
+                np.savez(
+                    f,
+                    cles=np.array(list(self._slots.keys()), dtype="S32"),
+                    slots=np.fromiter(self._slots.values(), dtype=np.int64, count=len(self._slots)),
+                    dimension=np.int64(self.dimension),
+                    capacite=np.int64(self._capacite),
+                )
+            tmp.replace(self.chemin / self.FICHIER_INDEX)
+
+    # Alias pour compatibilité avec l'interface existante
+    def save(self) -> None:
+        return self.sauvegarder()
+
+    def vider(self) -> None:
+        with self._verrou:
+            self._slots.clear()
+            self._libres.clear()
+            self._prochain = 0
+            self._vecteurs = None
+            self._cles = None
+            self._capacite = 0
+            self.dimension = None
+            for nom in (self.FICHIER_VECTEURS, self.FICHIER_CLES, self.FICHIER_INDEX):
+                (self.chemin / nom).unlink(missing_ok=True)
+
+    def statistiques(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "taux_succes": self.hits / total if total else 0.0,
+            "entrees": len(self._slots),
+            "octets": self._capacite * (self.dimension or 0) * 4,
+        }
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def _allouer_slot(self) -> int:
+        if len(self._slots) >= self.max_entrees:
+            _, slot = self._slots.popitem(last=False)
+            return slot
+        if self._libres:
+            return self._libres.pop()
+        slot = self._prochain
+        self._prochain += 1
+        if slot >= self._capacite:
+            nouvelle = min(max(2 * self._capacite, self.CAPACITE_INITIALE), self.max_entrees)
+            self._redimensionner(max(nouvelle, slot + 1))
+        return slot
+
+    def _redimensionner(self, capacite: int) -> None:
+        if self._vecteurs is not None:
+            self._vecteurs.flush()
+            self._cles.flush()
+            self._vecteurs = self._cles = None
+        self._vecteurs = self._mapper(self.FICHIER_VECTEURS, np.float32, (capacite, self.dimension))
+        self._cles = self._mapper(self.FICHIER_CLES, np.dtype("S32"), (capacite,))
+        self._capacite = capacite
+
+    def _mapper(self, nom: str, dtype, forme: tuple) -> np.memmap:
+        """Mappe le fichier en lecture-écriture, agrandi au besoin (jamais réduit : un autre processus peut l'utiliser)."""
+        fichier = self.chemin / nom
+        taille = int(np.prod(forme)) * np.dtype(dtype).itemsize
+        with open(fichier, "ab") as f:
+            if f.tell() < taille:
+                f.truncate(taille)
+        return np.memmap(fichier, dtype=dtype, mode="r+", shape=forme)
+
+    def _charger(self) -> None:
+        index = self.chemin / self.FICHIER_INDEX
+        fichiers = (index, self.chemin / self.FICHIER_VECTEURS, self.chemin / self.FICHIER_CLES)
+        if not all(f.exists() for f in fichiers):
+            # Cache absent, ou écrit sans les clés des lignes : repart de zéro
+            return
+        with np.load(index) as donnees:
+            self.dimension = int(donnees["dimension"])
+            capacite = int(donnees["capacite"])
+            cles = donnees["cles"]
+            slots = donnees["slots"]
+        self._redimensionner(capacite)
+        self._slots = OrderedDict(
+            (c.decode("ascii"), int(s)) for c, s in zip(cles, slots)
+        )
+        self._prochain = int(slots.max()) + 1 if len(slots) else 0
+        while len(self._slots) > self.max_entrees:
+            _, slot = self._slots.popitem(last=False)
+            self._libres.append(slot)
@@ -0,0 +1,117 @@
+import queue
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+
+import numpy as np
+
+import config
+from src.embeddings import LocalEmbedder
+
+
+class EmbeddingScheduler:
+    """Regroupe les encodages de requêtes concurrentes en micro-lots.
+
+    Chaque appel dépose sa requête dans une file et reçoit un Future. Un thread
+    unique prend la première requête en attente, attend au plus fenetre_ms
+    (ou taille_max requêtes) pour en collecter d'autres, puis encode le lot
+    en un seul appel au modèle. Les histogrammes de taille de lot et de
+    profondeur de file servent à régler la fenêtre.
+    """
+
+    def __init__(
+        self,
+        embedder: LocalEmbedder,
+        fenetre_ms: float = config.EMBEDDING_SCHEDULER_WINDOW_MS,
+        taille_max: int = config.EMBEDDING_SCHEDULER_MAX_BATCH,
+    ):
+        self.embedder = embedder
+        self.fenetre = fenetre_ms / 1000
+        self.taille_max = taille_max
+        self.histogramme_lots: Counter[int] = Counter()
+        self.histogramme_profondeur: Counter[int] = Counter()
+        self._file: queue.Queue = queue.Queue()
+        self._thread: threading.Thread | None = None
+        self._verrou = threading.Lock()
+
+    def soumettre(self, texte: str) -> Future:
+        """Place une requête dans la file ; le Future reçoit son vecteur float32 (dim,)."""
+        futur: Future = Future()
+        self._demarrer()
+        self._file.put((texte, futur))
+        return futur
+
+    def encoder_requete(self, texte: str) -> np.ndarray:
+        """Encode une requête via la file et attend son résultat."""
+        return self.soumettre(texte).result()
+
+    # Alias pour compatibilité avec l'interface existante
+    def embed_query(self, texte: str) -> list[float]:
+        return self.encoder_requete(texte).tolist()
+
+    def profondeur(self) -> int:
+        """Nombre de requêtes en attente d'encodage."""
+        return self._file.qsize()
+
+    def statistiques(self) -> dict:
+        lots = sum(self.histogramme_lots.values())
+        requetes = sum(taille * n for taille, n in self.histogramme_lots.items())
+        return {
+            "lots": lots,
+            "requetes": requetes,
+            "taille_moyenne": requetes / lots if lots else 0.0,
+            "profondeur": self.profondeur(),
+            "histogramme_lots": dict(sorted(self.histogramme_lots.items())),
+            "histogramme_profondeur": dict(sorted(self.histogramme_profondeur.items())),
+        }
+
+    def fermer(self) -> None:
+        """Traite les requêtes déjà soumises puis arrête le thread d'encodage."""
+        with self._verrou:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._file.put(None)
+            thread.join()
+
+    def _demarrer(self) -> None:
+        with self._verrou:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._boucle, name="embedding-scheduler", daemon=True)
+                self._thread.start()
+
+    def _boucle(self) -> None:
+        while True:
+            element = self._file.get()
+            if element is None:
+                return
+            # Profondeur vue par le lot : la requête prise plus celles déjà en attente
+            self.histogramme_profondeur[self._file.qsize() + 1] += 1
+            lot, arret = [element], False
+            echeance = time.monotonic() + self.fenetre
+            while len(lot) < self.taille_max:
+                try:
+                    element = self._file.get(timeout=max(echeance - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if element is None:
+                    arret = True
+                    break
+                lot.append(element)
+            self._encoder_lot(lot)
+            if arret:
+                return
+
+    def _encoder_lot(self, lot: list[tuple[str, Future]]) -> None:
+        lot = [(texte, futur) for texte, futur in lot if futur.set_running_or_notify_cancel()]
+        if not lot:
+            return
+        self.histogramme_lots[len(lot)] += 1
+        try:
+            vecteurs = self.embedder.encoder_requetes([texte for texte, _ in lot])
+        except Exception as erreur:
+            for _, futur in lot:
+                futur.set_exception(erreur)
+            return
+        for vecteur, (_, futur) in zip(vecteurs, lot):
+            futur.set_result(vecteur)
@@ -1,32 +1,346 @@
-from sentence_transformers import SentenceTransformer
+import os
+import threading
+from pathlib import Path
+
 import numpy as np
 
 import config
+from src.embedding_cache import EmbeddingCache
+
+
+BACKENDS = ["torch", "onnx"]
+QUANTIFICATIONS_ONNX = [None, "avx2", "avx512", "avx512_vnni", "arm64"]
+
+# Phrases de contrôle de la quantification : les vecteurs int8 doivent rester proches des vecteurs PyTorch
+PHRASES_CONTROLE = [
+    "La batterie tient toute la journée, je recommande.",
+    "Produit arrivé cassé, le service client n'a jamais répondu.",
+    "Bon rapport qualité-prix mais un peu bruyant.",
+    "Is it compatible with the older model?",
+    "Taille petite, prendre une pointure au-dessus.",
+]
+
+
+def signature_embedder(embedder) -> str:
+    """Identifiant des vecteurs d'un embedder quelconque : sa signature, ou à défaut le nom du modèle."""
+    return getattr(embedder, "signature", embedder.model_name)
 
 
 class LocalEmbedder:
-    """Encapsule sentence-transformers pour l'embedding local."""
+    """Encapsule sentence-transformers pour l'embedding local.
+
+    sentence-transformers (et torch) ne sont importés, et le modèle chargé, qu'au
+    premier encodage ; prechauffer permet de le faire en arrière-plan au démarrage.
+    Le backend onnx exécute le modèle avec ONNX Runtime ; avec une quantification,
+    les poids sont convertis en int8 à la première utilisation, et le modèle exporté
+    n'est gardé que si ses vecteurs restent proches de ceux de PyTorch.
+
+    À l'ingestion (encoder), les textes sont triés par nombre de tokens et
+    encodés par lots de longueurs voisines, dont la taille suit un budget de
+    tokens : peu de remplissage, et de grands lots quand les textes sont courts.
+    """
+
+    def __init__(
+        self,
+        model_name: str = config.EMBEDDING_MODEL,
+        cache: EmbeddingCache | None = None,
+        workers: int = config.INDEXING_WORKERS,
+        taille_lot: int = config.EMBEDDING_BATCH_SIZE,
+        normaliser: bool = config.EMBEDDING_NORMALIZE,
+        backend: str = config.EMBEDDING_BACKEND,
+        quantification: str | None = config.EMBEDDING_ONNX_QUANTIZATION,
+        threads: int | None = config.EMBEDDING_THREADS,
+        chemin_onnx: str = config.EMBEDDING_ONNX_PATH,
+        tolerance: float = config.EMBEDDING_ONNX_TOLERANCE,
+        budget_tokens: int | None = config.EMBEDDING_BATCH_TOKENS,
+        dimension: int | None = None,
+    ):
+        if backend not in BACKENDS:
+            raise ValueError(f"Backend d'embedding inconnu '{backend}'. Choisir parmi : {BACKENDS}")
+        if quantification not in QUANTIFICATIONS_ONNX or (quantification and backend != "onnx"):
+            raise ValueError(
+                f"Quantification inconnue '{quantification}'. Choisir parmi : {QUANTIFICATIONS_ONNX} (backend onnx)"
+            )
+        self.model_name = model_name
+        self.backend = backend
+        self.quantification = quantification
+        self.threads = threads
+        self.chemin_onnx = Path(chemin_onnx)
+        self.tolerance = tolerance
+        self._model = None
+        self._verrou_modele = threading.Lock()
+        if dimension is None and model_name == config.EMBEDDING_MODEL:
+            dimension = config.EMBEDDING_DIMENSION
+        if dimension is None and cache is not None:
+            dimension = cache.dimension
+        self._dimension = dimension
+        self.cache = cache
+        self.workers = workers
+        self.taille_lot = taille_lot
+        self.normaliser = normaliser
+        self.budget_tokens = budget_tokens
+        self.lots = 0
+        self.tokens = 0
+        self.tokens_remplis = 0
+        self.tokens_remplis_fixes = 0
+        self._verrou_lots = threading.Lock()
+        self._pool = None
 
-    def __init__(self, model_name: str = config.EMBEDDING_MODEL):
-        self.model = SentenceTransformer(model_name)
+    def encoder(self, textes: list[str]) -> np.ndarray:
+        """Encode des textes en une matrice float32 contiguë (n, dim)."""
+        if not textes:
+            return np.empty((0, self.dimension), dtype=np.float32)
+        if self.cache is None:
+            vecteurs = self._encoder_modele(textes)
+            self._dimension = vecteurs.shape[1]
+            return vecteurs
 
-    def encoder(self, textes: list[str]) -> list[list[float]]:
-        vecteurs = self.model.encode(textes, show_progress_bar=False, convert_to_numpy=True)
-        return vecteurs.tolist()
+        cles = [self.cache.cle(self.signature, t) for t in textes]
+        vecteurs, manquants = self.cache.chercher(cles)
+        if manquants:
+            nouveaux = self._encoder_modele([textes[i] for i in manquants])
+            if vecteurs is None:
+                vecteurs = np.empty((len(textes), nouveaux.shape[1]), dtype=np.float32)
+            vecteurs[manquants] = nouveaux
+            self.cache.stocker([cles[i] for i in manquants], nouveaux)
+            self.cache.sauvegarder()
+        self._dimension = vecteurs.shape[1]
+        return vecteurs
 
     # Alias pour compatibilité avec l'interface existante
     def embed(self, textes: list[str]) -> list[list[float]]:
-        return self.encoder(textes)
+        return self.encoder(textes).tolist()
 
-    def encoder_requete(self, texte: str) -> list[float]:
-        vecteur = self.model.encode([texte], convert_to_numpy=True)
-        return vecteur[0].tolist()
+    def encoder_requete(self, texte: str) -> np.ndarray:
+        """Encode une requête en un vecteur float32 (dim,)."""
+        vecteur = self.model.encode(
+            [texte], convert_to_numpy=True, normalize_embeddings=self.normaliser
+        )
+        return np.ascontiguousarray(vecteur[0], dtype=np.float32)
 
     # Alias pour compatibilité avec l'interface existante
     def embed_query(self, texte: str) -> list[float]:
-        return self.encoder_requete(texte)
+        return self.encoder_requete(texte).tolist()
+
+    def encoder_requetes(self, textes: list[str]) -> np.ndarray:
+        """Encode un lot de requêtes en un seul appel au modèle, sans passer par le cache."""
+        vecteurs = self.model.encode(
+            textes,
+            batch_size=self.taille_lot,
+            show_progress_bar=False,
+            convert_to_numpy=True,
+            normalize_embeddings=self.normaliser,
+        )
+        return np.ascontiguousarray(vecteurs, dtype=np.float32)
+
+    @property
+    def model(self):
+        """Modèle sentence-transformers, chargé au premier encodage (ou par prechauffer)."""
+        if self._model is None:
+            with self._verrou_modele:
+                if self._model is None:
+                    self._model = self._charger_modele()
+        return self._model
+
+    @property
+    def dimension(self) -> int:
+        """Taille des vecteurs : configurée, lue dans le cache ou observée à l'encodage ; à défaut, demandée au modèle."""
+        if self._dimension is None:
+            self._dimension = self.model.get_sentence_embedding_dimension()
+        return self._dimension
+
+    @property
+    def signature(self) -> str:
+        """Identifie les vecteurs produits : backend, quantification et normalisation ont chacun leurs entrées de cache."""
+        variantes = [self.backend]
+        if self.quantification is not None:
+            variantes.append(f"qint8_{self.quantification}")
+        if self.normaliser:
+            variantes.append("normalise")
+        return f"{self.model_name}@{'+'.join(variantes)}"
+
+    def similarite_reference(self, textes: list[str] = PHRASES_CONTROLE) -> float:
+        """Similarité cosinus minimale entre les vecteurs de ce backend et ceux de PyTorch."""
+        reference = LocalEmbedder(self.model_name, backend="torch", threads=self.threads)
+        return self._similarite_minimale(self.model, reference.model, textes)
+
+    def prechauffer(self, en_arriere_plan: bool = True) -> threading.Thread | None:
+        """Charge le modèle et encode une phrase, pour que la première vraie requête ne paie ni l'un ni l'autre."""
+        if not en_arriere_plan:
+            self.encoder_requete("Préchauffage du modèle d'embedding.")
+            return None
+        thread = threading.Thread(target=self.prechauffer, args=(False,), daemon=True)
+        thread.start()
+        return thread
+
+    # Alias pour compatibilité avec l'interface existante
+    def warm_up(self, background: bool = True) -> threading.Thread | None:
+        return self.prechauffer(en_arriere_plan=background)
 
-    def similarite(self, vec_a: list[float], vec_b: list[float]) -> float:
-        a = np.array(vec_a)
-        b = np.array(vec_b)
+    def statistiques_lots(self) -> dict:
+        """
+        Efficacité du remplissage des lots d'ingestion.
+
+        efficacite : part des tokens réels dans les tokens calculés (remplissage compris) ;
+        efficacite_lots_fixes : la même avec des lots de taille_lot textes triés par longueur,
+        comme les forme sentence-transformers.
+        """
+        return {
+            "lots": self.lots,
+            "tokens": self.tokens,
+            "tokens_remplis": self.tokens_remplis,
+            "efficacite": self.tokens / self.tokens_remplis if self.tokens_remplis else 1.0,
+            "efficacite_lots_fixes": self.tokens / self.tokens_remplis_fixes if self.tokens_remplis_fixes else 1.0,
+        }
+
+    def similarite(self, vec_a: np.ndarray, vec_b: np.ndarray) -> float:
+        a = np.asarray(vec_a, dtype=np.float32)
+        b = np.asarray(vec_b, dtype=np.float32)
         return float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b) + 1e-10))
+
+    def fermer(self) -> None:
+        """Arrête les processus d'encodage éventuellement démarrés."""
+        if self._pool is not None:
+            self.model.stop_multi_process_pool(self._pool)
+            self._pool = None
+
+    def _encoder_modele(self, textes: list[str]) -> np.ndarray:
+        # Une session ONNX Runtime ne passe pas d'un processus à l'autre : elle parallélise avec ses threads
+        if self.backend == "torch" and self.workers > 1 and len(textes) >= self.workers * self.taille_lot:
+            if self._pool is None:
+                self._pool = self._demarrer_pool()
+            vecteurs = self.model.encode_multi_process(
+                textes, self._pool, batch_size=self.taille_lot, normalize_embeddings=self.normaliser
+            )
+        elif self.budget_tokens:
+            return self._encoder_par_longueur(textes)
+        else:
+            vecteurs = self.model.encode(
+                textes,
+                batch_size=self.taille_lot,
+                show_progress_bar=False,
+                convert_to_numpy=True,
+                normalize_embeddings=self.normaliser,
+            )
+        return np.ascontiguousarray(vecteurs, dtype=np.float32)
+
+    def _encoder_par_longueur(self, textes: list[str]) -> np.ndarray:
+        """Encode par lots de longueurs voisines et remet les vecteurs dans l'ordre des textes."""
+        longueurs = self._longueurs_tokens(textes)
+        ordre = np.argsort(-longueurs, kind="stable")
+        vecteurs = None
+        for lot in self._decouper_lots(longueurs, ordre):
+            encodes = self.model.encode(
+                [textes[i] for i in lot],
+                batch_size=len(lot),
+                show_progress_bar=False,
+                convert_to_numpy=True,
+                normalize_embeddings=self.normaliser,
+            )
+            if vecteurs is None:
+                vecteurs = np.empty((len(textes), encodes.shape[1]), dtype=np.float32)
+            vecteurs[lot] = encodes
+        return vecteurs
+
+    def _decouper_lots(self, longueurs: np.ndarray, ordre: np.ndarray) -> list[np.ndarray]:
+        """Lots consécutifs de l'ordre décroissant : le premier texte d'un lot fixe sa longueur après remplissage."""
+        triees = longueurs[ordre]
+        lots, remplis, debut = [], 0, 0
+        while debut < len(ordre):
+            fin = min(len(ordre), debut + max(1, self.budget_tokens // int(triees[debut])))
+            lots.append(ordre[debut:fin])
+            remplis += int(triees[debut]) * (fin - debut)
+            debut = fin
+        fixes = sum(
+            int(triees[i]) * len(triees[i : i + self.taille_lot]) for i in range(0, len(triees), self.taille_lot)
+        )
+        with self._verrou_lots:
+            self.lots += len(lots)
+            self.tokens += int(longueurs.sum())
+            self.tokens_remplis += remplis
+            self.tokens_remplis_fixes += fixes
+        return lots
+
+    def _longueurs_tokens(self, textes: list[str]) -> np.ndarray:
+        """Nombre de tokens de chaque texte, tronqué comme à l'encodage (estimé sans tokenizer)."""
+        tokenizer = getattr(self.model, "tokenizer", None)
+        if tokenizer is None:
+            return np.array([len(t) // 4 + 2 for t in textes], dtype=np.int64)
+        longueurs = tokenizer(
+            textes,
+            truncation=True,
+            max_length=self.model.max_seq_length,
+            return_length=True,
+            return_attention_mask=False,
+        )["length"]
+        return np.asarray(longueurs, dtype=np.int64)
+
+    def _demarrer_pool(self) -> dict:
+        # Chaque processus hérite d'une part des cœurs pour éviter la sursouscription
+        threads = str(max(1, (os.cpu_count() or 1) // self.workers))
+        precedent = os.environ.get("OMP_NUM_THREADS")
+        os.environ["OMP_NUM_THREADS"] = threads
+        try:
+            return self.model.start_multi_process_pool(target_devices=["cpu"] * self.workers)
+        finally:
+            if precedent is None:
+                del os.environ["OMP_NUM_THREADS"]
+            else:
+                os.environ["OMP_NUM_THREADS"] = precedent
+
+    def _charger_modele(self):
+        from sentence_transformers import SentenceTransformer
+
+        if self.backend == "torch":
+            if self.threads:
+                import torch
+
+                torch.set_num_threads(self.threads)
+            return SentenceTransformer(self.model_name)
+
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        if self.threads:
+            options.intra_op_num_threads = self.threads
+        arguments = {"provider": "CPUExecutionProvider", "session_options": options}
+        if self.quantification is None:
+            return SentenceTransformer(self.model_name, backend="onnx", model_kwargs=arguments)
+        dossier = self._exporter_quantifie()
+        return SentenceTransformer(
+            str(dossier),
+            backend="onnx",
+            model_kwargs={**arguments, "file_name": f"onnx/model_qint8_{self.quantification}.onnx"},
+        )
+
+    def _exporter_quantifie(self) -> Path:
+        """Exporte une fois le modèle ONNX quantifié en int8, après contrôle de ses vecteurs."""
+        from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+
+        dossier = self.chemin_onnx / self.model_name.replace("/", "__")
+        fichier = dossier / "onnx" / f"model_qint8_{self.quantification}.onnx"
+        if fichier.exists():
+            return dossier
+
+        onnx = SentenceTransformer(self.model_name, backend="onnx", model_kwargs={"provider": "CPUExecutionProvider"})
+        onnx.save_pretrained(str(dossier))
+        export_dynamic_quantized_onnx_model(onnx, self.quantification, str(dossier))
+        quantifie = SentenceTransformer(
+            str(dossier),
+            backend="onnx",
+            model_kwargs={"provider": "CPUExecutionProvider", "file_name": f"onnx/{fichier.name}"},
+        )
+        similarite = self._similarite_minimale(quantifie, SentenceTransformer(self.model_name), PHRASES_CONTROLE)
+        if similarite < self.tolerance:
+            fichier.unlink()
+            raise ValueError(
+                f"Quantification '{self.quantification}' trop imprécise : similarité {similarite:.4f} "
+                f"avec PyTorch, inférieure à la tolérance {self.tolerance}"
+            )
+        return dossier
+
+    @staticmethod
+    def _similarite_minimale(modele, reference, textes: list[str]) -> float:
+        a = modele.encode(textes, convert_to_numpy=True, normalize_embeddings=True)
+        b = reference.encode(textes, convert_to_numpy=True, normalize_embeddings=True)
+        return float(np.min(np.sum(a * b, axis=1)))
@@ -0,0 +1,43 @@
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO, Iterator
+
+try:
+    import fcntl
+except ImportError:  # Windows : pas de flock, les verrous sont sans effet
+    fcntl = None
+
+
+@contextmanager
+def verrou_exclusif(chemin: Path) -> Iterator[None]:
+    """Verrou exclusif entre processus sur chemin, attendu au besoin et tenu le temps du bloc."""
+    with open(chemin, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+
+@contextmanager
+def essayer_verrou_exclusif(chemin: Path) -> Iterator[bool]:
+    """Verrou exclusif sans attente : vrai si aucun autre détenteur (ou si chemin n'existe plus)."""
+    try:
+        f = open(chemin, "a+b")
+    except FileNotFoundError:
+        yield True
+        return
+    with f:
+        if fcntl is not None:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+        yield True
+
+
+def verrou_partage(chemin: Path) -> BinaryIO:
+    """Verrou partagé sur chemin, tenu jusqu'à la fermeture du fichier retourné."""
+    f = open(chemin, "a+b")
+    if fcntl is not None:
+        fcntl.flock(f, fcntl.LOCK_SH)
+    return f
@@ -0,0 +1,519 @@
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+import config
+from src.file_lock import verrou_exclusif
+
+
+_ELISIONS = re.compile(r"\b(?:[cdjlmnst]|qu|jusqu|lorsqu|puisqu)['’]")
+_MOTS = re.compile(r"[a-z0-9]+(?:-[a-z0-9]+)*")
+_LIGATURES = str.maketrans({"œ": "oe", "æ": "ae", "ß": "ss"})
+
+MOTS_VIDES = frozenset(
+    """
+    a au aux avec ce ces cet cette dans de des du elle en est et eu il ils je la le les leur
+    leurs lui ma mais me meme mes moi mon ne nos notre nous on ou par pas pour qu que qui sa
+    se ses son sur ta te tes toi ton tu un une vos votre vous y ete etre avoir ai as avons avez
+    ont suis es sommes etes sont ca cela tres plus aussi bien tout tous toute toutes
+    """.split()
+)
+
+
+def tokeniser(texte: str) -> list[str]:
+    """Découpe un texte français en termes normalisés pour l'index lexical.
+
+    Minuscules, élisions retirées (l', qu'...), accents supprimés, mots vides écartés
+    et pluriels simples ramenés au singulier. Les mots composés et références
+    (lave-vaisselle, wh-1000xm4) sont conservés entiers en plus de leurs parties.
+    """
+    texte = _ELISIONS.sub(" ", texte.lower().translate(_LIGATURES))
+    texte = unicodedata.normalize("NFKD", texte).encode("ascii", "ignore").decode("ascii")
+    termes = []
+    for mot in _MOTS.findall(texte):
+        if "-" in mot:
+            termes.extend(_raciner(p) for p in mot.split("-") if p not in MOTS_VIDES)
+        if mot not in MOTS_VIDES:
+            termes.append(_raciner(mot))
+    return termes
+
+
+def _raciner(mot: str) -> str:
+    if len(mot) > 4 and mot[-1] in "sx" and mot[-2] != "s" and not mot[-2].isdigit():
+        return mot[:-1]
+    return mot
+
+
+class LexicalIndex:
+    """Index inversé BM25 persistant, tenu à jour à côté de la collection Chroma.
+
+    Les postings sont compilés en tableaux CSR par terme (documents et poids BM25
+    précalculés), triés par impact décroissant : une requête se réduit à quelques
+    tranches numpy, tronquées à max_postings pour les termes très fréquents.
+    Chaque écriture est journalisée dans un petit segment sur disque et compilée
+    aussitôt en un niveau CSR à part, pondéré avec les statistiques courantes ;
+    les documents remplacés ou supprimés sont masqués à la requête. La compilation
+    complète (fusion des niveaux, purge des morts, poids recalculés) n'a lieu qu'à
+    l'écriture, au-delà de MAX_SEGMENTS, ou au chargement : une requête n'en paie jamais le coût.
+    Les segments ajoutés par un autre processus sont pris en compte à la requête suivante ;
+    une base réécrite par un autre processus est rechargée en arrière-plan. La compaction
+    se fait sous un verrou de fichier et ne supprime que les segments fusionnés dans la base.
+    """
+
+    FICHIER_BASE = "base.npz"
+    FICHIER_VERROU = ".compactage"
+    PREFIXE_SEGMENT = "segment_"
+    MAX_SEGMENTS = 32
+
+    def __init__(
+        self,
+        chemin: str,
+        k1: float = config.BM25_K1,
+        b: float = config.BM25_B,
+        max_postings: int = config.BM25_MAX_POSTINGS_PER_TERM,
+    ):
+        self.chemin = Path(chemin)
+        self.chemin.mkdir(parents=True, exist_ok=True)
+        self.k1 = k1
+        self.b = b
+        self.max_postings = max_postings
+        self._verrou = threading.Lock()
+        self._rechargement: threading.Thread | None = None
+        self._reinitialiser_memoire()
+        self._charger(compacter=True)
+
+    def ajouter(self, ids: list[str], textes: list[str], metadonnees: list[dict]) -> None:
+        """Indexe (ou remplace) des documents identifiés par leurs ids Chroma."""
+        if not ids:
+            return
+        segment = self._construire_segment(ids, textes, metadonnees)
+        with self._verrou:
+            self._appliquer(segment)
+            self._journaliser(segment)
+
+    def supprimer(self, ids: list[str]) -> None:
+        if not ids:
+            return
+        segment = {"supprimes": np.array(ids, dtype=str)}
+        with self._verrou:
+            self._appliquer(segment)
+            self._journaliser(segment)
+
+    def rechercher(
+        self,
+        requete: str,
+        k: int,
+        note_min: float | None = None,
+        note_max: float | None = None,
+        asin: str | list[str] | None = None,
+    ) -> list[tuple[str, float]]:
+        """
+        Retourne les k documents de meilleur score BM25 pour la requête.
+
+        Returns:
+            Liste de tuples (id, score), par score décroissant.
+        """
+        with self._verrou:
+            self._suivre_disque()
+            jetons = [t for t in tokeniser(requete) if t in self._termes]
+            termes = {self._termes[t] for t in jetons}
+            if not termes or k <= 0:
+                return []
+            codes = None
+            if asin is not None:
+                # Table de correspondance code asin -> éligible, plus rapide que np.isin
+                codes = np.zeros(len(self._codes_asin) + 1, dtype=bool)
+                codes[[self._codes_asin[a] for a in ([asin] if isinstance(asin, str) else asin) if a in self._codes_asin]] = True
+            filtrer = note_min is not None or note_max is not None or codes is not None or bool(self._morts)
+
+            tranches_docs, tranches_poids = [], []
+            niveaux = [(self._base_par_terme, self._docs, self._poids, self._notes_compilees, self._asins_compiles, 0)]
+            niveaux += [
+                (n["termes"], n["docs"], n["poids"], n["notes"], n["asins"], n["premier"]) for n in self._niveaux
+            ]
+            for par_terme, docs_niveau, poids_niveau, notes, asins, premier in niveaux:
+                for t in termes:
+                    if t not in par_terme:
+                        continue
+                    debut, fin = par_terme[t]
+                    docs, poids = docs_niveau[debut:fin], poids_niveau[debut:fin]
+                    if filtrer:
+                        masque = self._masque(docs, note_min, note_max, codes, notes, asins, premier)
+                        docs, poids = docs[masque], poids[masque]
+                    # Postings triés par impact décroissant : seuls les plus contributifs sont lus
+                    tranches_docs.append(docs[: self.max_postings])
+                    tranches_poids.append(poids[: self.max_postings])
+            if not tranches_docs:
+                return []
+            candidats = np.concatenate(tranches_docs)
+            scores = np.concatenate(tranches_poids)
+            if len(tranches_docs) > 1:
+                candidats, inverse = np.unique(candidats, return_inverse=True)
+                scores = np.bincount(inverse, weights=scores)
+
+            if len(candidats) > k:
+                meilleurs = np.argpartition(-scores, k - 1)[:k]
+                candidats, scores = candidats[meilleurs], scores[meilleurs]
+            ordre = np.argsort(-scores, kind="stable")
+            return [(self._ids[c], float(s)) for c, s in zip(candidats[ordre], scores[ordre])]
+
+    def sauvegarder(self) -> None:
+        """Compile l'index, l'écrit en une seule base et supprime les segments."""
+        with self._verrou:
+            self._compacter()
+
+    # Alias pour compatibilité avec l'interface existante
+    def save(self) -> None:
+        return self.sauvegarder()
+
+    def vider(self) -> None:
+        with self._verrou:
+            self._reinitialiser_memoire()
+            for fichier in self.chemin.glob("*.npz"):
+                fichier.unlink()
+            self._noter_etat_disque()
+
+    def statistiques(self) -> dict:
+        return {
+            "documents": len(self),
+            "termes": len(self._termes),
+            "postings": int(len(self._docs) + sum(len(n["docs"]) for n in self._niveaux)),
+            "segments": self._segments,
+        }
+
+    def __len__(self) -> int:
+        return len(self._ids) - len(self._morts)
+
+    def _reinitialiser_memoire(self) -> None:
+        self._termes: dict[str, int] = {}
+        self._ids: list[str] = []
+        self._slots: dict[str, int] = {}
+        self._longueurs: list[int] = []
+        self._notes: list[float] = []
+        self._asins: list[int] = []
+        self._codes_asin: dict[str, int] = {}
+        self._morts: set[int] = set()
+        # Masque des documents morts, indexé par slot (capacité doublée au besoin)
+        self._masque_morts = np.zeros(0, dtype=bool)
+        # Postings compilés (CSR par terme) de la base
+        self._indptr = np.zeros(1, dtype=np.int64)
+        self._docs = np.empty(0, dtype=np.int32)
+        self._tfs = np.empty(0, dtype=np.float32)
+        self._poids = np.empty(0, dtype=np.float32)
+        self._base_par_terme: dict[int, tuple[int, int]] = {}
+        self._notes_compilees = np.empty(0, dtype=np.float32)
+        self._asins_compiles = np.empty(0, dtype=np.int32)
+        # Postings ajoutés depuis la dernière compilation : bruts (pour la compilation) et compilés par segment
+        self._attente: list[tuple[np.ndarray, np.ndarray, np.ndarray]] = []
+        self._niveaux: list[dict] = []
+        # Statistiques BM25 courantes : fréquence documentaire par terme et longueur totale
+        self._df = np.zeros(0, dtype=np.int64)
+        self._longueur_totale = 0
+        self._segments = 0
+        self._segments_vus: set[str] = set()
+        self._etat_dossier: int | None = None
+        self._etat_base: tuple | None = None
+
+    @staticmethod
+    def _construire_segment(ids: list[str], textes: list[str], metadonnees: list[dict]) -> dict:
+        """Tokenise un lot de documents en postings locaux au lot, prêts à journaliser."""
+        vocabulaire: dict[str, int] = {}
+        termes, docs, tfs, longueurs = [], [], [], []
+        for i, texte in enumerate(textes):
+            jetons = tokeniser(texte)
+            longueurs.append(len(jetons))
+            for terme, tf in Counter(jetons).items():
+                termes.append(vocabulaire.setdefault(terme, len(vocabulaire)))
+                docs.append(i)
+                tfs.append(tf)
+        return {
+            "ids": np.array(ids, dtype=str),
+            "longueurs": np.array(longueurs, dtype=np.int32),
+            "notes": np.array([float(m.get("note", 0)) for m in metadonnees], dtype=np.float32),
+            "asins": np.array([str(m.get("asin", "")) for m in metadonnees], dtype=str),
+            "vocabulaire": np.array(list(vocabulaire), dtype=str),
+            "termes": np.array(termes, dtype=np.int32),
+            "docs": np.array(docs, dtype=np.int32),
+            "tfs": np.array(tfs, dtype=np.float32),
+        }
+
+    def _appliquer(self, segment: dict) -> None:
+        for id_ in segment.get("supprimes", ()):
+            self._marquer_mort(self._slots.pop(str(id_), None))
+        if "ids" not in segment:
+            return
+        premier = len(self._ids)
+        for id_ in segment["ids"]:
+            id_ = str(id_)
+            self._marquer_mort(self._slots.get(id_))
+            self._slots[id_] = len(self._ids)
+            self._ids.append(id_)
+        if len(self._masque_morts) < len(self._ids):
+            masque = np.zeros(max(2 * len(self._masque_morts), len(self._ids)), dtype=bool)
+            masque[: len(self._masque_morts)] = self._masque_morts
+            self._masque_morts = masque
+        self._longueurs.extend(segment["longueurs"].tolist())
+        self._notes.extend(segment["notes"].tolist())
+        asins = [self._codes_asin.setdefault(str(a), len(self._codes_asin)) for a in segment["asins"]]
+        self._asins.extend(asins)
+        globaux = np.array(
+            [self._termes.setdefault(str(t), len(self._termes)) for t in segment["vocabulaire"]], dtype=np.int32
+        )
+        self._longueur_totale += int(segment["longueurs"].sum())
+        if len(self._df) < len(self._termes):
+            self._df = np.concatenate([self._df, np.zeros(len(self._termes) - len(self._df), dtype=np.int64)])
+        if len(segment["termes"]):
+            termes, docs, tfs = globaux[segment["termes"]], segment["docs"] + premier, segment["tfs"]
+            self._attente.append((termes, docs, tfs))
+            np.add.at(self._df, termes, 1)
+            self._niveaux.append(
+                self._compiler_niveau(termes, docs, tfs, premier, segment, np.array(asins, dtype=np.int32))
+            )
+
+    def _marquer_mort(self, slot: int | None) -> None:
+        if slot is not None:
+            self._morts.add(slot)
+            self._masque_morts[slot] = True
+
+    def _compiler_niveau(
+        self, termes: np.ndarray, docs: np.ndarray, tfs: np.ndarray, premier: int, segment: dict, asins: np.ndarray
+    ) -> dict:
+        """Compile un segment seul (O(taille du segment)), pondéré avec les statistiques courantes de l'index."""
+        longueurs = segment["longueurs"].astype(np.float32)
+        longueur_moyenne = self._longueur_totale / max(len(self._ids), 1)
+        poids = self._bm25(termes, tfs, longueurs[docs - premier], longueur_moyenne, len(self._ids))
+        ordre = np.lexsort((-poids, termes))
+        termes = termes[ordre]
+        uniques, debuts = np.unique(termes, return_index=True)
+        fins = np.append(debuts[1:], len(termes))
+        return {
+            "termes": dict(zip(uniques.tolist(), zip(debuts.tolist(), fins.tolist()))),
+            "docs": docs[ordre].astype(np.int32),
+            "poids": poids[ordre],
+            "notes": segment["notes"],
+            "asins": asins,
+            "premier": premier,
+        }
+
+    def _bm25(
+        self, termes: np.ndarray, tfs: np.ndarray, longueurs: np.ndarray, longueur_moyenne: float, n_docs: int
+    ) -> np.ndarray:
+        df = self._df[termes].astype(np.float32)
+        idf = np.log1p((max(n_docs, 1) - df + 0.5) / (df + 0.5))
+        normes = self.k1 * (1 - self.b + self.b * longueurs / max(longueur_moyenne, 1e-6))
+        return (idf * tfs * (self.k1 + 1) / (tfs + normes)).astype(np.float32)
+
+    def _compiler(self) -> None:
+        """Fusionne les postings en attente, purge les documents morts et recalcule les poids BM25."""
+        n_termes = len(self._termes)
+        termes = np.concatenate(
+            [np.repeat(np.arange(len(self._indptr) - 1, dtype=np.int32), np.diff(self._indptr))]
+            + [p[0] for p in self._attente]
+        )
+        docs = np.concatenate([self._docs] + [p[1] for p in self._attente])
+        tfs = np.concatenate([self._tfs] + [p[2] for p in self._attente])
+        self._attente = []
+        self._niveaux = []
+
+        if self._morts:
+            # Renumérotation compacte des documents vivants
+            vivants = np.ones(len(self._ids), dtype=bool)
+            vivants[list(self._morts)] = False
+            nouveaux = np.cumsum(vivants, dtype=np.int64) - 1
+            garde = vivants[docs]
+            termes, docs, tfs = termes[garde], nouveaux[docs[garde]], tfs[garde]
+            self._ids = [id_ for id_, v in zip(self._ids, vivants) if v]
+            self._slots = {id_: i for i, id_ in enumerate(self._ids)}
+            self._longueurs = [l for l, v in zip(self._longueurs, vivants) if v]
+            self._notes = [n for n, v in zip(self._notes, vivants) if v]
+            self._asins = [a for a, v in zip(self._asins, vivants) if v]
+            self._morts = set()
+        self._masque_morts = np.zeros(len(self._ids), dtype=bool)
+
+        ordre = np.argsort(termes, kind="stable")
+        termes, self._docs, self._tfs = termes[ordre], docs[ordre].astype(np.int32), tfs[ordre]
+        self._indptr = np.zeros(n_termes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(termes, minlength=n_termes), out=self._indptr[1:])
+        self._notes_compilees = np.array(self._notes, dtype=np.float32)
+        self._asins_compiles = np.array(self._asins, dtype=np.int32)
+        self._ponderer(termes)
+
+    def _ponderer(self, termes: np.ndarray) -> None:
+        """Poids BM25 de la base, avec des statistiques exactes ; remet à jour df et la longueur totale."""
+        longueurs = np.array(self._longueurs, dtype=np.float32)
+        self._longueur_totale = int(longueurs.sum())
+        self._df = np.diff(self._indptr).astype(np.int64)
+        longueur_moyenne = float(longueurs.mean()) if len(longueurs) else 1.0
+        poids = self._bm25(termes, self._tfs, longueurs[self._docs], longueur_moyenne, len(self._ids))
+        ordre = np.lexsort((-poids, termes))
+        self._docs, self._tfs, self._poids = self._docs[ordre], self._tfs[ordre], poids[ordre]
+        non_vides = np.flatnonzero(np.diff(self._indptr))
+        self._base_par_terme = dict(
+            zip(non_vides.tolist(), zip(self._indptr[non_vides].tolist(), self._indptr[non_vides + 1].tolist()))
+        )
+
+    def _masque(
+        self,
+        docs: np.ndarray,
+        note_min: float | None,
+        note_max: float | None,
+        codes: np.ndarray | None,
+        notes: np.ndarray,
+        asins: np.ndarray,
+        premier: int,
+    ) -> np.ndarray:
+        """Documents d'une tranche qui passent les filtres ; notes et asins sont indexés par slot - premier."""
+        masque = ~self._masque_morts[docs] if self._morts else np.ones(len(docs), dtype=bool)
+        if codes is not None:
+            masque &= codes[asins[docs - premier]]
+        if note_min is not None or note_max is not None:
+            valeurs = notes[docs[masque] - premier]
+            garde = np.ones(len(valeurs), dtype=bool)
+            if note_min is not None:
+                garde &= valeurs >= note_min
+            if note_max is not None:
+                garde &= valeurs <= note_max
+            masque[masque] = garde
+        return masque
+
+    def _journaliser(self, segment: dict) -> None:
+        # Nom horodaté : les segments de plusieurs processus ne se remplacent pas et restent ordonnés
+        nom = f"{self.PREFIXE_SEGMENT}{time.time_ns():020d}_{os.getpid()}.npz"
+        self._ecrire(self.chemin / nom, segment)
+        self._segments += 1
+        self._segments_vus.add(nom)
+        # État noté avant la relecture : un segment écrit ensuite par un autre processus sera vu à la requête suivante
+        self._noter_etat_disque()
+        self._appliquer_segments()
+        if self._segments >= self.MAX_SEGMENTS:
+            self._compacter()
+
+    def _compacter(self) -> None:
+        """Fusionne dans la base tous les segments du disque, sous un verrou partagé entre processus.
+
+        Si un autre processus a réécrit la base, elle est d'abord rechargée ; les segments
+        pas encore vus sont appliqués, et seuls les segments fusionnés sont supprimés.
+        """
+        with verrou_exclusif(self.chemin / self.FICHIER_VERROU):
+            if self._etat_fichier_base() != self._etat_base:
+                self.__dict__.update(self._etat_disque())
+            else:
+                self._appliquer_segments()
+            self._fusionner()
+            # Un segment écrit pendant la fusion reste sur disque et sera appliqué par-dessus la nouvelle base
+            self._noter_etat_disque()
+            self._appliquer_segments()
+
+    def _fusionner(self) -> None:
+        self._compiler()
+        libelles = [""] * len(self._codes_asin)
+        for libelle, code in self._codes_asin.items():
+            libelles[code] = libelle
+        self._ecrire(
+            self.chemin / self.FICHIER_BASE,
+            {
+                "vocabulaire": np.array(list(self._termes), dtype=str),
+                "ids": np.array(self._ids, dtype=str),
+                "longueurs": np.array(self._longueurs, dtype=np.int32),
+                "notes": self._notes_compilees,
+                "asins": self._asins_compiles,
+                "libelles_asin": np.array(libelles, dtype=str),
+                "indptr": self._indptr,
+                "docs": self._docs,
+                "tfs": self._tfs,
+            },
+        )
+        for nom in self._segments_vus:
+            (self.chemin / nom).unlink(missing_ok=True)
+        self._segments = 0
+        self._segments_vus = set()
+
+    @staticmethod
+    def _ecrire(fichier: Path, tableaux: dict) -> None:
+        tmp = fichier.with_suffix(".tmp")
+        with open(tmp, "wb") as f:
+            np.savez(f, **tableaux)
+        tmp.replace(fichier)
+
+    def _charger(self, compacter: bool) -> None:
+        self._noter_etat_disque()
+        base = self.chemin / self.FICHIER_BASE
+        if base.exists():
+            with np.load(base) as donnees:
+                self._termes = {str(t): i for i, t in enumerate(donnees["vocabulaire"])}
+                self._ids = [str(i) for i in donnees["ids"]]
+                self._longueurs = donnees["longueurs"].tolist()
+                self._notes = donnees["notes"].tolist()
+                self._asins = donnees["asins"].tolist()
+                self._codes_asin = {str(a): i for i, a in enumerate(donnees["libelles_asin"])}
+                self._indptr, self._docs, self._tfs = donnees["indptr"], donnees["docs"], donnees["tfs"]
+            self._slots = {id_: i for i, id_ in enumerate(self._ids)}
+            self._masque_morts = np.zeros(len(self._ids), dtype=bool)
+            self._notes_compilees = np.array(self._notes, dtype=np.float32)
+            self._asins_compiles = np.array(self._asins, dtype=np.int32)
+            self._ponderer(np.repeat(np.arange(len(self._indptr) - 1, dtype=np.int32), np.diff(self._indptr)))
+
+        segments = self._appliquer_segments()
+        if segments and compacter:
+            self._compacter()
+
+    def _appliquer_segments(self) -> int:
+        """Applique les segments du disque pas encore vus ; retourne leur nombre."""
+        nouveaux = sorted(
+            f for f in self.chemin.glob(f"{self.PREFIXE_SEGMENT}*.npz") if f.name not in self._segments_vus
+        )
+        for fichier in nouveaux:
+            try:
+                with np.load(fichier) as donnees:
+                    segment = {cle: donnees[cle] for cle in donnees.files}
+            except FileNotFoundError:
+                # Segment fusionné entre-temps par la compaction d'un autre processus
+                continue
+            self._appliquer(segment)
+            self._segments_vus.add(fichier.name)
+            self._segments += 1
+        return len(nouveaux)
+
+    def _etat_fichier_base(self) -> tuple | None:
+        try:
+            etat = (self.chemin / self.FICHIER_BASE).stat()
+        except FileNotFoundError:
+            return None
+        return etat.st_ino, etat.st_mtime_ns, etat.st_size
+
+    def _noter_etat_disque(self) -> None:
+        self._etat_dossier = self.chemin.stat().st_mtime_ns
+        self._etat_base = self._etat_fichier_base()
+
+    def _suivre_disque(self) -> None:
+        """Prend en compte les écritures d'un autre processus ; un seul stat si rien n'a changé."""
+        etat_dossier = self.chemin.stat().st_mtime_ns
+        if etat_dossier == self._etat_dossier:
+            return
+        if self._etat_fichier_base() != self._etat_base:
+            # Base réécrite (compaction) : rechargement complet hors du chemin des requêtes
+            if self._rechargement is None or not self._rechargement.is_alive():
+                self._rechargement = threading.Thread(target=self._recharger, daemon=True)
+                self._rechargement.start()
+            return
+        self._etat_dossier = etat_dossier
+        self._appliquer_segments()
+
+    def _recharger(self) -> None:
+        etat = self._etat_disque()
+        with self._verrou:
+            self.__dict__.update(etat)
+
+    def _etat_disque(self) -> dict:
+        """État relu depuis le disque dans une instance à part, sans toucher à l'index courant."""
+        nouveau = LexicalIndex.__new__(LexicalIndex)
+        nouveau.chemin, nouveau.k1, nouveau.b, nouveau.max_postings = self.chemin, self.k1, self.b, self.max_postings
+        nouveau._reinitialiser_memoire()
+        nouveau._charger(compacter=False)
+        return vars(nouveau)
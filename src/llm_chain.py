@@ -1,11 +1,22 @@
-from langchain_community.llms import Ollama
-from langchain.chains import LLMChain
-from langchain.prompts import PromptTemplate
+import asyncio
+import contextvars
+import threading
+from typing import TYPE_CHECKING, Iterator
+
+import httpx
+import numpy as np
 
 import config
+from src.materialized_answers import MaterializedAnswers
+from src.metrics import metriques
+from src.ollama_client import AsyncOllamaClient
 from src.prompts import REVIEW_QA_PROMPT, FAQ_PROMPT, SUMMARIZE_PROMPT
+from src.response_cache import ResponseCache
 from src.retriever import ReviewRetriever
 
+if TYPE_CHECKING:
+    from langchain_core.language_models.llms import BaseLLM
+
 
 class ReviewQAChain:
     """Pipeline RAG complet : récupère les avis puis génère une réponse avec Llama."""
@@ -25,45 +36,322 @@ class ReviewQAChain:
         retriever: ReviewRetriever | None = None,
         model: str = config.OLLAMA_MODEL,
         base_url: str = config.OLLAMA_BASE_URL,
+        cache: ResponseCache | None = None,
+        max_concurrence: int = config.OLLAMA_MAX_CONCURRENCY,
+        timeout: float = config.OLLAMA_TIMEOUT_SECONDS,
+        materialisees: MaterializedAnswers | None = None,
+        llm: "BaseLLM | None" = None,
     ):
+        # Imports différés : langchain n'est chargé qu'à la construction de la chaîne
+        from langchain.chains import LLMChain
+        from langchain.prompts import PromptTemplate
+        from langchain_community.llms import Ollama
+
         self.retriever = retriever or ReviewRetriever()
-        self.llm = Ollama(model=model, base_url=base_url)
+        self.materialisees = materialisees
+        # Un autre LLM LangChain (factice dans les benchmarks) peut remplacer Ollama
+        self.llm = llm or Ollama(
+            model=model, base_url=base_url, timeout=timeout, keep_alive=config.OLLAMA_KEEP_ALIVE
+        )
+        self.cache = cache
+        self.client_async = AsyncOllamaClient(
+            model=model, base_url=base_url, max_concurrence=max_concurrence, timeout=timeout
+        )
+        self.templates = {
+            mode: PromptTemplate(input_variables=["context", "question"], template=template)
+            for mode, template in self.MAP_PROMPTS.items()
+        }
+        self.chaines = {mode: LLMChain(llm=self.llm, prompt=t) for mode, t in self.templates.items()}
 
     def executer(
         self,
         question: str,
         mode: str = MODE_QA,
         filtre_note: float | None = None,
+        asin: str | None = None,
     ) -> dict:
         """
         Exécute le pipeline RAG complet.
 
+        Si un cache de réponses est configuré, une question déjà posée (ou assez proche)
+        pour le même mode, les mêmes filtres et la même version de l'index est servie
+        sans appel au LLM. Le résumé et la FAQ standard d'un produit sont servis depuis
+        les réponses matérialisées lorsqu'elles existent.
+
         Retourne :
-            Dict avec les clés : reponse, sources (liste des avis récupérés).
+            Dict avec les clés : reponse, sources (liste des avis récupérés), plus timings
+            (durée en ms de chaque étape) si les métriques sont activées.
         """
-        if mode not in self.MAP_PROMPTS:
-            raise ValueError(f"Mode inconnu '{mode}'. Choisir parmi : {list(self.MAP_PROMPTS)}")
+        self._verifier_mode(mode)
+        with metriques.requete() as durees:
+            reponse = self._executer(question, mode, filtre_note, asin)
+        return self._avec_durees(reponse, durees)
 
-        resultats = self.retriever.rechercher(question, filtre_note=filtre_note)
-        contexte = self.retriever.formater_contexte(resultats)
+    # Alias pour compatibilité avec l'interface existante
+    def run(
+        self,
+        question: str,
+        mode: str = MODE_QA,
+        filter_rating: float | None = None,
+        asin: str | None = None,
+    ) -> dict:
+        return self.executer(question, mode=mode, filtre_note=filter_rating, asin=asin)
 
-        template_prompt = PromptTemplate(
-            input_variables=["context", "question"],
-            template=self.MAP_PROMPTS[mode],
-        )
-        chaine = LLMChain(llm=self.llm, prompt=template_prompt)
-        reponse = chaine.run(context=contexte, question=question)
+    async def aexecuter(
+        self,
+        question: str,
+        mode: str = MODE_QA,
+        filtre_note: float | None = None,
+        asin: str | None = None,
+    ) -> dict:
+        """
+        Variante asynchrone de executer.
 
-        return {
-            "answer": reponse.strip(),
-            "sources": resultats,
-        }
+        La recherche s'exécute dans un thread ; la génération passe par le pool de
+        connexions partagé vers Ollama, borné à max_concurrence requêtes en vol.
+        """
+        self._verifier_mode(mode)
+        with metriques.requete() as durees:
+            reponse = await self._aexecuter(question, mode, filtre_note, asin)
+        return self._avec_durees(reponse, durees)
 
     # Alias pour compatibilité avec l'interface existante
-    def run(
+    async def arun(
         self,
         question: str,
         mode: str = MODE_QA,
         filter_rating: float | None = None,
+        asin: str | None = None,
     ) -> dict:
-        return self.executer(question, mode=mode, filtre_note=filter_rating)
+        return await self.aexecuter(question, mode=mode, filtre_note=filter_rating, asin=asin)
+
+    async def afermer(self) -> None:
+        await self.client_async.fermer()
+
+    def executer_flux(
+        self,
+        question: str,
+        mode: str = MODE_QA,
+        filtre_note: float | None = None,
+        asin: str | None = None,
+    ) -> Iterator[dict]:
+        """
+        Variante en flux de executer : produit les sources dès la recherche terminée,
+        puis les morceaux de réponse au fil de la génération.
+
+        Produit :
+            {"type": "sources", "sources": [...]} une fois, puis des {"type": "token", "texte": "..."},
+            plus un dernier {"type": "timings", "timings": {...}} si les métriques sont activées.
+        """
+        self._verifier_mode(mode)
+        # Chaque étape s'exécute dans un contexte propre au flux : les durées de la requête
+        # ne se mélangent pas à celles du code qui consomme le flux entre deux événements
+        contexte = contextvars.copy_context()
+        flux = self._executer_flux(question, mode, filtre_note, asin)
+        try:
+            while True:
+                try:
+                    evenement = contexte.run(next, flux)
+                except StopIteration:
+                    return
+                yield evenement
+        finally:
+            contexte.run(flux.close)
+
+    def _executer_flux(
+        self, question: str, mode: str, filtre_note: float | None, asin: str | None
+    ) -> Iterator[dict]:
+        with metriques.requete() as durees:
+            yield from self._flux(question, mode, filtre_note, asin)
+        if durees is not None:
+            yield {"type": "timings", "timings": durees}
+
+    def _flux(self, question: str, mode: str, filtre_note: float | None, asin: str | None) -> Iterator[dict]:
+        materialisee = self._consulter_materialisees(question, mode, filtre_note, asin)
+        if materialisee is not None:
+            yield {"type": "sources", "sources": materialisee["sources"], "materialized": True}
+            yield {"type": "token", "texte": materialisee["answer"]}
+            return
+        reponse, cle, vecteur = self._consulter_cache(question, mode, filtre_note, asin)
+        if reponse is not None:
+            yield {"type": "sources", "sources": reponse["sources"]}
+            yield {"type": "token", "texte": reponse["answer"]}
+            return
+
+        with metriques.span("recherche"):
+            resultats = self.retriever.rechercher(
+                question, filtre_note=filtre_note, asin=asin, vecteur_requete=vecteur
+            )
+        yield {"type": "sources", "sources": resultats}
+
+        prompt, mesures = self._construire_prompt(question, mode, resultats)
+        morceaux = []
+        for morceau in metriques.chronometrer("generation", self.llm.stream(prompt), cumuler=True):
+            morceaux.append(morceau)
+            yield {"type": "token", "texte": morceau}
+        self._memoriser(cle, question, self._reponse("".join(morceaux), resultats, mesures), vecteur)
+
+    # Alias pour compatibilité avec l'interface existante
+    def stream(
+        self,
+        question: str,
+        mode: str = MODE_QA,
+        filter_rating: float | None = None,
+        asin: str | None = None,
+    ) -> Iterator[dict]:
+        return self.executer_flux(question, mode=mode, filtre_note=filter_rating, asin=asin)
+
+    def executer_lot(
+        self,
+        questions: list[str],
+        mode: str = MODE_QA,
+        filtre_note: float | None = None,
+        asin: str | None = None,
+    ) -> list[dict]:
+        """
+        Exécute le pipeline pour plusieurs questions, avec une seule recherche par lot.
+        Ni le cache ni les réponses matérialisées ne sont consultés.
+
+        Retourne :
+            Une liste de dicts (reponse, sources), dans l'ordre des questions.
+        """
+        self._verifier_mode(mode)
+        lots = self.retriever.rechercher_lot(questions, filtre_note=filtre_note, asin=asin)
+        return [self._generer(q, mode, resultats) for q, resultats in zip(questions, lots)]
+
+    # Alias pour compatibilité avec l'interface existante
+    def run_batch(
+        self,
+        questions: list[str],
+        mode: str = MODE_QA,
+        filter_rating: float | None = None,
+        asin: str | None = None,
+    ) -> list[dict]:
+        return self.executer_lot(questions, mode=mode, filtre_note=filter_rating, asin=asin)
+
+    def prechauffer(self, ping_ollama: bool = config.WARMUP_OLLAMA_PING) -> threading.Thread:
+        """
+        Prépare en arrière-plan ce que la première question paierait sinon.
+
+        Charge et fait tourner une fois le modèle d'embedding (et le reranker s'il y en a un) ;
+        si ping_ollama est vrai, demande à Ollama de charger le modèle de génération en mémoire
+        et de l'y garder OLLAMA_KEEP_ALIVE. Un Ollama injoignable est ignoré.
+        """
+        thread = threading.Thread(target=self._prechauffer, args=(ping_ollama,), daemon=True)
+        thread.start()
+        return thread
+
+    # Alias pour compatibilité avec l'interface existante
+    def warm_up(self, ping_ollama: bool = config.WARMUP_OLLAMA_PING) -> threading.Thread:
+        return self.prechauffer(ping_ollama)
+
+    def _prechauffer(self, ping_ollama: bool) -> None:
+        with metriques.span("prechauffage"):
+            self.retriever.store.embedder.encoder_requete("Préchauffage du modèle d'embedding.")
+            if self.retriever.reranker is not None:
+                self.retriever.reranker.prechauffer()
+        if ping_ollama:
+            try:
+                # Requête sans prompt : Ollama charge le modèle et le garde chargé keep_alive
+                httpx.post(
+                    f"{self.client_async.base_url}/api/generate",
+                    json={"model": self.client_async.model, "keep_alive": config.OLLAMA_KEEP_ALIVE},
+                    timeout=self.client_async.timeout,
+                ).raise_for_status()
+            except httpx.HTTPError:
+                pass
+
+    def _executer(self, question: str, mode: str, filtre_note: float | None, asin: str | None) -> dict:
+        materialisee = self._consulter_materialisees(question, mode, filtre_note, asin)
+        if materialisee is not None:
+            return materialisee
+        reponse, cle, vecteur = self._consulter_cache(question, mode, filtre_note, asin)
+        if reponse is not None:
+            return reponse
+        with metriques.span("recherche"):
+            resultats = self.retriever.rechercher(
+                question, filtre_note=filtre_note, asin=asin, vecteur_requete=vecteur
+            )
+        reponse = self._generer(question, mode, resultats)
+        self._memoriser(cle, question, reponse, vecteur)
+        return reponse
+
+    async def _aexecuter(self, question: str, mode: str, filtre_note: float | None, asin: str | None) -> dict:
+        materialisee = self._consulter_materialisees(question, mode, filtre_note, asin)
+        if materialisee is not None:
+            return materialisee
+        reponse, cle, vecteur = await asyncio.to_thread(
+            self._consulter_cache, question, mode, filtre_note, asin
+        )
+        if reponse is not None:
+            return reponse
+        with metriques.span("recherche"):
+            resultats = await asyncio.to_thread(
+                self.retriever.rechercher,
+                question,
+                filtre_note=filtre_note,
+                asin=asin,
+                vecteur_requete=vecteur,
+            )
+        prompt, mesures = self._construire_prompt(question, mode, resultats)
+        with metriques.span("generation"):
+            texte = await self.client_async.generer(prompt)
+        reponse = self._reponse(texte, resultats, mesures)
+        self._memoriser(cle, question, reponse, vecteur)
+        return reponse
+
+    def _verifier_mode(self, mode: str) -> None:
+        if mode not in self.MAP_PROMPTS:
+            raise ValueError(f"Mode inconnu '{mode}'. Choisir parmi : {list(self.MAP_PROMPTS)}")
+
+    def _consulter_materialisees(
+        self, question: str, mode: str, filtre_note: float | None, asin: str | None
+    ) -> dict | None:
+        """Réponse pré-calculée : résumé ou question de la FAQ standard d'un seul produit, sans filtre de note."""
+        if self.materialisees is None or mode == self.MODE_QA or filtre_note is not None or not isinstance(asin, str):
+            return None
+        return self.materialisees.chercher(asin, mode, "" if mode == self.MODE_RESUME else question)
+
+    def _consulter_cache(
+        self, question: str, mode: str, filtre_note: float | None, asin: str | None
+    ) -> tuple[dict | None, tuple | None, np.ndarray | None]:
+        """Retourne (réponse en cache, clé de cache, embedding de la question) ; tout à None sans cache."""
+        if self.cache is None:
+            return None, None, None
+        cle = (mode, (filtre_note, asin), self.retriever.store.version)
+        with metriques.span("encodage_requete"):
+            vecteur = self.retriever.store.planificateur.encoder_requete(question)
+        with metriques.span("cache"):
+            return self.cache.chercher(*cle, question, vecteur), cle, vecteur
+
+    def _memoriser(self, cle: tuple | None, question: str, reponse: dict, vecteur: np.ndarray | None) -> None:
+        if cle is not None:
+            self.cache.stocker(*cle, question, reponse, vecteur)
+
+    def _construire_prompt(self, question: str, mode: str, resultats: list[dict]) -> tuple[str, dict]:
+        contexte, mesures = self._contexte(resultats)
+        return self.templates[mode].format(context=contexte, question=question), mesures
+
+    def _generer(self, question: str, mode: str, resultats: list[dict]) -> dict:
+        contexte, mesures = self._contexte(resultats)
+        with metriques.span("generation"):
+            reponse = self.chaines[mode].run(context=contexte, question=question)
+        return self._reponse(reponse, resultats, mesures)
+
+    def _contexte(self, resultats: list[dict]) -> tuple[str, dict]:
+        """Texte du contexte et mesures du constructeur de contexte (vides sans constructeur)."""
+        construit = self.retriever.construire_contexte(resultats)
+        return construit["contexte"], {k: v for k, v in construit.items() if k != "contexte"}
+
+    @staticmethod
+    def _reponse(texte: str, resultats: list[dict], mesures: dict) -> dict:
+        """Dict de réponse ; context_stats n'est présent qu'avec un constructeur de contexte."""
+        reponse = {"answer": texte.strip(), "sources": resultats}
+        if mesures:
+            reponse["context_stats"] = mesures
+        return reponse
+
+    @staticmethod
+    def _avec_durees(reponse: dict, durees: dict[str, float] | None) -> dict:
+        """Ajoute le détail des durées à une copie de la réponse (la réponse en cache n'est pas modifiée)."""
+        return reponse if durees is None else {**reponse, "timings": durees}
@@ -0,0 +1,83 @@
+import json
+import os
+import time
+from pathlib import Path
+from urllib.parse import quote, unquote
+
+import config
+from src.response_cache import ResponseCache
+
+
+class MaterializedAnswers:
+    """Réponses pré-calculées par produit (résumé, FAQ standard), un fichier JSON par asin.
+
+    Chaque fichier porte l'empreinte du contenu indexé du produit au moment de la
+    génération, ce qui permet au job de matérialisation de ne régénérer que les
+    produits dont les avis ont changé. Les fichiers sont relus lorsqu'ils ont été
+    réécrits par un autre processus.
+    """
+
+    def __init__(self, chemin: str = config.MATERIALIZED_PATH):
+        self.chemin = Path(chemin)
+        self.chemin.mkdir(parents=True, exist_ok=True)
+        self._entrees: dict[str, tuple[float, dict]] = {}
+
+    def chercher(self, asin: str, mode: str, question: str) -> dict | None:
+        """Retourne la réponse matérialisée (answer, sources) pour ce produit, ce mode et cette question, sinon None."""
+        entree = self._lire(asin)
+        if entree is None:
+            return None
+        reponse = entree["reponses"].get(mode, {}).get(ResponseCache.normaliser(question))
+        if reponse is None:
+            return None
+        return {**reponse, "materialized": True}
+
+    # Alias pour compatibilité avec l'interface existante
+    def lookup(self, asin: str, mode: str, question: str) -> dict | None:
+        return self.chercher(asin, mode, question)
+
+    def empreinte(self, asin: str) -> str | None:
+        entree = self._lire(asin)
+        return None if entree is None else entree["empreinte"]
+
+    def ecrire(self, asin: str, empreinte: str, reponses: dict[str, dict[str, dict]]) -> None:
+        """Enregistre les réponses d'un produit, par mode puis par question ; remplace les précédentes."""
+        entree = {
+            "asin": asin,
+            "empreinte": empreinte,
+            "genere_le": time.time(),
+            "reponses": {
+                mode: {ResponseCache.normaliser(q): r for q, r in par_question.items()}
+                for mode, par_question in reponses.items()
+            },
+        }
+        fichier = self._fichier(asin)
+        temporaire = fichier.with_suffix(".tmp")
+        with open(temporaire, "w", encoding="utf-8") as f:
+            json.dump(entree, f, ensure_ascii=False)
+        os.replace(temporaire, fichier)
+        self._entrees.pop(asin, None)
+
+    def supprimer(self, asin: str) -> None:
+        self._fichier(asin).unlink(missing_ok=True)
+        self._entrees.pop(asin, None)
+
+    def asins(self) -> list[str]:
+        return [unquote(f.stem) for f in self.chemin.glob("*.json")]
+
+    def _fichier(self, asin: str) -> Path:
+        return self.chemin / f"{quote(asin, safe='')}.json"
+
+    def _lire(self, asin: str) -> dict | None:
+        fichier = self._fichier(asin)
+        try:
+            modifie = fichier.stat().st_mtime_ns
+        except FileNotFoundError:
+            self._entrees.pop(asin, None)
+            return None
+        en_memoire = self._entrees.get(asin)
+        if en_memoire is None or en_memoire[0] != modifie:
+            with open(fichier, encoding="utf-8") as f:
+                en_memoire = (modifie, json.load(f))
+            self._entrees[asin] = en_memoire
+        return en_memoire[1]
@@ -0,0 +1,105 @@
+from typing import Callable
+
+import config
+from src.llm_chain import ReviewQAChain
+from src.materialized_answers import MaterializedAnswers
+from src.prompts import REDUCE_SUMMARIZE_PROMPT
+
+
+class MaterializationJob:
+    """Pré-calcule le résumé et la FAQ standard de chaque produit de la base.
+
+    Un produit n'est régénéré que si l'empreinte de ses morceaux indexés a changé
+    depuis la dernière matérialisation. Le résumé d'un produit trop gros pour un
+    seul appel est hiérarchique : chaque groupe de morceaux est résumé (map), puis
+    les résumés partiels sont fusionnés jusqu'à n'en garder qu'un (reduce). Les
+    réponses FAQ passent par la recherche filtrée sur le produit, comme en ligne.
+    """
+
+    def __init__(
+        self,
+        chaine: ReviewQAChain,
+        reponses: MaterializedAnswers | None = None,
+        questions_faq: list[str] = config.MATERIALIZED_FAQ_QUESTIONS,
+        morceaux_par_appel: int = config.MATERIALIZATION_MAP_CHUNKS,
+        resumes_par_fusion: int = config.MATERIALIZATION_REDUCE_FANIN,
+        max_concurrence: int = config.OLLAMA_MAX_CONCURRENCY,
+    ):
+        self.chaine = chaine
+        self.reponses = reponses or MaterializedAnswers()
+        self.questions_faq = list(questions_faq)
+        self.morceaux_par_appel = morceaux_par_appel
+        self.resumes_par_fusion = max(2, resumes_par_fusion)
+        self.max_concurrence = max_concurrence
+
+    def executer(
+        self,
+        asins: list[str] | None = None,
+        forcer: bool = False,
+        progression: Callable[[str, int, int], None] | None = None,
+    ) -> dict:
+        """
+        Matérialise les produits indiqués (tous par défaut).
+
+        Sans liste d'asins, les réponses des produits qui ne sont plus dans la base sont supprimées.
+
+        Returns:
+            Dict avec les clés : produits, generes, inchanges, supprimes.
+        """
+        store = self.chaine.retriever.store
+        empreintes = store.empreintes_produits()
+        cibles = [a for a in (asins if asins is not None else sorted(empreintes)) if a in empreintes]
+        generes = inchanges = supprimes = 0
+        for i, asin in enumerate(cibles, 1):
+            if not forcer and self.reponses.empreinte(asin) == empreintes[asin]:
+                inchanges += 1
+            else:
+                self.reponses.ecrire(asin, empreintes[asin], self.materialiser(asin))
+                generes += 1
+            if progression is not None:
+                progression(asin, i, len(cibles))
+        if asins is None:
+            for asin in self.reponses.asins():
+                if asin not in empreintes:
+                    self.reponses.supprimer(asin)
+                    supprimes += 1
+        return {"produits": len(cibles), "generes": generes, "inchanges": inchanges, "supprimes": supprimes}
+
+    # Alias pour compatibilité avec l'interface existante
+    def run(self, asins: list[str] | None = None, force: bool = False) -> dict:
+        return self.executer(asins, forcer=force)
+
+    def materialiser(self, asin: str) -> dict[str, dict[str, dict]]:
+        """Génère les réponses d'un produit, par mode puis par question."""
+        documents = self.chaine.retriever.store.documents_produit(asin)
+        faq = self.chaine.executer_lot(self.questions_faq, mode=ReviewQAChain.MODE_FAQ, asin=asin)
+        return {
+            ReviewQAChain.MODE_RESUME: {"": {"answer": self.resumer(documents), "sources": []}},
+            ReviewQAChain.MODE_FAQ: dict(zip(self.questions_faq, faq)),
+        }
+
+    def resumer(self, documents: list[dict]) -> str:
+        """Résumé des morceaux d'un produit, hiérarchique au-delà de morceaux_par_appel morceaux."""
+        template = self.chaine.templates[ReviewQAChain.MODE_RESUME]
+        groupes = [
+            documents[i: i + self.morceaux_par_appel] for i in range(0, len(documents), self.morceaux_par_appel)
+        ] or [[]]
+        resumes = self._generer(
+            [template.format(context=self.chaine.retriever.formater_contexte(g), question="") for g in groupes]
+        )
+        while len(resumes) > 1:
+            resumes = self._generer(
+                [
+                    REDUCE_SUMMARIZE_PROMPT.format(
+                        context="\n\n".join(
+                            f"[Résumé {j}]\n{r}" for j, r in enumerate(resumes[i: i + self.resumes_par_fusion], 1)
+                        )
+                    )
+                    for i in range(0, len(resumes), self.resumes_par_fusion)
+                ]
+            )
+        return resumes[0]
+
+    def _generer(self, prompts: list[str]) -> list[str]:
+        reponses = self.chaine.llm.batch(prompts, config={"max_concurrency": self.max_concurrence})
+        return [r.strip() for r in reponses]
@@ -0,0 +1,189 @@
+import bisect
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Iterable, Iterator, TypeVar
+
+import config
+
+
+T = TypeVar("T")
+
+# Durées de la requête en cours, par étape ; None hors requête
+_durees_requete: contextvars.ContextVar[dict[str, float] | None] = contextvars.ContextVar(
+    "durees_requete", default=None
+)
+
+
+class _Span:
+    __slots__ = ("metriques", "etape", "debut")
+
+    def __init__(self, metriques: "PipelineMetrics", etape: str):
+        self.metriques = metriques
+        self.etape = etape
+
+    def __enter__(self) -> None:
+        self.debut = time.perf_counter()
+
+    def __exit__(self, *exc) -> None:
+        self.metriques.enregistrer(self.etape, time.perf_counter() - self.debut)
+
+
+class PipelineMetrics:
+    """Durées des étapes du pipeline RAG (requêtes et ingestion), en histogrammes Prometheus.
+
+    Chaque étape est chronométrée par un span ; les durées alimentent les
+    histogrammes agrégés et, à l'intérieur d'un bloc requete(), le détail de la
+    requête en cours. Désactivé, un span est un contexte vide partagé : le coût
+    se limite à un appel de méthode.
+    """
+
+    NOM = "rag_stage_duration_seconds"
+
+    def __init__(self, actif: bool = config.METRICS_ENABLED, seuils_ms: list[float] = config.METRICS_BUCKETS_MS):
+        self.actif = actif
+        self.seuils = [s / 1000 for s in sorted(seuils_ms)]
+        self._histogrammes: dict[str, list] = {}
+        self._verrou = threading.Lock()
+        self._nul = nullcontext()
+
+    def span(self, etape: str):
+        """Contexte chronométrant une étape."""
+        if not self.actif:
+            return self._nul
+        return _Span(self, etape)
+
+    def chronometrer(self, etape: str, elements: Iterable[T], cumuler: bool = False) -> Iterable[T]:
+        """
+        Itère sur elements en chronométrant la production de chaque élément (générateurs paresseux).
+
+        Avec cumuler, une seule durée est enregistrée en fin d'itération : la somme des
+        temps de production, sans le temps passé par le consommateur entre deux éléments.
+        """
+        if not self.actif:
+            return elements
+        return self._chronometrer(etape, iter(elements), cumuler)
+
+    @contextmanager
+    def requete(self) -> Iterator[dict[str, float] | None]:
+        """
+        Collecte les durées (ms) des étapes exécutées dans le bloc, plus la clé total.
+
+        Les étapes exécutées dans un thread lancé par asyncio.to_thread sont incluses.
+        Produit None si les métriques sont désactivées.
+        """
+        if not self.actif:
+            yield None
+            return
+        durees: dict[str, float] = {}
+        jeton = _durees_requete.set(durees)
+        debut = time.perf_counter()
+        try:
+            yield durees
+        finally:
+            _durees_requete.reset(jeton)
+            durees["total"] = (time.perf_counter() - debut) * 1000
+
+    def enregistrer(self, etape: str, duree: float) -> None:
+        """Ajoute une durée (secondes) à l'histogramme de l'étape et au détail de la requête en cours."""
+        durees = _durees_requete.get()
+        if durees is not None:
+            durees[etape] = durees.get(etape, 0.0) + duree * 1000
+        position = bisect.bisect_left(self.seuils, duree)
+        with self._verrou:
+            histogramme = self._histogrammes.setdefault(etape, [[0] * (len(self.seuils) + 1), 0.0, 0])
+            histogramme[0][position] += 1
+            histogramme[1] += duree
+            histogramme[2] += 1
+
+    def statistiques(self) -> dict:
+        """Nombre d'appels et durée moyenne (ms) par étape."""
+        with self._verrou:
+            return {
+                etape: {"appels": n, "moyenne_ms": total / n * 1000}
+                for etape, (_, total, n) in sorted(self._histogrammes.items())
+            }
+
+    def exporter(self) -> str:
+        """Histogrammes au format texte d'exposition Prometheus."""
+        lignes = [
+            f"# HELP {self.NOM} Durée des étapes du pipeline RAG.",
+            f"# TYPE {self.NOM} histogram",
+        ]
+        with self._verrou:
+            for etape, (comptes, total, n) in sorted(self._histogrammes.items()):
+                cumul = 0
+                for seuil, compte in zip([*map(repr, self.seuils), "+Inf"], comptes):
+                    cumul += compte
+                    lignes.append(f'{self.NOM}_bucket{{stage="{etape}",le="{seuil}"}} {cumul}')
+                lignes.append(f'{self.NOM}_sum{{stage="{etape}"}} {total!r}')
+                lignes.append(f'{self.NOM}_count{{stage="{etape}"}} {n}')
+        return "\n".join(lignes) + "\n"
+
+    # Alias pour compatibilité avec l'interface existante
+    def export(self) -> str:
+        return self.exporter()
+
+    def ecrire(self, chemin: str | None = config.METRICS_FILE_PATH) -> None:
+        """Écrit l'export dans un fichier, de façon atomique (collecteur textfile de node_exporter)."""
+        if chemin is None:
+            return
+        Path(chemin).parent.mkdir(parents=True, exist_ok=True)
+        temporaire = f"{chemin}.tmp"
+        with open(temporaire, "w", encoding="utf-8") as f:
+            f.write(self.exporter())
+        os.replace(temporaire, chemin)
+
+    def servir(self, port: int = config.METRICS_PORT, hote: str = "127.0.0.1") -> ThreadingHTTPServer:
+        """Expose l'export sur http://hote:port/metrics depuis un thread démon."""
+        metriques = self
+
+        class _Gestionnaire(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                corps = metriques.exporter().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(corps)))
+                self.end_headers()
+                self.wfile.write(corps)
+
+            def log_message(self, *args):
+                pass
+
+        serveur = ThreadingHTTPServer((hote, port), _Gestionnaire)
+        threading.Thread(target=serveur.serve_forever, daemon=True).start()
+        return serveur
+
+    def reinitialiser(self) -> None:
+        with self._verrou:
+            self._histogrammes.clear()
+
+    def _chronometrer(self, etape: str, iterateur: Iterator[T], cumuler: bool) -> Iterator[T]:
+        total = 0.0
+        try:
+            while True:
+                debut = time.perf_counter()
+                try:
+                    element = next(iterateur)
+                except StopIteration:
+                    total += time.perf_counter() - debut
+                    return
+                if cumuler:
+                    total += time.perf_counter() - debut
+                else:
+                    self.enregistrer(etape, time.perf_counter() - debut)
+                yield element
+        finally:
+            if cumuler:
+                self.enregistrer(etape, total)
+
+
+# Instance partagée par tous les modules du pipeline
+metriques = PipelineMetrics()
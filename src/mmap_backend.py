@@ -0,0 +1,815 @@
+import hashlib
+import heapq
+import json
+import shutil
+import threading
+from functools import reduce
+from pathlib import Path
+from typing import BinaryIO
+
+import numpy as np
+
+import config
+from src.file_lock import essayer_verrou_exclusif, verrou_partage
+
+
+_ID = np.dtype("S32")
+_COMPARAISONS = {
+    "$eq": np.equal,
+    "$ne": np.not_equal,
+    "$gt": np.greater,
+    "$gte": np.greater_equal,
+    "$lt": np.less,
+    "$lte": np.less_equal,
+}
+# Nombre de bits à 1 de chaque octet, pour la distance de Hamming des codes binaires
+_POPCOUNT = np.unpackbits(np.arange(256, dtype=np.uint8)[:, np.newaxis], axis=1).sum(axis=1).astype(np.uint16)
+QUANTIFICATIONS = (None, "int8", "binaire")
+
+
+def _popcount64(x: np.ndarray) -> np.ndarray:
+    """Nombre de bits à 1 de chaque mot de 64 bits (algorithme SWAR, sans table)."""
+    x = x - ((x >> np.uint64(1)) & np.uint64(0x5555555555555555))
+    x = (x & np.uint64(0x3333333333333333)) + ((x >> np.uint64(2)) & np.uint64(0x3333333333333333))
+    x = (x + (x >> np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    return (x * np.uint64(0x0101010101010101)) >> np.uint64(56)
+
+
+def quantifier_int8(vecteurs: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Quantification scalaire par vecteur : codes int8 et échelle float32 (v ≈ codes * échelle)."""
+    echelles = np.abs(vecteurs).max(axis=1) / 127.0 + 1e-12
+    codes = np.rint(vecteurs / echelles[:, np.newaxis]).astype(np.int8)
+    return codes, echelles.astype(np.float32)
+
+
+def binariser(vecteurs: np.ndarray) -> np.ndarray:
+    """Codes binaires : un bit de signe par dimension, empaquetés en octets."""
+    return np.packbits(vecteurs > 0, axis=1)
+
+
+class _Partition:
+    """Morceaux d'un même asin, stockés dans des fichiers en ajout seul.
+
+    vecteurs.f32 (lu par mmap), ids.s32, notes.f32 et offsets.i64 ont une ligne par
+    morceau ; lignes.jsonl contient le texte et les métadonnées. Les morceaux
+    remplacés ou supprimés sont listés dans morts.i64 jusqu'au prochain compactage,
+    qui réécrit la partition dans un nouveau dossier. Une partition chargée tient un
+    verrou partagé sur le fichier .lecteurs de son dossier, qui n'est supprimé qu'une
+    fois libéré par tous les processus.
+    Avec une quantification, codes.i8 et echelles.f32 (int8) ou codes.u8 (binaire)
+    servent au premier passage de la recherche ; vecteurs.f32 n'est lu que pour reclasser.
+    Avec un index IVF, listes.i32 donne la liste de chaque ligne ; une partition compactée
+    est réécrite dans l'ordre des listes et debuts.i64 donne la tranche de chaque liste.
+    Les lignes ajoutées ensuite forment une fin non triée, filtrée par liste.
+    """
+
+    BLOC = 1024
+    FICHIER_LECTEURS = ".lecteurs"
+
+    def __init__(
+        self,
+        dossier: Path,
+        asin: str,
+        dimension: int,
+        quantification: str | None = None,
+        n_vivants: int | None = None,
+    ):
+        self.dossier = dossier
+        self.asin = asin
+        self.dimension = dimension
+        self.quantification = quantification
+        self.dossier.mkdir(parents=True, exist_ok=True)
+        self._charge = False
+        self._lignes: list[dict] | None = None
+        self._lecteur: BinaryIO | None = None
+        # Nombre de morceaux vivants, connu par meta.json sans charger la partition
+        self._n_vivants = n_vivants
+
+    def charger(self) -> None:
+        if self._charge:
+            return
+        if self._lecteur is None:
+            self._lecteur = verrou_partage(self.dossier / self.FICHIER_LECTEURS)
+        self.ids = self._lire("ids.s32", _ID)
+        self.notes = self._lire("notes.f32", np.float32)
+        self.offsets = self._lire("offsets.i64", np.int64)
+        self.listes = self._lire("listes.i32", np.int32) if (self.dossier / "listes.i32").exists() else None
+        self.debuts = self._lire("debuts.i64", np.int64) if (self.dossier / "debuts.i64").exists() else None
+        self.vivants = np.ones(len(self.ids), dtype=bool)
+        self.vivants[self._lire("morts.i64", np.int64)] = False
+        self._n_vivants = int(self.vivants.sum())
+        if len(self.ids):
+            self.vecteurs = np.memmap(
+                self.dossier / "vecteurs.f32", dtype=np.float32, mode="r", shape=(len(self.ids), self.dimension)
+            )
+        else:
+            self.vecteurs = np.empty((0, self.dimension), dtype=np.float32)
+        self._charge = True
+        if self.quantification is not None:
+            self._charger_codes()
+
+    def __len__(self) -> int:
+        self.charger()
+        return len(self.ids)
+
+    def nb_vivants(self) -> int:
+        if self._n_vivants is None:
+            self.charger()
+        return self._n_vivants
+
+    def signature(self) -> list[int]:
+        """Tailles de ids.s32 et morts.i64 : si elles ont changé, le nombre de vivants de meta.json est périmé."""
+        fichiers = [self.dossier / nom for nom in ("ids.s32", "morts.i64")]
+        return [f.stat().st_size if f.exists() else 0 for f in fichiers]
+
+    def ajouter(
+        self,
+        ids: np.ndarray,
+        vecteurs: np.ndarray,
+        documents: list[str],
+        metadonnees: list[dict],
+        listes: np.ndarray | None,
+    ) -> int:
+        """Ajoute des morceaux en fin de partition ; retourne l'indice de la première ligne ajoutée."""
+        self.charger()
+        premier = len(self.ids)
+        n_vivants = self._n_vivants + len(ids)
+        fichier_lignes = self.dossier / "lignes.jsonl"
+        debut = fichier_lignes.stat().st_size if fichier_lignes.exists() else 0
+        lignes = [
+            json.dumps({"document": d, "metadata": m}, ensure_ascii=False).encode("utf-8") + b"\n"
+            for d, m in zip(documents, metadonnees)
+        ]
+        offsets = debut + np.concatenate([[0], np.cumsum([len(l) for l in lignes[:-1]], dtype=np.int64)])
+        with open(fichier_lignes, "ab") as f:
+            f.writelines(lignes)
+        vecteurs = np.ascontiguousarray(vecteurs, dtype=np.float32)
+        self._ajouter("vecteurs.f32", vecteurs)
+        if self.quantification is not None and self._codes_complets():
+            self._ajouter_codes(vecteurs)
+        self._ajouter("ids.s32", ids.astype(_ID))
+        self._ajouter("notes.f32", np.array([float(m.get("note", 0) or 0) for m in metadonnees], dtype=np.float32))
+        self._ajouter("offsets.i64", offsets.astype(np.int64))
+        if listes is not None and (premier == 0 or self.listes is not None):
+            self._ajouter("listes.i32", listes.astype(np.int32))
+        self._invalider()
+        self._n_vivants = n_vivants
+        return premier
+
+    def lignes_sondees(self, listes: np.ndarray) -> np.ndarray:
+        """Lignes (croissantes) des listes IVF demandées : leurs tranches triées, puis la fin non triée."""
+        self.charger()
+        if self.debuts is None:
+            trie, lignes = 0, np.empty(0, dtype=np.int64)
+        else:
+            trie, debuts = int(self.debuts[-1]), self.debuts[listes]
+            longueurs = self.debuts[listes + 1] - debuts
+            # Concaténation des tranches [debut, fin) sans boucle Python
+            lignes = np.repeat(debuts - np.cumsum(longueurs) + longueurs, longueurs) + np.arange(longueurs.sum())
+        if trie == len(self.ids):
+            return lignes
+        fin = np.arange(trie, len(self.ids))
+        return np.concatenate([lignes, fin[np.isin(self.listes[trie:], listes)]])
+
+    def similarites_approchees(self, requetes: np.ndarray, lignes: np.ndarray) -> np.ndarray:
+        """Similarités (n_requetes, n_lignes) calculées sur les codes compacts."""
+        codes = self.codes if len(lignes) == len(self.ids) else self.codes[lignes]
+        if self.quantification == "int8":
+            # Conversion par blocs tenant en cache, plutôt que toute la matrice en float32
+            sortie = np.empty((len(requetes), len(lignes)), dtype=np.float32)
+            tampon = np.empty((min(self.BLOC, len(lignes)), self.dimension), dtype=np.float32)
+            for debut in range(0, len(lignes), self.BLOC):
+                bloc = codes[debut: debut + self.BLOC]
+                np.copyto(tampon[: len(bloc)], bloc, casting="unsafe")
+                sortie[:, debut: debut + len(bloc)] = requetes @ tampon[: len(bloc)].T
+            return sortie * self.echelles[lignes]
+        bits = binariser(requetes)
+        if codes.shape[1] % 8 == 0:
+            codes, bits = np.ascontiguousarray(codes).view(np.uint64), bits.view(np.uint64)
+            compter = _popcount64
+        else:
+            compter = _POPCOUNT.__getitem__
+        # Moins de bits différents = vecteurs plus proches
+        return -np.stack([compter(codes ^ b).sum(axis=1, dtype=np.int64) for b in bits]).astype(np.float32)
+
+    def octets_codes(self) -> int:
+        """Taille des représentations parcourues au premier passage (vecteurs float32 sans quantification)."""
+        self.charger()
+        if self.quantification is None:
+            return self.vecteurs.nbytes
+        return self.codes.nbytes + (self.echelles.nbytes if self.quantification == "int8" else 0)
+
+    def marquer_morts(self, lignes: list[int]) -> None:
+        self.charger()
+        self._ajouter("morts.i64", np.asarray(lignes, dtype=np.int64))
+        self.vivants[lignes] = False
+        self._n_vivants = int(self.vivants.sum())
+
+    def lire(self, lignes: np.ndarray) -> list[dict]:
+        """Lit texte et métadonnées des lignes demandées, sans charger toute la partition."""
+        if self._lignes is not None:
+            return [self._lignes[i] for i in lignes]
+        sortie = []
+        with open(self.dossier / "lignes.jsonl", "rb") as f:
+            for i in lignes:
+                f.seek(int(self.offsets[i]))
+                sortie.append(json.loads(f.readline()))
+        return sortie
+
+    def toutes_lignes(self) -> list[dict]:
+        if self._lignes is None:
+            with open(self.dossier / "lignes.jsonl", "rb") as f:
+                self._lignes = [json.loads(l) for l in f]
+        return self._lignes
+
+    def compacter(self, dossier: Path, listes: np.ndarray | None = None, n_listes: int | None = None) -> Path:
+        """
+        Réécrit la partition sans ses morceaux morts dans dossier (les lignes sont renumérotées).
+
+        listes remplace l'affectation IVF de chaque ligne ; avec n_listes, les lignes sont
+        rangées par liste et debuts.i64 écrit. L'ancien dossier n'est pas modifié : il est
+        retourné, à supprimer une fois meta.json mis à jour. En cas d'erreur, la partition
+        reste dans l'ancien dossier.
+        """
+        self.charger()
+        listes = self.listes if listes is None else listes
+        gardees = np.flatnonzero(self.vivants)
+        if listes is not None and n_listes is not None:
+            gardees = gardees[np.argsort(listes[gardees], kind="stable")]
+        vecteurs = np.array(self.vecteurs[gardees])
+        lignes = [self.toutes_lignes()[i] for i in gardees]
+        ids, listes = self.ids[gardees], None if listes is None else listes[gardees]
+        shutil.rmtree(dossier, ignore_errors=True)
+        dossier.mkdir(parents=True)
+        ancien, self.dossier = self.dossier, dossier
+        verrou_ancien, self._lecteur = self._lecteur, None
+        self._invalider()
+        try:
+            if len(gardees):
+                self.ajouter(ids, vecteurs, [l["document"] for l in lignes], [l["metadata"] for l in lignes], listes)
+            if listes is not None and n_listes is not None:
+                debuts = np.searchsorted(listes, np.arange(n_listes + 1)).astype(np.int64)
+                self._ajouter("debuts.i64", debuts)
+                self._invalider()
+        except BaseException:
+            self.fermer()
+            self.dossier, self._lecteur = ancien, verrou_ancien
+            self._n_vivants = None
+            shutil.rmtree(dossier, ignore_errors=True)
+            raise
+        if verrou_ancien is not None:
+            verrou_ancien.close()
+        self._n_vivants = len(gardees)
+        return ancien
+
+    def fermer(self) -> None:
+        """Libère les matrices mappées et le verrou de lecture du dossier."""
+        self._invalider()
+        if self._lecteur is not None:
+            self._lecteur.close()
+            self._lecteur = None
+
+    def _invalider(self) -> None:
+        self._charge = False
+        self._lignes = None
+        self.vecteurs = None
+        self.codes = None
+
+    def _charger_codes(self) -> None:
+        if not self._codes_complets():
+            # Partition écrite sans cette quantification : codes recalculés une fois
+            for nom in ("codes.i8", "echelles.f32", "codes.u8"):
+                (self.dossier / nom).unlink(missing_ok=True)
+            if len(self.ids):
+                self._ajouter_codes(np.asarray(self.vecteurs))
+        n = len(self.ids)
+        if self.quantification == "int8":
+            self.codes = self._mmap("codes.i8", np.int8, (n, self.dimension))
+            self.echelles = self._lire("echelles.f32", np.float32)
+        else:
+            self.codes = self._mmap("codes.u8", np.uint8, (n, (self.dimension + 7) // 8))
+
+    def _codes_complets(self) -> bool:
+        if self.quantification == "int8":
+            attendu = self.dossier / "codes.i8", self.dimension
+        else:
+            attendu = self.dossier / "codes.u8", (self.dimension + 7) // 8
+        taille = attendu[0].stat().st_size if attendu[0].exists() else 0
+        return taille == len(self.ids) * attendu[1]
+
+    def _ajouter_codes(self, vecteurs: np.ndarray) -> None:
+        if self.quantification == "int8":
+            codes, echelles = quantifier_int8(vecteurs)
+            self._ajouter("codes.i8", codes)
+            self._ajouter("echelles.f32", echelles)
+        else:
+            self._ajouter("codes.u8", binariser(vecteurs))
+
+    def _mmap(self, nom: str, dtype, forme: tuple[int, int]) -> np.ndarray:
+        if not forme[0]:
+            return np.empty(forme, dtype=dtype)
+        return np.memmap(self.dossier / nom, dtype=dtype, mode="r", shape=forme)
+
+    def _lire(self, nom: str, dtype) -> np.ndarray:
+        fichier = self.dossier / nom
+        return np.fromfile(fichier, dtype=dtype) if fichier.exists() else np.empty(0, dtype=dtype)
+
+    def _ajouter(self, nom: str, tableau: np.ndarray) -> None:
+        with open(self.dossier / nom, "ab") as f:
+            tableau.tofile(f)
+
+
+class BackendMmap:
+    """Backend vectoriel natif : produit scalaire exact sur des matrices float32 mappées en mémoire.
+
+    Les morceaux sont partitionnés par asin : une recherche filtrée sur un produit ne
+    lit que sa partition. Sans filtre produit, un index IVF optionnel (construire_ivf)
+    limite la lecture aux tranches des n_sondes listes les plus proches de la requête.
+    Les vecteurs sont normalisés à l'écriture ; la distance retournée est 1 - cosinus,
+    comme pour une collection Chroma en espace cosinus.
+
+    Avec quantification="int8" (4x plus compact) ou "binaire" (32x), le premier passage
+    parcourt les codes compacts et seuls les k * facteur_reclassement meilleurs candidats
+    sont reclassés avec les vecteurs float32, lus à la demande sur disque.
+
+    meta.json porte un numéro de génération : il est relu à chaque opération s'il a été
+    réécrit par un autre processus (indexation en ligne de commande), et les partitions
+    modifiées sont rouvertes. Les dossiers remplacés par un compactage sont supprimés aux
+    écritures suivantes, une fois qu'aucun processus ne les a plus chargés.
+    """
+
+    FICHIER_META = "meta.json"
+    FICHIER_IVF = "ivf.npy"
+    TAILLE_LOT_MAX = 10_000
+    recherche_exacte = True
+
+    def __init__(
+        self,
+        chemin: str,
+        n_sondes: int = config.MMAP_IVF_PROBES,
+        quantification: str | None = config.MMAP_QUANTIZATION,
+        facteur_reclassement: int = config.MMAP_RERANK_FACTOR,
+    ):
+        if quantification not in QUANTIFICATIONS:
+            raise ValueError(f"Quantification inconnue '{quantification}'. Choisir parmi : {list(QUANTIFICATIONS)}")
+        self.chemin = Path(chemin)
+        self.chemin.mkdir(parents=True, exist_ok=True)
+        self.n_sondes = n_sondes
+        self.quantification = quantification
+        self.facteur_reclassement = facteur_reclassement
+        self._verrou = threading.RLock()
+        self._charger()
+
+    def upsert(self, ids: list[str], embeddings: np.ndarray, documents: list[str], metadatas: list[dict]) -> None:
+        if not ids:
+            return
+        vecteurs = np.asarray(embeddings, dtype=np.float32)
+        vecteurs = vecteurs / (np.linalg.norm(vecteurs, axis=1, keepdims=True) + 1e-10)
+        cles = self._encoder_ids(ids)
+        with self._verrou:
+            self._suivre_meta()
+            self._purger_obsoletes()
+            if self.dimension is None:
+                self.dimension = int(vecteurs.shape[1])
+                self._sauvegarder_meta()
+            elif vecteurs.shape[1] != self.dimension:
+                raise ValueError(f"Dimension incompatible avec la base : {vecteurs.shape[1]} != {self.dimension}")
+            index = self._index_ids()
+            self._retirer([c for c in cles if c in index])
+
+            listes = None if self._centroides is None else np.argmax(vecteurs @ self._centroides.T, axis=1)
+            par_asin: dict[str, list[int]] = {}
+            for i, meta in enumerate(metadatas):
+                par_asin.setdefault(str(meta.get("asin", "")), []).append(i)
+            for asin, positions in par_asin.items():
+                partition = self._partition(asin, creer=True)
+                premier = partition.ajouter(
+                    cles[positions],
+                    vecteurs[positions],
+                    [documents[i] for i in positions],
+                    [metadatas[i] for i in positions],
+                    None if listes is None else listes[positions],
+                )
+                for k, i in enumerate(positions):
+                    index[cles[i]] = (asin, premier + k)
+            self._sauvegarder_meta()
+
+    def get(
+        self,
+        ids: list[str] | None = None,
+        where: dict | None = None,
+        limit: int | None = None,
+        offset: int | None = None,
+        include: list[str] | None = None,
+    ) -> dict:
+        include = ["documents", "metadatas"] if include is None else include
+        with self._verrou:
+            self._suivre_meta()
+            if ids is not None:
+                index = self._index_ids()
+                trouves = [index[c] for c in self._encoder_ids(ids) if c in index]
+                for asin in {asin for asin, _ in trouves}:
+                    self._partitions[asin].charger()
+                selection = [(self._partitions[asin], np.array([ligne])) for asin, ligne in trouves]
+                if where is not None:
+                    selection = [(p, l) for p, l in selection if self._masque_filtre(where, p)[l[0]]]
+                return self._resultat(selection, include)
+
+            a_sauter, restant = offset or 0, limit
+            selection = []
+            for partition in self._candidates(where):
+                if restant is not None and restant <= 0:
+                    break
+                if where is None and a_sauter >= partition.nb_vivants():
+                    a_sauter -= partition.nb_vivants()
+                    continue
+                masque = partition.vivants.copy()
+                if where is not None:
+                    masque &= self._masque_filtre(where, partition)
+                lignes = np.flatnonzero(masque)
+                pris = lignes[a_sauter:]
+                a_sauter = max(a_sauter - len(lignes), 0)
+                if restant is not None:
+                    pris = pris[:restant]
+                    restant -= len(pris)
+                if len(pris):
+                    selection.append((partition, pris))
+            return self._resultat(selection, include)
+
+    def query(
+        self,
+        query_embeddings: np.ndarray,
+        n_results: int,
+        where: dict | None = None,
+        include: list[str] | None = None,
+    ) -> dict:
+        include = ["documents", "metadatas", "distances"] if include is None else include
+        requetes = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        requetes = requetes / (np.linalg.norm(requetes, axis=1, keepdims=True) + 1e-10)
+        with self._verrou:
+            self._suivre_meta()
+            partitions = self._candidates(where)
+            sondes = None
+            if self._centroides is not None and self._asins_possibles(where) is None:
+                # IVF : seules les tranches des listes les plus proches des requêtes sont lues
+                proximites = requetes @ self._centroides.T
+                sondes = np.zeros(proximites.shape, dtype=bool)
+                np.put_along_axis(sondes, np.argsort(-proximites, axis=1)[:, : self.n_sondes], True, axis=1)
+                listes_sondees = np.flatnonzero(sondes.any(axis=0))
+
+            meilleurs: list[list[tuple]] = [[] for _ in range(len(requetes))]
+            for partition in partitions:
+                if sondes is None or partition.listes is None:
+                    masque = partition.vivants
+                    if where is not None:
+                        masque = masque & self._masque_filtre(where, partition)
+                    self._accumuler(meilleurs, requetes, partition, np.flatnonzero(masque), n_results)
+                    continue
+                lignes = partition.lignes_sondees(listes_sondees)
+                garde = partition.vivants[lignes]
+                if where is not None:
+                    garde &= self._masque_filtre(where, partition)[lignes]
+                lignes = lignes[garde]
+                # Chaque requête ne garde que les lignes de ses propres listes
+                autorisees = sondes[:, partition.listes[lignes]]
+                self._accumuler(meilleurs, requetes, partition, lignes, n_results, autorisees)
+
+            resultats = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+            for top in meilleurs:
+                top = heapq.nlargest(n_results, top)
+                lignes = [(self._partitions[asin], ligne) for _, asin, ligne in top]
+                contenu = self._lire_lignes(lignes) if {"documents", "metadatas"} & set(include) else []
+                resultats["ids"].append([p.ids[l].decode("ascii") for p, l in lignes])
+                resultats["documents"].append([c["document"] for c in contenu])
+                resultats["metadatas"].append([c["metadata"] for c in contenu])
+                resultats["distances"].append([1.0 - sim for sim, _, _ in top])
+            return {cle: v for cle, v in resultats.items() if cle == "ids" or cle in include}
+
+    def delete(self, ids: list[str]) -> None:
+        with self._verrou:
+            self._suivre_meta()
+            self._purger_obsoletes()
+            self._retirer(self._encoder_ids(ids))
+            self._sauvegarder_meta()
+
+    def count(self) -> int:
+        with self._verrou:
+            self._suivre_meta()
+            return sum(p.nb_vivants() for p in self._partitions.values())
+
+    def taille_lot_max(self) -> int:
+        return self.TAILLE_LOT_MAX
+
+    def octets_index(self) -> int:
+        """Mémoire parcourue par le premier passage de recherche, toutes partitions confondues."""
+        with self._verrou:
+            self._suivre_meta()
+            return sum(p.octets_codes() for p in self._partitions.values())
+
+    def reinitialiser(self) -> None:
+        with self._verrou:
+            for partition in self._partitions.values():
+                partition.fermer()
+            shutil.rmtree(self.chemin, ignore_errors=True)
+            self.chemin.mkdir(parents=True, exist_ok=True)
+            self._charger()
+
+    def fermer(self) -> None:
+        """Libère les partitions chargées (matrices mappées et verrous de lecture) ; rechargées au besoin."""
+        with self._verrou:
+            for partition in self._partitions.values():
+                partition.fermer()
+            self._index = None
+
+    def construire_ivf(self, n_listes: int | None = None, iterations: int = 10, graine: int = 0) -> None:
+        """
+        Entraîne un index IVF (k-means sphérique) sur les vecteurs de la base et y affecte chaque morceau.
+
+        Les morceaux ajoutés ensuite sont affectés à leur liste la plus proche à l'écriture.
+        Par défaut, n_listes vaut la racine carrée du nombre de morceaux.
+        """
+        with self._verrou:
+            self._suivre_meta()
+            partitions = [p for p in self._partitions.values() if len(p)]
+            total = sum(len(p) for p in partitions)
+            if not total:
+                return
+            n_listes = min(n_listes or max(1, int(np.sqrt(total))), total)
+            rng = np.random.default_rng(graine)
+            echantillon = np.concatenate([np.asarray(p.vecteurs[p.vivants]) for p in partitions])
+            echantillon = echantillon[rng.permutation(len(echantillon))[: 256 * n_listes]]
+            centroides = echantillon[rng.choice(len(echantillon), size=n_listes, replace=False)]
+            for _ in range(iterations):
+                affectations = np.argmax(echantillon @ centroides.T, axis=1)
+                sommes = np.zeros_like(centroides)
+                np.add.at(sommes, affectations, echantillon)
+                vides = np.bincount(affectations, minlength=n_listes) == 0
+                sommes[vides] = echantillon[rng.choice(len(echantillon), size=int(vides.sum()))]
+                centroides = sommes / (np.linalg.norm(sommes, axis=1, keepdims=True) + 1e-10)
+
+            # Chaque partition est réécrite dans l'ordre des listes, dans un nouveau dossier
+            centroides = centroides.astype(np.float32)
+            for partition in partitions:
+                listes = np.argmax(np.asarray(partition.vecteurs) @ centroides.T, axis=1)
+                self._obsoletes.append(self._compacter(partition, listes, n_listes).name)
+            self._centroides = centroides
+            self._index = None
+            with open(self.chemin / (self.FICHIER_IVF + ".tmp"), "wb") as f:
+                np.save(f, centroides)
+            (self.chemin / (self.FICHIER_IVF + ".tmp")).replace(self.chemin / self.FICHIER_IVF)
+            self._sauvegarder_meta()
+            self._purger_obsoletes()
+
+    def _charger(self) -> None:
+        self.dimension: int | None = None
+        self._partitions: dict[str, _Partition] = {}
+        self._index: dict[bytes, tuple[str, int]] | None = None
+        self._centroides: np.ndarray | None = None
+        self._generation: int | None = None
+        self._entrees: dict[str, dict] = {}
+        self._obsoletes: list[str] = []
+        self._etat_meta: int | None = None
+        self._suivre_meta()
+
+    def _suivre_meta(self) -> None:
+        """Relit meta.json s'il a changé sur disque depuis la dernière lecture ou écriture de ce processus."""
+        meta = self.chemin / self.FICHIER_META
+        try:
+            modifie = meta.stat().st_mtime_ns
+        except FileNotFoundError:
+            modifie = None
+        if modifie == self._etat_meta:
+            return
+        self._etat_meta = modifie
+        contenu = {"dimension": None, "partitions": {}}
+        if modifie is not None:
+            contenu = json.loads(meta.read_text(encoding="utf-8"))
+            if contenu.get("generation") is not None and contenu["generation"] == self._generation:
+                return
+        self._generation = contenu.get("generation")
+        self.dimension = contenu["dimension"]
+        self._obsoletes = contenu.get("obsoletes", [])
+        # Ancien format : nom du dossier seul, sans nombre de morceaux vivants
+        entrees = {a: {"dossier": e} if isinstance(e, str) else e for a, e in contenu["partitions"].items()}
+        for asin in list(self._partitions):
+            if self._entrees.get(asin) != entrees.get(asin):
+                # Partition réécrite ou complétée ailleurs : ses tableaux chargés sont périmés
+                self._partitions.pop(asin).fermer()
+        for asin, entree in entrees.items():
+            if asin in self._partitions:
+                continue
+            partition = _Partition(self.chemin / entree["dossier"], asin, self.dimension, self.quantification)
+            if entree.get("signature") == partition.signature():
+                partition._n_vivants = entree["vivants"]
+            self._partitions[asin] = partition
+        self._entrees = entrees
+        self._index = None
+        ivf = self.chemin / self.FICHIER_IVF
+        self._centroides = np.load(ivf) if ivf.exists() else None
+
+    def _sauvegarder_meta(self) -> None:
+        self._generation = (self._generation or 0) + 1
+        self._entrees = {
+            asin: {"dossier": p.dossier.name, "vivants": p._n_vivants, "signature": p.signature()}
+            for asin, p in self._partitions.items()
+        }
+        contenu = {
+            "generation": self._generation,
+            "dimension": self.dimension,
+            "partitions": self._entrees,
+            "obsoletes": self._obsoletes,
+        }
+        tmp = self.chemin / (self.FICHIER_META + ".tmp")
+        tmp.write_text(json.dumps(contenu, ensure_ascii=False), encoding="utf-8")
+        tmp.replace(self.chemin / self.FICHIER_META)
+        self._etat_meta = (self.chemin / self.FICHIER_META).stat().st_mtime_ns
+
+    def _purger_obsoletes(self) -> None:
+        """Supprime les dossiers remplacés par un compactage qu'aucun processus ne tient plus chargés."""
+        restants = []
+        for nom in self._obsoletes:
+            dossier = self.chemin / nom
+            with essayer_verrou_exclusif(dossier / _Partition.FICHIER_LECTEURS) as libre:
+                if libre:
+                    shutil.rmtree(dossier, ignore_errors=True)
+                else:
+                    restants.append(nom)
+        self._obsoletes = restants
+
+    def _partition(self, asin: str, creer: bool = False) -> _Partition | None:
+        partition = self._partitions.get(asin)
+        if partition is None and creer:
+            nom = "p_" + hashlib.blake2b(asin.encode("utf-8"), digest_size=8).hexdigest()
+            partition = self._partitions[asin] = _Partition(
+                self.chemin / nom, asin, self.dimension, self.quantification, n_vivants=0
+            )
+            self._sauvegarder_meta()
+        return partition
+
+    def _index_ids(self) -> dict[bytes, tuple[str, int]]:
+        """Index id -> (asin, ligne), construit au premier besoin : les recherches n'en ont pas besoin."""
+        if self._index is None:
+            self._index = {}
+            for asin, partition in self._partitions.items():
+                partition.charger()
+                for ligne in np.flatnonzero(partition.vivants):
+                    self._index[partition.ids[ligne]] = (asin, int(ligne))
+        return self._index
+
+    def _retirer(self, cles: list[bytes]) -> None:
+        index = self._index_ids()
+        par_asin: dict[str, list[int]] = {}
+        for cle in cles:
+            if cle in index:
+                asin, ligne = index.pop(cle)
+                par_asin.setdefault(asin, []).append(ligne)
+        for asin, lignes in par_asin.items():
+            partition = self._partitions[asin]
+            partition.marquer_morts(lignes)
+            morts = len(partition) - partition.nb_vivants()
+            if morts >= 64 and morts > partition.nb_vivants():
+                # Nouveau dossier, pris en compte par le remplacement atomique de meta.json ;
+                # l'ancien reste en place tant qu'un autre processus le lit
+                n_listes = None if self._centroides is None else len(self._centroides)
+                self._obsoletes.append(self._compacter(partition, partition.listes, n_listes).name)
+                self._sauvegarder_meta()
+                self._purger_obsoletes()
+                partition.charger()
+                for ligne, cle in enumerate(partition.ids):
+                    index[cle] = (asin, ligne)
+
+    def _compacter(self, partition: _Partition, listes: np.ndarray | None, n_listes: int | None) -> Path:
+        """Compacte la partition dans la génération de dossier suivante ; retourne l'ancien dossier."""
+        base, _, generation = partition.dossier.name.partition(".")
+        return partition.compacter(self.chemin / f"{base}.{int(generation or 0) + 1}", listes, n_listes)
+
+    @staticmethod
+    def _encoder_ids(ids: list[str]) -> np.ndarray:
+        cles = np.array([i.encode("ascii") for i in ids], dtype=object)
+        if any(len(c) > _ID.itemsize for c in cles):
+            raise ValueError(f"Les identifiants du backend mmap sont limités à {_ID.itemsize} caractères ASCII")
+        return cles.astype(_ID)
+
+    def _candidates(self, filtre: dict | None) -> list[_Partition]:
+        asins = self._asins_possibles(filtre)
+        if asins is None:
+            partitions = [self._partitions[a] for a in sorted(self._partitions)]
+        else:
+            partitions = [self._partitions[a] for a in sorted(asins) if a in self._partitions]
+        for partition in partitions:
+            partition.charger()
+        return partitions
+
+    @classmethod
+    def _asins_possibles(cls, filtre: dict | None) -> set[str] | None:
+        """Asins compatibles avec le filtre (None : toutes les partitions sont à parcourir)."""
+        if filtre is None:
+            return None
+        if "$and" in filtre:
+            ensembles = [e for e in map(cls._asins_possibles, filtre["$and"]) if e is not None]
+            return set.intersection(*ensembles) if ensembles else None
+        condition = filtre.get("asin")
+        if condition is None:
+            return None
+        if not isinstance(condition, dict):
+            return {condition}
+        if "$eq" in condition:
+            return {condition["$eq"]}
+        if "$in" in condition:
+            return set(condition["$in"])
+        return None
+
+    def _masque_filtre(self, filtre: dict, partition: _Partition) -> np.ndarray:
+        """Évalue une clause where Chroma sur toutes les lignes d'une partition."""
+        if "$and" in filtre:
+            return reduce(np.logical_and, (self._masque_filtre(f, partition) for f in filtre["$and"]))
+        if "$or" in filtre:
+            return reduce(np.logical_or, (self._masque_filtre(f, partition) for f in filtre["$or"]))
+        (cle, condition), = filtre.items()
+        if cle == "asin":
+            valeurs = np.full(len(partition), partition.asin, dtype=object)
+        elif cle == "note":
+            valeurs = partition.notes
+        else:
+            valeurs = np.array([l["metadata"].get(cle) for l in partition.toutes_lignes()], dtype=object)
+        if not isinstance(condition, dict):
+            condition = {"$eq": condition}
+        masque = np.ones(len(partition), dtype=bool)
+        for operateur, attendu in condition.items():
+            if operateur == "$in":
+                masque &= np.isin(valeurs, attendu)
+            elif operateur == "$nin":
+                masque &= ~np.isin(valeurs, attendu)
+            else:
+                masque &= _COMPARAISONS[operateur](valeurs, attendu).astype(bool)
+        return masque
+
+    def _accumuler(
+        self,
+        meilleurs: list[list[tuple]],
+        requetes: np.ndarray,
+        partition: _Partition,
+        lignes: np.ndarray,
+        k: int,
+        autorisees: np.ndarray | None = None,
+    ) -> None:
+        """Ajoute aux meilleurs de chaque requête ceux des lignes données (autorisees : masque requête x ligne)."""
+        if not len(lignes):
+            return
+        if self.quantification is None:
+            # Parcours exact : une seule multiplication matricielle sur les lignes retenues
+            vecteurs = partition.vecteurs if len(lignes) == len(partition) else partition.vecteurs[lignes]
+            similarites = requetes @ np.asarray(vecteurs).T
+        else:
+            similarites = partition.similarites_approchees(requetes, lignes)
+        if autorisees is not None:
+            similarites[~autorisees] = -np.inf
+        for q, ligne_sims in enumerate(similarites):
+            if self.quantification is None:
+                top = self._top(ligne_sims, k)
+                top = top[np.isfinite(ligne_sims[top])]
+                meilleurs[q].extend((float(ligne_sims[j]), partition.asin, int(lignes[j])) for j in top)
+                continue
+            # Reclassement exact des meilleurs candidats, lus dans l'ordre du fichier
+            top = self._top(ligne_sims, k * self.facteur_reclassement)
+            candidats = np.sort(lignes[top[np.isfinite(ligne_sims[top])]])
+            exactes = np.asarray(partition.vecteurs[candidats]) @ requetes[q]
+            meilleurs[q].extend(
+                (float(exactes[j]), partition.asin, int(candidats[j])) for j in self._top(exactes, k)
+            )
+        for q in range(len(requetes)):
+            if len(meilleurs[q]) > 4 * k:
+                meilleurs[q] = heapq.nlargest(k, meilleurs[q])
+
+    @staticmethod
+    def _top(similarites: np.ndarray, k: int) -> np.ndarray:
+        if len(similarites) <= k:
+            return np.arange(len(similarites))
+        return np.argpartition(-similarites, k - 1)[:k]
+
+    def _lire_lignes(self, lignes: list[tuple[_Partition, int]]) -> list[dict]:
+        par_partition: dict[int, list[int]] = {}
+        for position, (partition, ligne) in enumerate(lignes):
+            par_partition.setdefault(id(partition), []).append(position)
+        sortie: list[dict | None] = [None] * len(lignes)
+        for positions in par_partition.values():
+            partition = lignes[positions[0]][0]
+            for position, contenu in zip(positions, partition.lire([lignes[p][1] for p in positions])):
+                sortie[position] = contenu
+        return sortie
+
+    def _resultat(self, selection: list[tuple[_Partition, np.ndarray]], include: list[str]) -> dict:
+        lignes = [(p, int(l)) for p, ls in selection for l in ls]
+        resultat = {"ids": [p.ids[l].decode("ascii") for p, l in lignes]}
+        if "documents" in include or "metadatas" in include:
+            contenu = self._lire_lignes(lignes)
+            if "documents" in include:
+                resultat["documents"] = [c["document"] for c in contenu]
+            if "metadatas" in include:
+                resultat["metadatas"] = [c["metadata"] for c in contenu]
+        if "embeddings" in include:
+            dimension = self.dimension or 0
+            resultat["embeddings"] = (
+                np.stack([p.vecteurs[l] for p, l in lignes]) if lignes else np.empty((0, dimension), dtype=np.float32)
+            )
+        return resultat
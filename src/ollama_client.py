@@ -0,0 +1,98 @@
+import asyncio
+import json
+from typing import AsyncIterator
+
+import httpx
+
+import config
+
+
+class AsyncOllamaClient:
+    """Client HTTP asynchrone pour Ollama, avec pool de connexions persistantes.
+
+    Le nombre de générations simultanées est borné par un sémaphore et chaque
+    requête est soumise à un délai maximal. Chaque boucle d'événements a son propre
+    pool, fermé quand la boucle s'arrête (fin d'asyncio.run) ou quand le client
+    passe à une autre boucle.
+    """
+
+    def __init__(
+        self,
+        model: str = config.OLLAMA_MODEL,
+        base_url: str = config.OLLAMA_BASE_URL,
+        max_concurrence: int = config.OLLAMA_MAX_CONCURRENCY,
+        timeout: float = config.OLLAMA_TIMEOUT_SECONDS,
+    ):
+        self.model = model
+        self.base_url = base_url.rstrip("/")
+        self.max_concurrence = max_concurrence
+        self.timeout = timeout
+        self._client: httpx.AsyncClient | None = None
+        self._semaphore: asyncio.Semaphore | None = None
+        self._boucle: asyncio.AbstractEventLoop | None = None
+        self._gardien: AsyncIterator[None] | None = None
+
+    async def generer(self, prompt: str) -> str:
+        """Génère la réponse complète pour un prompt."""
+        client, semaphore = await self._pool()
+        async with semaphore:
+            reponse = await client.post(
+                "/api/generate",
+                json={"model": self.model, "prompt": prompt, "stream": False, "keep_alive": config.OLLAMA_KEEP_ALIVE},
+            )
+            reponse.raise_for_status()
+            return reponse.json()["response"]
+
+    async def generer_flux(self, prompt: str) -> AsyncIterator[str]:
+        """Produit les morceaux de réponse au fil de la génération."""
+        client, semaphore = await self._pool()
+        async with semaphore:
+            async with client.stream(
+                "POST",
+                "/api/generate",
+                json={"model": self.model, "prompt": prompt, "stream": True, "keep_alive": config.OLLAMA_KEEP_ALIVE},
+            ) as reponse:
+                reponse.raise_for_status()
+                async for ligne in reponse.aiter_lines():
+                    if not ligne:
+                        continue
+                    morceau = json.loads(ligne)
+                    if morceau.get("response"):
+                        yield morceau["response"]
+                    if morceau.get("done"):
+                        return
+
+    async def fermer(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._gardien = None
+
+    async def _pool(self) -> tuple[httpx.AsyncClient, asyncio.Semaphore]:
+        boucle = asyncio.get_running_loop()
+        if self._client is None or self._boucle is not boucle:
+            if self._client is not None and self._boucle.is_running():
+                # Boucle toujours active dans un autre thread : le pool y est fermé
+                asyncio.run_coroutine_threadsafe(self._client.aclose(), self._boucle)
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=httpx.Timeout(self.timeout),
+                limits=httpx.Limits(
+                    max_connections=self.max_concurrence,
+                    max_keepalive_connections=self.max_concurrence,
+                ),
+            )
+            self._semaphore = asyncio.Semaphore(self.max_concurrence)
+            self._boucle = boucle
+            # Générateur suspendu, enregistré auprès de la boucle : asyncio.run le ferme
+            # (shutdown_asyncgens) avant de fermer la boucle, ce qui ferme le pool
+            self._gardien = self._fermer_avec_la_boucle(self._client)
+            await anext(self._gardien)
+        return self._client, self._semaphore
+
+    @staticmethod
+    async def _fermer_avec_la_boucle(client: httpx.AsyncClient) -> AsyncIterator[None]:
+        try:
+            yield
+        finally:
+            await client.aclose()
@@ -0,0 +1,217 @@
+import math
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from contextlib import nullcontext
+from dataclasses import dataclass
+from itertools import chain, islice
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator
+
+import numpy as np
+import pandas as pd
+
+import config
+from src.data_loader import ReviewLoader
+from src.embeddings import signature_embedder
+from src.metrics import metriques
+from src.preprocessor import ReviewPreprocessor
+from src.vector_store import ReviewVectorStore
+
+if TYPE_CHECKING:
+    from src.processed_store import EcritureTraitee, ProcessedReviews
+
+
+@dataclass
+class StatsIngestion:
+    avis_lus: int = 0
+    avis_retenus: int = 0
+    morceaux: int = 0
+    ajoutes: int = 0
+    modifies: int = 0
+    supprimes: int = 0
+    duree: float = 0.0
+
+    @property
+    def avis_par_seconde(self) -> float:
+        return self.avis_lus / self.duree if self.duree else 0.0
+
+    @property
+    def morceaux_par_seconde(self) -> float:
+        return self.morceaux / self.duree if self.duree else 0.0
+
+
+def par_lots(elements: Iterable, taille: int) -> Iterator[list]:
+    iterateur = iter(elements)
+    while lot := list(islice(iterateur, taille)):
+        yield lot
+
+
+# Préprocesseur propre à chaque processus de découpage, transmis une seule fois à son démarrage
+_preprocesseur_worker: ReviewPreprocessor | None = None
+
+
+def _initialiser_worker(preprocessor: ReviewPreprocessor) -> None:
+    global _preprocesseur_worker
+    _preprocesseur_worker = preprocessor
+
+
+def _decouper_shard(df: pd.DataFrame) -> list[dict]:
+    return _preprocesseur_worker.vers_documents(df)
+
+
+class IngestionPipeline:
+    """Ingestion en flux : lecture par lots, nettoyage, découpage, encodage et écriture.
+
+    La mémoire reste bornée par taille_lot_avis (avis en cours de nettoyage)
+    et taille_lot_morceaux (morceaux en cours d'encodage). Avec workers > 1,
+    chaque lot d'avis est découpé en parallèle dans un pool de processus ;
+    l'ordre des morceaux, et donc le résultat, est identique au chemin série.
+    L'écriture reste faite par le seul processus principal.
+
+    Avec une étape de données traitées, les avis nettoyés et les morceaux
+    encodés sont aussi écrits en Parquet ; reindexer repart alors de ces
+    tables, sans relire ni renettoyer le fichier brut.
+    """
+
+    def __init__(
+        self,
+        store: ReviewVectorStore,
+        loader: ReviewLoader | None = None,
+        preprocessor: ReviewPreprocessor | None = None,
+        taille_lot_avis: int = config.INGESTION_BATCH_ROWS,
+        taille_lot_morceaux: int = config.INGESTION_BATCH_CHUNKS,
+        progression: Callable[[StatsIngestion], None] | None = None,
+        workers: int = config.INDEXING_WORKERS,
+        etape_traitee: "ProcessedReviews | None" = None,
+    ):
+        self.store = store
+        self.loader = loader or ReviewLoader()
+        self.preprocessor = preprocessor or ReviewPreprocessor()
+        self.taille_lot_avis = taille_lot_avis
+        self.taille_lot_morceaux = taille_lot_morceaux
+        self.progression = progression
+        self.workers = workers
+        self.etape_traitee = etape_traitee
+
+    def executer(self, filename: str, supprimer_absents: bool = False) -> StatsIngestion:
+        """
+        Indexe un fichier d'avis de façon incrémentale.
+
+        Args:
+            filename: Fichier relatif au data_path du loader.
+            supprimer_absents: Si vrai, supprime en fin d'ingestion les morceaux absents
+                du fichier. Les ids vus sont alors conservés en mémoire.
+
+        Returns:
+            Les statistiques d'ingestion.
+        """
+        lots_avis = self.loader.iterer(filename, taille_lot=self.taille_lot_avis)
+        return self._ingerer(filename, lots_avis, nettoyer=True, supprimer_absents=supprimer_absents)
+
+    # Alias pour compatibilité avec l'interface existante
+    def run(self, filename: str, delete_missing: bool = False) -> StatsIngestion:
+        return self.executer(filename, supprimer_absents=delete_missing)
+
+    def reindexer(self, source: str, redecouper: bool = False, supprimer_absents: bool = False) -> StatsIngestion:
+        """
+        Réindexe une source depuis ses données traitées, sans relire le fichier brut.
+
+        Par défaut, les morceaux et leurs embeddings sont relus tels quels ; si
+        l'embedder a changé, seuls les textes sont réencodés. Avec redecouper, les
+        avis nettoyés sont redécoupés (après un changement de CHUNK_SIZE par
+        exemple) et les données traitées réécrites.
+        """
+        if self.etape_traitee is None or self.etape_traitee.manifeste(source) is None:
+            raise ValueError(f"Aucune donnée traitée pour la source '{source}'")
+        if redecouper:
+            lots_avis = self.etape_traitee.avis(source, taille_lot=self.taille_lot_avis)
+            return self._ingerer(source, lots_avis, nettoyer=False, supprimer_absents=supprimer_absents)
+
+        if self.etape_traitee.manifeste(source)["modele"] != signature_embedder(self.store.embedder):
+            self.etape_traitee.reencoder(source, self.store.embedder)
+        stats = StatsIngestion()
+        ids_vus: set[str] | None = set() if supprimer_absents else None
+        debut = time.perf_counter()
+        lots = self.etape_traitee.morceaux(source, taille_lot=self.taille_lot_morceaux)
+        for lot, vecteurs in metriques.chronometrer("chargement", lots):
+            self._synchroniser(lot, stats, ids_vus, debut, embeddings=vecteurs)
+        return self._terminer(stats, ids_vus, debut)
+
+    # Alias pour compatibilité avec l'interface existante
+    def reindex(self, source: str, rechunk: bool = False, delete_missing: bool = False) -> StatsIngestion:
+        return self.reindexer(source, redecouper=rechunk, supprimer_absents=delete_missing)
+
+    def _ingerer(
+        self, source: str, lots_avis: Iterable[pd.DataFrame], nettoyer: bool, supprimer_absents: bool
+    ) -> StatsIngestion:
+        stats = StatsIngestion()
+        ids_vus: set[str] | None = set() if supprimer_absents else None
+        debut = time.perf_counter()
+        ecriture = (
+            self.etape_traitee.ecrire(source, signature_embedder(self.store.embedder))
+            if self.etape_traitee is not None
+            else nullcontext(None)
+        )
+
+        with self._pool_decoupage() as pool, ecriture as etape:
+            for df in metriques.chronometrer("chargement", lots_avis):
+                stats.avis_lus += len(df)
+                if nettoyer:
+                    with metriques.span("nettoyage"):
+                        df = self.preprocessor.nettoyer(df)
+                stats.avis_retenus += len(df)
+                if etape is not None:
+                    with metriques.span("donnees_traitees"):
+                        etape.ajouter_avis(df)
+                lots = par_lots(self._documents(df, pool), self.taille_lot_morceaux)
+                for lot in metriques.chronometrer("decoupage", lots):
+                    self._synchroniser(lot, stats, ids_vus, debut, etape=etape)
+
+        return self._terminer(stats, ids_vus, debut)
+
+    def _synchroniser(
+        self,
+        lot: list[dict],
+        stats: StatsIngestion,
+        ids_vus: set[str] | None,
+        debut: float,
+        embeddings: np.ndarray | None = None,
+        etape: "EcritureTraitee | None" = None,
+    ) -> None:
+        bilan = self.store.synchroniser(
+            lot, supprimer_absents=False, embeddings=embeddings, avec_embeddings=etape is not None
+        )
+        if etape is not None:
+            with metriques.span("donnees_traitees"):
+                etape.ajouter_morceaux(bilan["ids"], bilan["textes"], bilan["metadonnees"], bilan["embeddings"])
+        stats.morceaux += len(lot)
+        stats.ajoutes += bilan["ajoutes"]
+        stats.modifies += bilan["modifies"]
+        if ids_vus is not None:
+            ids_vus.update(ReviewVectorStore.identifiant(d["text"], d["metadata"]) for d in lot)
+        stats.duree = time.perf_counter() - debut
+        if self.progression:
+            self.progression(stats)
+
+    def _terminer(self, stats: StatsIngestion, ids_vus: set[str] | None, debut: float) -> StatsIngestion:
+        if ids_vus is not None:
+            stats.supprimes = self.store.supprimer_absents(ids_vus)
+        stats.duree = time.perf_counter() - debut
+        if self.progression:
+            self.progression(stats)
+        return stats
+
+    def _pool_decoupage(self):
+        if self.workers <= 1:
+            return nullcontext(None)
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=_initialiser_worker,
+            initargs=(self.preprocessor,),
+        )
+
+    def _documents(self, df: pd.DataFrame, pool: Executor | None) -> Iterator[dict]:
+        if pool is None or len(df) < 2 * self.workers:
+            return self.preprocessor.iterer_documents(df)
+        taille = math.ceil(len(df) / self.workers)
+        shards = [df.iloc[i: i + taille] for i in range(0, len(df), taille)]
+        return chain.from_iterable(pool.map(_decouper_shard, shards))
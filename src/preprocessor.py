@@ -1,10 +1,19 @@
+import hashlib
 import re
+from typing import Iterator
+
+import numpy as np
 import pandas as pd
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_text_splitters import RecursiveCharacterTextSplitter
 
 import config
 
 
+_BALISES = re.compile(r"<[^>]+>")
+_URLS = re.compile(r"http\S+")
+_ESPACES = re.compile(r"\s+")
+
+
 class ReviewPreprocessor:
     """Nettoie et découpe les avis pour l'indexation."""
 
@@ -24,7 +33,7 @@ class ReviewPreprocessor:
     def nettoyer(self, df: pd.DataFrame) -> pd.DataFrame:
         df = df.copy()
         df = df.dropna(subset=[config.REVIEW_TEXT_COL])
-        df[config.REVIEW_TEXT_COL] = df[config.REVIEW_TEXT_COL].apply(self._nettoyer_texte)
+        df[config.REVIEW_TEXT_COL] = self._nettoyer_textes(df[config.REVIEW_TEXT_COL])
         df = df[df[config.REVIEW_TEXT_COL].str.len() > 20]
         if self.min_rating is not None:
             df = df[df[config.REVIEW_RATING_COL] >= self.min_rating]
@@ -37,23 +46,55 @@ class ReviewPreprocessor:
 
     def vers_documents(self, df: pd.DataFrame) -> list[dict]:
         """Convertit les lignes en dicts avec texte et métadonnées."""
-        documents = []
-        for _, row in df.iterrows():
-            texte = self._construire_texte(row)
-            metadonnees = {
-                "asin": str(row.get(config.REVIEW_PRODUCT_COL, "")),
-                "note": float(row.get(config.REVIEW_RATING_COL, 0)),
-                "resume": str(row.get(config.REVIEW_SUMMARY_COL, "")),
-            }
-            morceaux = self.splitter.split_text(texte)
-            for morceau in morceaux:
-                documents.append({"text": morceau, "metadata": metadonnees})
-        return documents
+        return list(self.iterer_documents(df))
 
     # Alias pour compatibilité avec l'interface existante
     def to_documents(self, df: pd.DataFrame) -> list[dict]:
         return self.vers_documents(df)
 
+    def iterer_documents(self, df: pd.DataFrame) -> Iterator[dict]:
+        """Variante paresseuse de vers_documents : produit les morceaux un à un."""
+        textes = self._construire_textes(df)
+        asins = [str(a) for a in self._colonne(df, config.REVIEW_PRODUCT_COL, "")]
+        notes = [float(n) for n in self._colonne(df, config.REVIEW_RATING_COL, 0)]
+        resumes = [str(r) for r in self._colonne(df, config.REVIEW_SUMMARY_COL, "")]
+        identifiants = self._colonne(df, config.REVIEW_ID_COL, None)
+
+        for texte, asin, note, resume, identifiant in zip(textes, asins, notes, resumes, identifiants):
+            metadonnees = {
+                "asin": asin,
+                "note": note,
+                "resume": resume,
+                "avis_id": self._identifiant_avis(identifiant, texte),
+            }
+            morceaux = self.splitter.split_text(texte)
+            for i, morceau in enumerate(morceaux):
+                yield {"text": morceau, "metadata": {**metadonnees, "morceau": i}}
+
+    def _construire_textes(self, df: pd.DataFrame) -> list[str]:
+        """Version colonne par colonne de _construire_texte, pour tout le DataFrame."""
+        textes = pd.Series("", index=range(len(df)), dtype=object)
+        deja_rempli = np.zeros(len(df), dtype=bool)
+        for col, prefixe, suffixe in (
+            (config.REVIEW_SUMMARY_COL, "Résumé : ", ""),
+            (config.REVIEW_RATING_COL, "Note : ", "/5"),
+            (config.REVIEW_TEXT_COL, "Avis : ", ""),
+        ):
+            valeurs = self._colonne(df, col, "")
+            present = valeurs.astype(bool)
+            partie = prefixe + pd.Series(valeurs, dtype=object).astype(str) + suffixe
+            separateur = np.where(deja_rempli & present, "\n", "")
+            textes = textes + separateur + partie.where(present, "")
+            deja_rempli |= present
+        return textes.tolist()
+
+    @staticmethod
+    def _colonne(df: pd.DataFrame, col: str, defaut) -> np.ndarray:
+        """Valeurs Python natives d'une colonne, ou defaut si elle est absente."""
+        if col in df.columns:
+            return df[col].to_numpy(dtype=object)
+        return np.full(len(df), defaut, dtype=object)
+
     def _construire_texte(self, row: pd.Series) -> str:
         resume = row.get(config.REVIEW_SUMMARY_COL, "")
         corps = row.get(config.REVIEW_TEXT_COL, "")
@@ -67,10 +108,27 @@ class ReviewPreprocessor:
             parties.append(f"Avis : {corps}")
         return "\n".join(parties)
 
+    @staticmethod
+    def _identifiant_avis(identifiant, texte: str) -> str:
+        """Identifiant stable de l'avis : colonne dédiée si présente, sinon hash du contenu."""
+        if identifiant is not None and not pd.isna(identifiant):
+            return str(identifiant)
+        return hashlib.blake2b(texte.encode("utf-8"), digest_size=8).hexdigest()
+
+    @staticmethod
+    def _nettoyer_textes(textes: pd.Series) -> pd.Series:
+        textes = (
+            textes.astype(str)
+            .str.replace(_BALISES, " ", regex=True)
+            .str.replace(_URLS, "", regex=True)
+        )
+        # split/join équivaut à _ESPACES.sub(" ") puis strip(), en bien plus rapide
+        return pd.Series([" ".join(t.split()) for t in textes], index=textes.index, dtype=object)
+
     @staticmethod
     def _nettoyer_texte(texte: str) -> str:
         texte = str(texte)
-        texte = re.sub(r"<[^>]+>", " ", texte)
-        texte = re.sub(r"http\S+", "", texte)
-        texte = re.sub(r"\s+", " ", texte)
+        texte = _BALISES.sub(" ", texte)
+        texte = _URLS.sub("", texte)
+        texte = _ESPACES.sub(" ", texte)
         return texte.strip()
@@ -0,0 +1,317 @@
+import json
+import os
+import shutil
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterable, Iterator
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from pyarrow import fs
+
+import config
+from src.embeddings import signature_embedder
+
+
+SCHEMA_AVIS = pa.schema(
+    [
+        (config.REVIEW_PRODUCT_COL, pa.string()),
+        (config.REVIEW_ID_COL, pa.string()),
+        (config.REVIEW_TEXT_COL, pa.string()),
+        (config.REVIEW_SUMMARY_COL, pa.string()),
+        # Note gardée telle qu'écrite dans le texte des morceaux (« 4 », pas « 4.0 ») : redécoupage identique
+        (config.REVIEW_RATING_COL, pa.string()),
+    ]
+)
+
+
+def schema_morceaux(dimension: int) -> pa.Schema:
+    return pa.schema(
+        [
+            ("id", pa.string()),
+            ("asin", pa.string()),
+            ("avis_id", pa.string()),
+            ("morceau", pa.int32()),
+            ("note", pa.float64()),
+            ("resume", pa.string()),
+            ("empreinte", pa.string()),
+            ("texte", pa.string()),
+            ("embedding", pa.list_(pa.float32(), dimension)),
+        ]
+    )
+
+
+class ProcessedReviews:
+    """Étape des données traitées : avis nettoyés et morceaux encodés, en Parquet partitionné par produit.
+
+    Chaque fichier source a son dossier, avec deux jeux de données : avis/
+    (avis nettoyés, colonnes du fichier d'origine) et morceaux/ (texte,
+    métadonnées et embedding en colonne Arrow de listes de taille fixe), sous
+    asin=<asin>/. Les lectures ne chargent que les colonnes et les produits
+    demandés, depuis des fichiers projetés en mémoire. Une écriture se fait
+    dans un dossier temporaire qui remplace l'ancien à la fin : un lecteur voit
+    l'ancienne ou la nouvelle version, jamais un mélange des deux.
+    """
+
+    MANIFESTE = "manifeste.json"
+
+    def __init__(self, chemin: str = config.PROCESSED_DATA_PATH, taille_tampon: int = config.PROCESSED_BUFFER_ROWS):
+        self.chemin = Path(chemin)
+        self.chemin.mkdir(parents=True, exist_ok=True)
+        self.taille_tampon = taille_tampon
+
+    @contextmanager
+    def ecrire(self, source: str, modele: str | None = None) -> Iterator["EcritureTraitee"]:
+        """Écrit une nouvelle version des données traitées de source ; elle n'est publiée qu'en fin de bloc."""
+        dossier = self._dossier(source)
+        temporaire = dossier.with_name(f".{dossier.name}.{uuid.uuid4().hex[:8]}")
+        ecriture = EcritureTraitee(temporaire, modele, self.taille_tampon)
+        try:
+            yield ecriture
+            ecriture.terminer()
+            self._publier(temporaire, dossier)
+        finally:
+            shutil.rmtree(temporaire, ignore_errors=True)
+
+    def sources(self) -> list[str]:
+        return sorted(p.name for p in self.chemin.iterdir() if (p / self.MANIFESTE).exists())
+
+    def manifeste(self, source: str) -> dict | None:
+        """Modèle et dimension des embeddings, nombres d'avis et de morceaux ; None si la source est absente."""
+        chemin = self._dossier(source) / self.MANIFESTE
+        if not chemin.exists():
+            return None
+        return json.loads(chemin.read_text(encoding="utf-8"))
+
+    def lire(
+        self, source: str, table: str = "morceaux", colonnes: list[str] | None = None, asins: list[str] | None = None
+    ) -> pa.Table:
+        """Table Arrow des colonnes demandées ; seuls les dossiers des produits demandés sont lus."""
+        return self._dataset(source, table).to_table(columns=colonnes, filter=_filtre(table, asins))
+
+    # Alias pour compatibilité avec l'interface existante
+    def read(
+        self, source: str, table: str = "morceaux", columns: list[str] | None = None, asins: list[str] | None = None
+    ) -> pa.Table:
+        return self.lire(source, table, colonnes=columns, asins=asins)
+
+    def iterer(
+        self,
+        source: str,
+        table: str = "morceaux",
+        colonnes: list[str] | None = None,
+        asins: list[str] | None = None,
+        taille_lot: int = config.INGESTION_BATCH_CHUNKS,
+    ) -> Iterator[pa.Table]:
+        """Parcourt une table par lots d'au plus taille_lot lignes."""
+        lots = self._dataset(source, table).to_batches(columns=colonnes, filter=_filtre(table, asins))
+        return self._regrouper(lots, taille_lot)
+
+    def avis(
+        self, source: str, asins: list[str] | None = None, taille_lot: int = config.INGESTION_BATCH_ROWS
+    ) -> Iterator[pd.DataFrame]:
+        """Avis nettoyés par lots, au format du loader : prêts à être redécoupés sans relire le fichier brut."""
+        for lot in self.iterer(source, "avis", asins=asins, taille_lot=taille_lot):
+            yield lot.to_pandas()
+
+    def morceaux(
+        self, source: str, asins: list[str] | None = None, taille_lot: int = config.INGESTION_BATCH_CHUNKS
+    ) -> Iterator[tuple[list[dict], np.ndarray]]:
+        """Morceaux par lots, au format du préprocesseur, avec leurs embeddings."""
+        colonnes = ["texte", "asin", "note", "resume", "avis_id", "morceau", "embedding"]
+        for lot in self.iterer(source, colonnes=colonnes, asins=asins, taille_lot=taille_lot):
+            documents = [
+                {"text": l["texte"], "metadata": {k: l[k] for k in ("asin", "note", "resume", "avis_id", "morceau")}}
+                for l in lot.drop_columns(["embedding"]).to_pylist()
+            ]
+            yield documents, self.vecteurs(lot["embedding"])
+
+    def reencoder(self, source: str, embedder) -> int:
+        """
+        Recalcule les embeddings des morceaux avec un autre embedder ; retourne le nombre de morceaux.
+
+        Seule la colonne texte est encodée ; chaque fichier est réécrit à l'identique
+        hormis la colonne embedding, et la nouvelle version publiée d'un bloc.
+        """
+        manifeste = self.manifeste(source)
+        if manifeste is None:
+            raise ValueError(f"Aucune donnée traitée pour la source '{source}'")
+        dossier = self._dossier(source)
+        temporaire = dossier.with_name(f".{dossier.name}.{uuid.uuid4().hex[:8]}")
+        total = 0
+        try:
+            shutil.copytree(dossier / "avis", temporaire / "avis")
+            for fragment in self._dataset(source, "morceaux").get_fragments():
+                # Colonnes physiques du fichier : l'asin vient du chemin et n'y est pas stocké
+                table = pq.ParquetFile(fragment.path).read()
+                vecteurs = embedder.encoder(table["texte"].to_pylist())
+                table = table.set_column(
+                    table.schema.get_field_index("embedding"), "embedding", self._colonne_embeddings(vecteurs)
+                )
+                cible = temporaire / "morceaux" / Path(fragment.path).relative_to((dossier / "morceaux").resolve())
+                cible.parent.mkdir(parents=True, exist_ok=True)
+                pq.write_table(table, cible)
+                total += table.num_rows
+                manifeste["dimension"] = vecteurs.shape[1]
+            manifeste["modele"] = signature_embedder(embedder)
+            (temporaire / self.MANIFESTE).write_text(json.dumps(manifeste, indent=2), encoding="utf-8")
+            self._publier(temporaire, dossier)
+        finally:
+            shutil.rmtree(temporaire, ignore_errors=True)
+        return total
+
+    def supprimer(self, source: str) -> None:
+        shutil.rmtree(self._dossier(source), ignore_errors=True)
+
+    @staticmethod
+    def vecteurs(colonne: pa.ChunkedArray | pa.FixedSizeListArray) -> np.ndarray:
+        """Matrice float32 (n, dim) d'une colonne d'embeddings, sans copie si elle tient en un seul bloc."""
+        if isinstance(colonne, pa.ChunkedArray):
+            colonne = colonne.chunk(0) if colonne.num_chunks == 1 else colonne.combine_chunks()
+        dimension = colonne.type.list_size
+        return colonne.flatten().to_numpy(zero_copy_only=False).reshape(-1, dimension)
+
+    def _dossier(self, source: str) -> Path:
+        return self.chemin / Path(source).name
+
+    def _dataset(self, source: str, table: str) -> ds.Dataset:
+        return ds.dataset(
+            str((self._dossier(source) / table).resolve()),
+            format="parquet",
+            partitioning=_partitionnement(table),
+            filesystem=fs.LocalFileSystem(use_mmap=True),
+        )
+
+    @staticmethod
+    def _regrouper(lots: Iterable[pa.RecordBatch], taille: int) -> Iterator[pa.Table]:
+        """Regroupe les petits lots (un par fichier et par produit) en tables d'au plus taille lignes."""
+        en_attente, lignes = [], 0
+        for lot in lots:
+            if lot.num_rows == 0:
+                continue
+            en_attente.append(lot)
+            lignes += lot.num_rows
+            while lignes >= taille:
+                table = pa.Table.from_batches(en_attente)
+                yield table.slice(0, taille)
+                reste = table.slice(taille)
+                en_attente, lignes = reste.to_batches(), reste.num_rows
+        if lignes:
+            yield pa.Table.from_batches(en_attente)
+
+    @staticmethod
+    def _colonne_embeddings(vecteurs: np.ndarray) -> pa.FixedSizeListArray:
+        vecteurs = np.ascontiguousarray(vecteurs, dtype=np.float32)
+        return pa.FixedSizeListArray.from_arrays(pa.array(vecteurs.reshape(-1)), vecteurs.shape[1])
+
+    @staticmethod
+    def _publier(temporaire: Path, dossier: Path) -> None:
+        ancien = dossier.with_name(f".{dossier.name}.ancien.{uuid.uuid4().hex[:8]}")
+        if dossier.exists():
+            os.replace(dossier, ancien)
+        os.replace(temporaire, dossier)
+        shutil.rmtree(ancien, ignore_errors=True)
+
+
+class EcritureTraitee:
+    """Écriture en cours d'une version des données traitées.
+
+    Les lignes sont accumulées jusqu'à taille_tampon avant d'être écrites, un
+    fichier par produit présent : moins de petits fichiers qu'un par lot d'ingestion.
+    """
+
+    def __init__(self, dossier: Path, modele: str | None, taille_tampon: int = config.PROCESSED_BUFFER_ROWS):
+        self.dossier = dossier
+        self.modele = modele
+        self.taille_tampon = taille_tampon
+        self.dimension: int | None = None
+        self.avis = 0
+        self.morceaux = 0
+        self._ecritures = 0
+        self._tampons: dict[str, list[pa.Table]] = {"avis": [], "morceaux": []}
+
+    def ajouter_avis(self, df: pd.DataFrame) -> None:
+        """Ajoute des avis nettoyés ; seules les colonnes utilisées par le pipeline sont gardées."""
+        # Types fixés : d'un lot à l'autre, une colonne vide ou numérique garde le même schéma
+        colonnes = [self._colonne_avis(df, champ) for champ in SCHEMA_AVIS]
+        self._ecrire("avis", pa.Table.from_arrays(colonnes, schema=SCHEMA_AVIS))
+        self.avis += len(df)
+
+    def ajouter_morceaux(
+        self, ids: list[str], textes: list[str], metadonnees: list[dict], embeddings: np.ndarray
+    ) -> None:
+        """Ajoute des morceaux avec leurs embeddings (une ligne de embeddings par id)."""
+        if not ids:
+            return
+        self.dimension = embeddings.shape[1]
+        table = pa.table(
+            {
+                "id": ids,
+                "asin": [m.get("asin", "") for m in metadonnees],
+                "avis_id": [m.get("avis_id") for m in metadonnees],
+                "morceau": [m.get("morceau", 0) for m in metadonnees],
+                "note": [m.get("note") for m in metadonnees],
+                "resume": [m.get("resume") for m in metadonnees],
+                "empreinte": [m.get("empreinte") for m in metadonnees],
+                "texte": textes,
+                "embedding": ProcessedReviews._colonne_embeddings(embeddings),
+            },
+            schema=schema_morceaux(self.dimension),
+        )
+        self._ecrire("morceaux", table)
+        self.morceaux += len(ids)
+
+    def terminer(self) -> None:
+        for table in ("avis", "morceaux"):
+            self._vider(table)
+            (self.dossier / table).mkdir(parents=True, exist_ok=True)
+        manifeste = {"modele": self.modele, "dimension": self.dimension, "avis": self.avis, "morceaux": self.morceaux}
+        (self.dossier / ProcessedReviews.MANIFESTE).write_text(json.dumps(manifeste, indent=2), encoding="utf-8")
+
+    def _ecrire(self, nom: str, table: pa.Table) -> None:
+        if table.num_rows == 0:
+            return
+        self._tampons[nom].append(table)
+        if sum(t.num_rows for t in self._tampons[nom]) >= self.taille_tampon:
+            self._vider(nom)
+
+    def _vider(self, nom: str) -> None:
+        if not self._tampons[nom]:
+            return
+        table = pa.concat_tables(self._tampons[nom])
+        self._tampons[nom] = []
+        ds.write_dataset(
+            table,
+            str(self.dossier / nom),
+            format="parquet",
+            partitioning=_partitionnement(nom),
+            basename_template=f"lot-{self._ecritures:06d}-{{i}}.parquet",
+            existing_data_behavior="overwrite_or_ignore",
+            max_partitions=max(1024, table.num_rows),
+        )
+        self._ecritures += 1
+
+    @staticmethod
+    def _colonne_avis(df: pd.DataFrame, champ: pa.Field) -> pa.Array:
+        if champ.name not in df.columns:
+            return pa.nulls(len(df), champ.type)
+        valeurs = df[champ.name]
+        if pa.types.is_string(champ.type):
+            valeurs = valeurs.map(lambda v: None if pd.isna(v) else str(v))
+        return pa.array(valeurs, type=champ.type, from_pandas=True)
+
+
+def _colonne_partition(table: str) -> str:
+    return config.REVIEW_PRODUCT_COL if table == "avis" else "asin"
+
+
+def _partitionnement(table: str) -> ds.Partitioning:
+    return ds.partitioning(pa.schema([(_colonne_partition(table), pa.string())]), flavor="hive")
+
+
+def _filtre(table: str, asins: list[str] | None) -> ds.Expression | None:
+    return None if asins is None else ds.field(_colonne_partition(table)).isin(list(asins))
@@ -33,3 +33,16 @@ Avis clients :
 {context}
 
 Résumé :"""
+
+
+REDUCE_SUMMARIZE_PROMPT = """Tu es un assistant qui résume les avis clients d'un produit.
+
+Les résumés ci-dessous portent chacun sur une partie des avis du même produit. Fusionne-les en un seul résumé, en regroupant les points similaires et en signalant ceux qui reviennent le plus souvent :
+1. Un résumé général court (2-3 phrases)
+2. Les principaux points forts mentionnés par les clients
+3. Les principaux points faibles ou réclamations mentionnés par les clients
+
+Résumés partiels :
+{context}
+
+Résumé :"""
@@ -0,0 +1,120 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+import config
+
+
+class CrossEncoderReranker:
+    """Reclasse les candidats récupérés avec un cross-encoder local (CPU).
+
+    Les paires (requête, morceau) sont évaluées par lots, dans l'ordre de la
+    récupération, jusqu'à épuisement du budget de temps : les candidats non
+    évalués gardent leur rang initial, après les candidats évalués. Les scores
+    sont conservés dans un cache LRU indexé par (requête, texte du morceau).
+    """
+
+    def __init__(
+        self,
+        model_name: str = config.RERANKER_MODEL,
+        budget_ms: float | None = config.RERANKER_BUDGET_MS,
+        taille_lot: int = config.RERANKER_BATCH_SIZE,
+        max_entrees: int = config.RERANKER_CACHE_MAX_ENTRIES,
+    ):
+        self.model_name = model_name
+        self._model = None
+        self._verrou_modele = threading.Lock()
+        self.budget = None if budget_ms is None else budget_ms / 1000
+        self.taille_lot = taille_lot
+        self.max_entrees = max_entrees
+        self.hits = 0
+        self.misses = 0
+        self.budgets_depasses = 0
+        self._scores: OrderedDict[tuple[str, str], float] = OrderedDict()
+        self._verrou = threading.Lock()
+
+    def reclasser(self, requete: str, resultats: list[dict], k: int) -> list[dict]:
+        """
+        Retourne les k meilleurs candidats selon le cross-encoder.
+
+        Returns:
+            Les dicts des candidats, complétés de la clé score_reranker (None si non évalué).
+        """
+        debut = time.perf_counter()
+        cles = [self._cle(requete, r["text"]) for r in resultats]
+        scores = self._depuis_cache(cles)
+
+        manquants = [i for i, s in enumerate(scores) if s is None]
+        for lot in range(0, len(manquants), self.taille_lot):
+            if self.budget is not None and lot and time.perf_counter() - debut > self.budget:
+                self.budgets_depasses += 1
+                break
+            positions = manquants[lot: lot + self.taille_lot]
+            nouveaux = self.model.predict(
+                [(requete, resultats[i]["text"]) for i in positions],
+                batch_size=self.taille_lot,
+                show_progress_bar=False,
+            )
+            for i, score in zip(positions, np.asarray(nouveaux, dtype=np.float32).tolist()):
+                scores[i] = score
+            self._memoriser([cles[i] for i in positions], [scores[i] for i in positions])
+
+        evalues = sorted((i for i, s in enumerate(scores) if s is not None), key=lambda i: -scores[i])
+        ordre = evalues + [i for i, s in enumerate(scores) if s is None]
+        return [{**resultats[i], "score_reranker": scores[i]} for i in ordre[:k]]
+
+    # Alias pour compatibilité avec l'interface existante
+    def rerank(self, requete: str, resultats: list[dict], k: int) -> list[dict]:
+        return self.reclasser(requete, resultats, k)
+
+    @property
+    def model(self):
+        """Cross-encoder, chargé au premier reclassement (ou par prechauffer)."""
+        if self._model is None:
+            with self._verrou_modele:
+                if self._model is None:
+                    from sentence_transformers import CrossEncoder
+
+                    self._model = CrossEncoder(self.model_name, device="cpu")
+        return self._model
+
+    def prechauffer(self) -> None:
+        self.model.predict([("préchauffage", "préchauffage")], show_progress_bar=False)
+
+    def statistiques(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "taux_succes": self.hits / total if total else 0.0,
+            "budgets_depasses": self.budgets_depasses,
+            "entrees": len(self._scores),
+        }
+
+    def _cle(self, requete: str, texte: str) -> tuple[str, str]:
+        empreinte = hashlib.blake2b(texte.encode("utf-8"), digest_size=16).hexdigest()
+        return " ".join(requete.lower().split()), empreinte
+
+    def _depuis_cache(self, cles: list[tuple[str, str]]) -> list[float | None]:
+        with self._verrou:
+            scores = []
+            for cle in cles:
+                score = self._scores.get(cle)
+                if score is not None:
+                    self._scores.move_to_end(cle)
+                scores.append(score)
+            trouves = sum(s is not None for s in scores)
+            self.hits += trouves
+            self.misses += len(cles) - trouves
+            return scores
+
+    def _memoriser(self, cles: list[tuple[str, str]], scores: list[float]) -> None:
+        with self._verrou:
+            for cle, score in zip(cles, scores):
+                self._scores[cle] = score
+                self._scores.move_to_end(cle)
+            while len(self._scores) > self.max_entrees:
+                self._scores.popitem(last=False)
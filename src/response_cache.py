@@ -0,0 +1,136 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Hashable
+
+import numpy as np
+
+import config
+
+
+@dataclass
+class _Entree:
+    partition: tuple
+    vecteur: np.ndarray | None
+    reponse: dict
+    horodatage: float
+
+
+class ResponseCache:
+    """Cache des réponses du pipeline RAG, indexé par (mode, filtres, version de l'index, question).
+
+    Par défaut seule la question normalisée est comparée. Si seuil_similarite est donné,
+    une question absente peut réutiliser la réponse d'une question proche de la même
+    partition (mode, filtres, version) dont la similarité des embeddings le dépasse.
+    Les entrées expirent après ttl secondes et sont évincées par LRU.
+    """
+
+    def __init__(
+        self,
+        max_entrees: int = config.RESPONSE_CACHE_MAX_ENTRIES,
+        ttl: float | None = config.RESPONSE_CACHE_TTL_SECONDS,
+        seuil_similarite: float | None = None,
+        horloge: Callable[[], float] = time.monotonic,
+    ):
+        self.max_entrees = max_entrees
+        self.ttl = ttl
+        self.seuil_similarite = seuil_similarite
+        self.horloge = horloge
+        self.hits_exacts = 0
+        self.hits_semantiques = 0
+        self.misses = 0
+        self._entrees: OrderedDict[tuple, _Entree] = OrderedDict()
+        self._version: Hashable = None
+        self._verrou = threading.Lock()
+
+    @staticmethod
+    def normaliser(question: str) -> str:
+        return " ".join(question.lower().split()).rstrip(" ?!.")
+
+    def chercher(
+        self,
+        mode: str,
+        filtres: tuple,
+        version: Hashable,
+        question: str,
+        vecteur: np.ndarray | None = None,
+    ) -> dict | None:
+        """Retourne la réponse en cache pour cette question (ou une question proche), sinon None."""
+        partition = (mode, filtres, version)
+        cle = (*partition, self.normaliser(question))
+        with self._verrou:
+            self._changer_version(version)
+            entree = self._entrees.get(cle)
+            if entree is not None and not self._expiree(entree):
+                self._entrees.move_to_end(cle)
+                self.hits_exacts += 1
+                return entree.reponse
+            if vecteur is not None and self.seuil_similarite is not None:
+                cle_proche = self._plus_proche(partition, vecteur)
+                if cle_proche is not None:
+                    self._entrees.move_to_end(cle_proche)
+                    self.hits_semantiques += 1
+                    return self._entrees[cle_proche].reponse
+            self.misses += 1
+            return None
+
+    def stocker(
+        self,
+        mode: str,
+        filtres: tuple,
+        version: Hashable,
+        question: str,
+        reponse: dict,
+        vecteur: np.ndarray | None = None,
+    ) -> None:
+        partition = (mode, filtres, version)
+        cle = (*partition, self.normaliser(question))
+        if vecteur is not None:
+            vecteur = np.asarray(vecteur, dtype=np.float32)
+            vecteur = vecteur / (np.linalg.norm(vecteur) + 1e-10)
+        with self._verrou:
+            self._changer_version(version)
+            self._entrees[cle] = _Entree(partition, vecteur, reponse, self.horloge())
+            self._entrees.move_to_end(cle)
+            while len(self._entrees) > self.max_entrees:
+                self._entrees.popitem(last=False)
+
+    def invalider(self) -> None:
+        with self._verrou:
+            self._entrees.clear()
+
+    def statistiques(self) -> dict:
+        return {
+            "hits_exacts": self.hits_exacts,
+            "hits_semantiques": self.hits_semantiques,
+            "misses": self.misses,
+            "entrees": len(self._entrees),
+        }
+
+    def __len__(self) -> int:
+        return len(self._entrees)
+
+    def _changer_version(self, version: Hashable) -> None:
+        # Une nouvelle version de l'index rend toutes les réponses précédentes obsolètes
+        if version != self._version:
+            self._entrees.clear()
+            self._version = version
+
+    def _expiree(self, entree: _Entree) -> bool:
+        return self.ttl is not None and self.horloge() - entree.horodatage > self.ttl
+
+    def _plus_proche(self, partition: tuple, vecteur: np.ndarray) -> tuple | None:
+        cles, vecteurs = [], []
+        for cle, entree in list(self._entrees.items()):
+            if self._expiree(entree):
+                del self._entrees[cle]
+            elif entree.partition == partition and entree.vecteur is not None:
+                cles.append(cle)
+                vecteurs.append(entree.vecteur)
+        if not cles:
+            return None
+        requete = np.asarray(vecteur, dtype=np.float32)
+        similarites = np.stack(vecteurs) @ (requete / (np.linalg.norm(requete) + 1e-10))
+        meilleur = int(np.argmax(similarites))
+        return cles[meilleur] if similarites[meilleur] >= self.seuil_similarite else None
@@ -1,4 +1,9 @@
+import numpy as np
+
 import config
+from src.context_builder import ContextBuilder
+from src.metrics import metriques
+from src.reranker import CrossEncoderReranker
 from src.vector_store import ReviewVectorStore
 
 
@@ -9,32 +14,113 @@ class ReviewRetriever:
         self,
         store: ReviewVectorStore | None = None,
         max_results: int = config.MAX_RESULTS,
+        hybride: bool = config.HYBRID_SEARCH,
+        n_candidats: int = config.HYBRID_CANDIDATES,
+        rrf_k: int = config.HYBRID_RRF_K,
+        reranker: CrossEncoderReranker | None = None,
+        constructeur: ContextBuilder | None = None,
     ):
         self.store = store or ReviewVectorStore()
         self.max_results = max_results
+        self.hybride = hybride
+        self.n_candidats = max(n_candidats, max_results)
+        self.rrf_k = rrf_k
+        self.reranker = reranker
+        self.constructeur = constructeur
 
-    def rechercher(self, requete: str, filtre_note: float | None = None) -> list[dict]:
+    def rechercher(
+        self,
+        requete: str,
+        filtre_note: float | None = None,
+        asin: str | list[str] | None = None,
+        note_max: float | None = None,
+        vecteur_requete: np.ndarray | None = None,
+    ) -> list[dict]:
         """
         Retourne les k avis les plus pertinents pour une requête.
 
+        Les filtres sont appliqués par la base pendant la recherche : k résultats
+        sont retournés dès que k avis satisfont les filtres. En mode hybride, les
+        classements vectoriel et BM25 sont fusionnés par reciprocal rank fusion.
+        Avec un reranker, n_candidats avis sont récupérés puis reclassés par le
+        cross-encoder, et seuls les max_results meilleurs sont retournés.
+
         Args:
             requete: La question ou la chaîne de recherche de l'utilisateur.
             filtre_note: Si défini, retourne uniquement les avis avec une note >= cette valeur.
+            asin: Si défini, restreint la recherche à ce produit (ou à cette liste de produits).
+            note_max: Si défini, retourne uniquement les avis avec une note <= cette valeur.
+            vecteur_requete: Embedding de la requête s'il a déjà été calculé.
+
+        Returns:
+            Liste de dicts avec les clés : text, metadata, distance (plus score en mode
+            hybride ; distance vaut None pour un avis trouvé par BM25 seul ; plus
+            score_reranker avec un reranker).
+        """
+        filtre = self.store.construire_filtre(note_min=filtre_note, note_max=note_max, asin=asin)
+        if not self.hybride:
+            resultats = self.store.rechercher(
+                requete, n_resultats=self._limite(), filtre=filtre, vecteur_requete=vecteur_requete
+            )
+        else:
+            vectoriels = self.store.rechercher(
+                requete, n_resultats=self.n_candidats, filtre=filtre, vecteur_requete=vecteur_requete
+            )
+            lexicaux = self.store.rechercher_lexicale(
+                requete, self.n_candidats, note_min=filtre_note, note_max=note_max, asin=asin
+            )
+            with metriques.span("fusion"):
+                resultats = self._fusionner(vectoriels, lexicaux)
+        return self._reclasser(requete, resultats)
+
+    # Alias pour compatibilité avec l'interface existante
+    def retrieve(
+        self,
+        requete: str,
+        filter_rating: float | None = None,
+        asin: str | list[str] | None = None,
+        max_rating: float | None = None,
+    ) -> list[dict]:
+        return self.rechercher(requete, filtre_note=filter_rating, asin=asin, note_max=max_rating)
+
+    def rechercher_lot(
+        self,
+        requetes: list[str],
+        filtre_note: float | None = None,
+        asin: str | list[str] | None = None,
+        note_max: float | None = None,
+    ) -> list[list[dict]]:
+        """
+        Variante par lot de rechercher : un seul encodage et une seule requête pour toutes les questions.
 
         Returns:
-            Liste de dicts avec les clés : text, metadata, distance.
+            Une liste de résultats par requête, dans l'ordre des requêtes.
         """
-        resultats = self.store.rechercher(requete, n_resultats=self.max_results * 2)
-        if filtre_note is not None:
-            resultats = [
-                r for r in resultats
-                if r["metadata"].get("note", 0) >= filtre_note
+        filtre = self.store.construire_filtre(note_min=filtre_note, note_max=note_max, asin=asin)
+        if not self.hybride:
+            lots = self.store.rechercher_lot(requetes, n_resultats=self._limite(), filtre=filtre)
+        else:
+            vectoriels = self.store.rechercher_lot(requetes, n_resultats=self.n_candidats, filtre=filtre)
+            lots = [
+                self._fusionner(
+                    v,
+                    self.store.rechercher_lexicale(
+                        r, self.n_candidats, note_min=filtre_note, note_max=note_max, asin=asin
+                    ),
+                )
+                for r, v in zip(requetes, vectoriels)
             ]
-        return resultats[: self.max_results]
+        return [self._reclasser(r, resultats) for r, resultats in zip(requetes, lots)]
 
     # Alias pour compatibilité avec l'interface existante
-    def retrieve(self, requete: str, filter_rating: float | None = None) -> list[dict]:
-        return self.rechercher(requete, filtre_note=filter_rating)
+    def retrieve_batch(
+        self,
+        requetes: list[str],
+        filter_rating: float | None = None,
+        asin: str | list[str] | None = None,
+        max_rating: float | None = None,
+    ) -> list[list[dict]]:
+        return self.rechercher_lot(requetes, filtre_note=filter_rating, asin=asin, note_max=max_rating)
 
     def formater_contexte(self, resultats: list[dict]) -> str:
         """Formate les avis récupérés en une chaîne de contexte pour le LLM."""
@@ -47,3 +133,46 @@ class ReviewRetriever:
     # Alias pour compatibilité avec l'interface existante
     def format_context(self, resultats: list[dict]) -> str:
         return self.formater_contexte(resultats)
+
+    def construire_contexte(self, resultats: list[dict]) -> dict:
+        """
+        Contexte pour le LLM, construit dans le budget de tokens si un constructeur est configuré.
+
+        Returns:
+            Dict avec la clé contexte, plus les mesures du constructeur (tokens, tokens_economises...).
+        """
+        with metriques.span("contexte"):
+            if self.constructeur is None:
+                return {"contexte": self.formater_contexte(resultats)}
+            return self.constructeur.construire(resultats)
+
+    # Alias pour compatibilité avec l'interface existante
+    def build_context(self, resultats: list[dict]) -> dict:
+        return self.construire_contexte(resultats)
+
+    def _fusionner(self, vectoriels: list[dict], lexicaux: list[tuple[str, float]]) -> list[dict]:
+        """Reciprocal rank fusion des deux classements ; seuls les gagnants absents du côté vectoriel sont lus."""
+        scores: dict[str, float] = {}
+        documents: dict[str, dict] = {}
+        for rang, r in enumerate(vectoriels):
+            id_ = self.store.identifiant(r["text"], r["metadata"])
+            scores[id_] = scores.get(id_, 0.0) + 1.0 / (self.rrf_k + rang + 1)
+            documents[id_] = r
+        for rang, (id_, _) in enumerate(lexicaux):
+            scores[id_] = scores.get(id_, 0.0) + 1.0 / (self.rrf_k + rang + 1)
+
+        gagnants = sorted(scores, key=scores.get, reverse=True)[: self._limite()]
+        a_lire = [id_ for id_ in gagnants if id_ not in documents]
+        for doc in self.store.obtenir(a_lire):
+            documents[self.store.identifiant(doc["text"], doc["metadata"])] = {**doc, "distance": None}
+        return [{**documents[id_], "score": scores[id_]} for id_ in gagnants if id_ in documents]
+
+    def _limite(self) -> int:
+        """Nombre de candidats à récupérer : davantage si un reranker fait le tri final."""
+        return self.max_results if self.reranker is None else self.n_candidats
+
+    def _reclasser(self, requete: str, resultats: list[dict]) -> list[dict]:
+        if self.reranker is None:
+            return resultats
+        with metriques.span("reclassement"):
+            return self.reranker.reclasser(requete, resultats, self.max_results)
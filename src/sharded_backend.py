@@ -0,0 +1,370 @@
+import hashlib
+import heapq
+import json
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+import config
+from src.vector_backends import BackendVectoriel, creer_backend
+
+
+class BackendShards:
+    """Backend vectoriel découpé en shards : une collection mmap par valeur d'une métadonnée (asin par défaut).
+
+    Une requête dont le filtre fixe la clé de shard (asin == x, asin in [...]) n'interroge
+    que les shards correspondants : sa latence dépend de la taille du produit, pas de celle
+    du catalogue. Sans filtre sur la clé, tous les shards sont interrogés et leurs résultats fusionnés.
+
+    Les shards ouverts par des requêtes ciblées sont gardés dans un LRU de max_ouverts handles ;
+    les moins récemment utilisés sont fermés (leurs matrices mmap sont libérées). Une requête
+    sans filtre sur la clé passe par des handles de parcours, un par shard, ouverts une fois et
+    gardés : elle ne rouvre aucun shard et ne chasse pas les shards chauds du LRU. Seul le
+    backend mmap est accepté : les collections Chroma d'un même dossier partagent un seul
+    système chromadb, que fermer un handle ne libère pas.
+
+    Le manifeste (shards, nombre de morceaux, génération d'écriture) est relu quand il change
+    sur disque, par exemple pendant une indexation par un autre processus ; chaque shard mmap
+    suit lui-même les écritures faites dans son dossier. La table de routage id -> shard, en
+    ajout seul sur disque, n'est chargée qu'au premier accès par id (écritures, suppressions,
+    lectures par id).
+    """
+
+    FICHIER_MANIFESTE = "shards.json"
+    FICHIER_ROUTAGE = "routage.log"
+    TAILLE_LOT_MAX = 10_000
+
+    def __init__(
+        self,
+        nom_backend: str,
+        persist_path: str,
+        nom_collection: str,
+        cle: str = "asin",
+        max_ouverts: int = config.VECTOR_SHARDS_MAX_OPEN,
+    ):
+        if nom_backend != "mmap":
+            raise ValueError(
+                f"Le découpage en shards n'est disponible qu'avec le backend 'mmap', pas '{nom_backend}'"
+            )
+        self.nom_backend = nom_backend
+        self.persist_path = persist_path
+        self.nom_collection = nom_collection
+        self.cle = cle
+        self.max_ouverts = max(1, max_ouverts)
+        # Les shards mmap sont parcourus exactement, filtres compris
+        self.recherche_exacte = True
+        self.chemin = Path(persist_path) / f"{nom_collection}_shards"
+        self.chemin.mkdir(parents=True, exist_ok=True)
+        self.ouverts: OrderedDict[str, BackendVectoriel] = OrderedDict()
+        self._parcours: dict[str, BackendVectoriel] = {}
+        self._verrou = threading.RLock()
+        self._charger()
+
+    def upsert(self, ids: list[str], embeddings: np.ndarray, documents: list[str], metadatas: list[dict]) -> None:
+        if not ids:
+            return
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        with self._verrou:
+            self._suivre_manifeste()
+            routage = self._routage()
+            par_shard: dict[str, list[int]] = {}
+            for i, meta in enumerate(metadatas):
+                par_shard.setdefault(self._valeur(meta), []).append(i)
+            # Un morceau dont la valeur de la clé a changé quitte son ancien shard
+            self._supprimer([
+                id_ for id_, meta in zip(ids, metadatas) if id_ in routage and routage[id_] != self._valeur(meta)
+            ])
+
+            lignes = []
+            for valeur, positions in par_shard.items():
+                shard = self._shard(valeur, creer=True)
+                taille = shard.taille_lot_max()
+                for debut in range(0, len(positions), taille):
+                    lot = positions[debut: debut + taille]
+                    shard.upsert(
+                        ids=[ids[i] for i in lot],
+                        embeddings=embeddings[lot],
+                        documents=[documents[i] for i in lot],
+                        metadatas=[metadatas[i] for i in lot],
+                    )
+                self._noter_ecriture(valeur, shard)
+                for i in positions:
+                    routage[ids[i]] = valeur
+                    lignes.append(f"+{ids[i]}\t{valeur}\n")
+            self._journaliser(lignes)
+            self._sauvegarder_manifeste()
+
+    def get(
+        self,
+        ids: list[str] | None = None,
+        where: dict | None = None,
+        limit: int | None = None,
+        offset: int | None = None,
+        include: list[str] | None = None,
+    ) -> dict:
+        include = ["documents", "metadatas"] if include is None else include
+        with self._verrou:
+            self._suivre_manifeste()
+            if ids is not None:
+                valeurs = self._valeurs_possibles(where)
+                if valeurs is not None:
+                    # Le filtre désigne déjà les shards : pas besoin de la table de routage
+                    par_shard = {v: list(ids) for v in valeurs if v in self._shards}
+                else:
+                    routage = self._routage()
+                    par_shard = {}
+                    for id_ in ids:
+                        if id_ in routage:
+                            par_shard.setdefault(routage[id_], []).append(id_)
+                pages = [
+                    self._shard(v).get(ids=sous_ids, where=where, include=include)
+                    for v, sous_ids in par_shard.items()
+                ]
+                return self._concatener(pages, include)
+
+            a_sauter, restant = offset or 0, limit
+            pages = []
+            ouvrir = self._acces(where)
+            for valeur in self._candidats(where):
+                if restant is not None and restant <= 0:
+                    break
+                if where is None and a_sauter >= self._shards[valeur]["n"]:
+                    a_sauter -= self._shards[valeur]["n"]
+                    continue
+                shard = ouvrir(valeur)
+                page = shard.get(where=where, limit=restant, offset=a_sauter or None, include=include)
+                if a_sauter and not page["ids"]:
+                    # Le shard n'a pas assez de correspondances : on décompte celles qu'il a
+                    a_sauter -= len(shard.get(where=where, include=[])["ids"])
+                    continue
+                a_sauter = 0
+                if restant is not None:
+                    restant -= len(page["ids"])
+                pages.append(page)
+            return self._concatener(pages, include)
+
+    def query(
+        self,
+        query_embeddings: np.ndarray,
+        n_results: int,
+        where: dict | None = None,
+        include: list[str] | None = None,
+    ) -> dict:
+        include = ["documents", "metadatas", "distances"] if include is None else include
+        requetes = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        with self._verrou:
+            self._suivre_manifeste()
+            valeurs = [v for v in self._candidats(where) if self._shards[v]["n"]]
+            ouvrir = self._acces(where)
+            if len(valeurs) == 1:
+                return ouvrir(valeurs[0]).query(requetes, n_results=n_results, where=where, include=include)
+            # Fusion des k meilleurs de chaque shard : les distances sont comparables entre shards
+            champs = ["ids"] + [c for c in ("documents", "metadatas", "distances") if c in include]
+            candidats: list[list[tuple]] = [[] for _ in range(len(requetes))]
+            for valeur in valeurs:
+                resultat = ouvrir(valeur).query(
+                    requetes, n_results=n_results, where=where, include=sorted({*include, "distances"})
+                )
+                for q in range(len(requetes)):
+                    for j, distance in enumerate(resultat["distances"][q]):
+                        candidats[q].append((distance, valeur, j, {c: resultat[c][q][j] for c in champs}))
+            sortie = {c: [] for c in champs}
+            for top in candidats:
+                top = heapq.nsmallest(n_results, top, key=lambda c: (c[0], c[1], c[2]))
+                for c in champs:
+                    sortie[c].append([t[3][c] for t in top])
+            return sortie
+
+    def delete(self, ids: list[str]) -> None:
+        with self._verrou:
+            self._suivre_manifeste()
+            self._supprimer(ids)
+            self._sauvegarder_manifeste()
+
+    def count(self) -> int:
+        with self._verrou:
+            self._suivre_manifeste()
+            return sum(s["n"] for s in self._shards.values())
+
+    def taille_lot_max(self) -> int:
+        # Chaque shard redécoupe ses écritures selon sa propre limite
+        return self.TAILLE_LOT_MAX
+
+    def reinitialiser(self) -> None:
+        with self._verrou:
+            for valeur in list(self._shards):
+                self._shard(valeur).reinitialiser()
+            self.ouverts.clear()
+            self._parcours.clear()
+            (self.chemin / self.FICHIER_ROUTAGE).unlink(missing_ok=True)
+            (self.chemin / self.FICHIER_MANIFESTE).unlink(missing_ok=True)
+            self._charger()
+
+    def shards(self) -> dict[str, int]:
+        """Nombre de morceaux de chaque shard, sans en ouvrir aucun."""
+        with self._verrou:
+            self._suivre_manifeste()
+            return {valeur: s["n"] for valeur, s in self._shards.items()}
+
+    def _charger(self) -> None:
+        self._shards: dict[str, dict] = {}
+        self._table: dict[str, str] | None = None
+        self._lignes_journal = 0
+        self._etat_manifeste: int | None = None
+        self._suivre_manifeste()
+
+    def _suivre_manifeste(self) -> None:
+        """Relit le manifeste s'il a changé sur disque depuis la dernière lecture ou écriture."""
+        manifeste = self.chemin / self.FICHIER_MANIFESTE
+        try:
+            modifie = manifeste.stat().st_mtime_ns
+        except FileNotFoundError:
+            modifie = None
+        if modifie == self._etat_manifeste:
+            return
+        contenu = {"cle": self.cle, "shards": {}}
+        if modifie is not None:
+            contenu = json.loads(manifeste.read_text(encoding="utf-8"))
+        if contenu["cle"] != self.cle:
+            raise ValueError(
+                f"La base est découpée par '{contenu['cle']}', pas par '{self.cle}' : la réinitialiser puis réindexer"
+            )
+        # Shard supprimé ou recréé ailleurs (réinitialisation) : ses handles sont fermés
+        collections = {v: e["collection"] for v, e in contenu["shards"].items()}
+        for handles in (self.ouverts, self._parcours):
+            for valeur in [v for v in handles if collections.get(v) != self._shards.get(v, {}).get("collection")]:
+                handles.pop(valeur).fermer()
+        if contenu["shards"] != self._shards:
+            self._shards = contenu["shards"]
+            self._table = None
+            self._lignes_journal = 0
+        self._etat_manifeste = modifie
+
+    def _sauvegarder_manifeste(self) -> None:
+        contenu = {"cle": self.cle, "shards": self._shards}
+        tmp = self.chemin / (self.FICHIER_MANIFESTE + ".tmp")
+        tmp.write_text(json.dumps(contenu, ensure_ascii=False), encoding="utf-8")
+        tmp.replace(self.chemin / self.FICHIER_MANIFESTE)
+        self._etat_manifeste = (self.chemin / self.FICHIER_MANIFESTE).stat().st_mtime_ns
+
+    def _noter_ecriture(self, valeur: str, shard: BackendVectoriel) -> None:
+        entree = self._shards[valeur]
+        entree["n"] = shard.count()
+        entree["generation"] = entree.get("generation", 0) + 1
+
+    def _acces(self, filtre: dict | None):
+        """Ouverture des shards d'une requête : par le LRU si le filtre les cible, sinon le temps du parcours."""
+        return self._shard if self._valeurs_possibles(filtre) is not None else self._ouvrir
+
+    def _ouvrir(self, valeur: str) -> BackendVectoriel:
+        """Handle de parcours du shard, hors LRU : celui du LRU s'il y est, sinon ouvert une fois et gardé."""
+        shard = self.ouverts.get(valeur) or self._parcours.get(valeur)
+        if shard is None:
+            shard = creer_backend(self.nom_backend, str(self.chemin), self._shards[valeur]["collection"])
+            self._parcours[valeur] = shard
+        return shard
+
+    def _shard(self, valeur: str, creer: bool = False) -> BackendVectoriel:
+        """Handle du shard, ouvert au besoin ; le shard le moins récemment utilisé est fermé au-delà de max_ouverts."""
+        shard = self.ouverts.get(valeur)
+        if shard is not None:
+            self.ouverts.move_to_end(valeur)
+            return shard
+        if valeur not in self._shards:
+            if not creer:
+                raise KeyError(valeur)
+            nom = f"{self.nom_collection}_{hashlib.blake2b(valeur.encode('utf-8'), digest_size=8).hexdigest()}"
+            self._shards[valeur] = {"collection": nom, "n": 0}
+        shard = self._parcours.get(valeur) or creer_backend(
+            self.nom_backend, str(self.chemin), self._shards[valeur]["collection"]
+        )
+        self.ouverts[valeur] = shard
+        while len(self.ouverts) > self.max_ouverts:
+            ancienne, chasse = self.ouverts.popitem(last=False)
+            if ancienne not in self._parcours:
+                chasse.fermer()
+        return shard
+
+    def _routage(self) -> dict[str, str]:
+        """Table id -> valeur de la clé, rejouée depuis le journal au premier besoin."""
+        if self._table is None:
+            self._table = {}
+            journal = self.chemin / self.FICHIER_ROUTAGE
+            if journal.exists():
+                with open(journal, encoding="utf-8") as f:
+                    for ligne in f:
+                        self._lignes_journal += 1
+                        ligne = ligne.rstrip("\n")
+                        if ligne[0] == "+":
+                            id_, valeur = ligne[1:].split("\t", 1)
+                            self._table[id_] = valeur
+                        else:
+                            self._table.pop(ligne[1:], None)
+        return self._table
+
+    def _journaliser(self, lignes: list[str]) -> None:
+        if not lignes:
+            return
+        with open(self.chemin / self.FICHIER_ROUTAGE, "a", encoding="utf-8") as f:
+            f.writelines(lignes)
+        self._lignes_journal += len(lignes)
+        if self._lignes_journal >= 10_000 and self._lignes_journal > 2 * len(self._table):
+            # Compactage : une ligne par morceau vivant
+            tmp = self.chemin / (self.FICHIER_ROUTAGE + ".tmp")
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.writelines(f"+{id_}\t{valeur}\n" for id_, valeur in self._table.items())
+            tmp.replace(self.chemin / self.FICHIER_ROUTAGE)
+            self._lignes_journal = len(self._table)
+
+    def _supprimer(self, ids: list[str]) -> None:
+        routage = self._routage()
+        par_shard: dict[str, list[str]] = {}
+        for id_ in ids:
+            if id_ in routage:
+                par_shard.setdefault(routage.pop(id_), []).append(id_)
+        for valeur, sous_ids in par_shard.items():
+            shard = self._shard(valeur)
+            shard.delete(ids=sous_ids)
+            self._noter_ecriture(valeur, shard)
+        self._journaliser([f"-{id_}\n" for sous_ids in par_shard.values() for id_ in sous_ids])
+
+    def _valeur(self, metadonnees: dict) -> str:
+        return str(metadonnees.get(self.cle, ""))
+
+    def _candidats(self, filtre: dict | None) -> list[str]:
+        valeurs = self._valeurs_possibles(filtre)
+        if valeurs is None:
+            return sorted(self._shards)
+        return sorted(v for v in valeurs if v in self._shards)
+
+    def _valeurs_possibles(self, filtre: dict | None) -> set[str] | None:
+        """Valeurs de la clé compatibles avec le filtre (None : tous les shards sont à interroger)."""
+        if filtre is None:
+            return None
+        if "$and" in filtre:
+            ensembles = [e for e in map(self._valeurs_possibles, filtre["$and"]) if e is not None]
+            return set.intersection(*ensembles) if ensembles else None
+        condition = filtre.get(self.cle)
+        if condition is None:
+            return None
+        if not isinstance(condition, dict):
+            return {str(condition)}
+        if "$eq" in condition:
+            return {str(condition["$eq"])}
+        if "$in" in condition:
+            return set(map(str, condition["$in"]))
+        return None
+
+    @staticmethod
+    def _concatener(pages: list[dict], include: list[str]) -> dict:
+        sortie = {"ids": []}
+        for champ in ("documents", "metadatas", "embeddings"):
+            if champ in include:
+                sortie[champ] = []
+        for page in pages:
+            for champ, valeurs in sortie.items():
+                if page.get(champ) is not None:
+                    valeurs.extend(page[champ])
+        return sortie
@@ -0,0 +1,108 @@
+from typing import Protocol
+
+import numpy as np
+
+
+class BackendVectoriel(Protocol):
+    """Sous-ensemble de l'API de collection Chroma utilisé par ReviewVectorStore.
+
+    Les réponses de get et query suivent le format Chroma : dicts de listes
+    (ids, documents, metadatas, embeddings, distances), une liste par requête pour query.
+    """
+
+    # Vrai si query est exacte, filtres compris : le store n'a alors pas de repli à prévoir
+    recherche_exacte: bool
+
+    def upsert(
+        self, ids: list[str], embeddings: np.ndarray, documents: list[str], metadatas: list[dict]
+    ) -> None: ...
+
+    def get(
+        self,
+        ids: list[str] | None = None,
+        where: dict | None = None,
+        limit: int | None = None,
+        offset: int | None = None,
+        include: list[str] | None = None,
+    ) -> dict: ...
+
+    def query(
+        self,
+        query_embeddings: np.ndarray,
+        n_results: int,
+        where: dict | None = None,
+        include: list[str] | None = None,
+    ) -> dict: ...
+
+    def delete(self, ids: list[str]) -> None: ...
+
+    def count(self) -> int: ...
+
+    def taille_lot_max(self) -> int: ...
+
+    def reinitialiser(self) -> None: ...
+
+
+class BackendChroma:
+    """Collection ChromaDB persistante (index HNSW, distance cosinus)."""
+
+    recherche_exacte = False
+
+    def __init__(self, persist_path: str, nom_collection: str):
+        # Import différé : chromadb n'est chargé que si ce backend est utilisé
+        import chromadb
+
+        self.client = chromadb.PersistentClient(path=persist_path)
+        self.nom_collection = nom_collection
+        self.collection = self._ouvrir()
+
+    def upsert(self, ids, embeddings, documents, metadatas) -> None:
+        self.collection.upsert(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+
+    def get(self, ids=None, where=None, limit=None, offset=None, include=None) -> dict:
+        if include is None:
+            include = ["documents", "metadatas"]
+        return self.collection.get(ids=ids, where=where, limit=limit, offset=offset, include=include)
+
+    def query(self, query_embeddings, n_results, where=None, include=None) -> dict:
+        if include is None:
+            include = ["documents", "metadatas", "distances"]
+        return self.collection.query(
+            query_embeddings=query_embeddings, n_results=n_results, where=where, include=include
+        )
+
+    def delete(self, ids: list[str]) -> None:
+        self.collection.delete(ids=ids)
+
+    def count(self) -> int:
+        return self.collection.count()
+
+    def taille_lot_max(self) -> int:
+        return self.client.get_max_batch_size()
+
+    def reinitialiser(self) -> None:
+        self.client.delete_collection(self.nom_collection)
+        self.collection = self._ouvrir()
+
+    def _ouvrir(self):
+        return self.client.get_or_create_collection(
+            name=self.nom_collection,
+            metadata={"hnsw:space": "cosine"},
+        )
+
+
+def creer_backend(
+    nom: str, persist_path: str, nom_collection: str, cle_shard: str | None = None
+) -> BackendVectoriel:
+    """Instancie le backend configuré : "chroma" ou "mmap", découpé en shards par cle_shard si elle est définie."""
+    if cle_shard is not None:
+        from src.sharded_backend import BackendShards
+
+        return BackendShards(nom, persist_path, nom_collection, cle=cle_shard)
+    if nom == "chroma":
+        return BackendChroma(persist_path, nom_collection)
+    if nom == "mmap":
+        from src.mmap_backend import BackendMmap
+
+        return BackendMmap(f"{persist_path}/{nom_collection}")
+    raise ValueError(f"Backend vectoriel inconnu '{nom}'. Choisir parmi : ['chroma', 'mmap']")
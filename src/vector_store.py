@@ -1,84 +1,449 @@
-import uuid
+import hashlib
+import heapq
+from operator import itemgetter
 from pathlib import Path
 
-import chromadb
+import numpy as np
 
 import config
-from src.embeddings import LocalEmbedder
+from src.embedding_scheduler import EmbeddingScheduler
+from src.embeddings import LocalEmbedder, signature_embedder
+from src.lexical_index import LexicalIndex
+from src.metrics import metriques
+from src.vector_backends import BackendVectoriel, creer_backend
 
 
 class ReviewVectorStore:
-    """Base vectorielle ChromaDB pour les avis produits."""
+    """Base vectorielle des avis produits, sur ChromaDB ou sur le backend mmap natif, éventuellement découpés en shards."""
 
     NOM_COLLECTION = "avis_produits"
+    FICHIER_GENERATION = "generation"
 
     def __init__(
         self,
         persist_path: str = config.VECTOR_STORE_PATH,
         embedder: LocalEmbedder | None = None,
+        seuil_recherche_exacte: int = config.FILTER_EXACT_SEARCH_THRESHOLD,
+        planificateur: EmbeddingScheduler | None = None,
+        backend: BackendVectoriel | None = None,
     ):
         Path(persist_path).mkdir(parents=True, exist_ok=True)
         self.embedder = embedder or LocalEmbedder()
-        self.client = chromadb.PersistentClient(path=persist_path)
-        self.collection = self.client.get_or_create_collection(
-            name=self.NOM_COLLECTION,
-            metadata={"hnsw:space": "cosine"},
+        # Les requêtes concurrentes sont encodées ensemble par micro-lots
+        self.planificateur = planificateur or EmbeddingScheduler(self.embedder)
+        self.seuil_recherche_exacte = seuil_recherche_exacte
+        # Un octet ajouté à chaque écriture, quel que soit le processus : sa taille sert de version
+        self._fichier_generation = Path(persist_path) / self.FICHIER_GENERATION
+        self.backend = backend or creer_backend(
+            config.VECTOR_BACKEND, persist_path, self.NOM_COLLECTION, config.VECTOR_SHARD_KEY
         )
+        # Index BM25 tenu à jour à chaque écriture dans la collection
+        self.index_lexical = LexicalIndex(str(Path(persist_path) / "bm25"))
+        if len(self.index_lexical) == 0 and self.backend.count() > 0:
+            self.reconstruire_index_lexical()
 
     def ajouter_documents(self, documents: list[dict]) -> None:
-        """Indexe une liste de documents (texte + métadonnées)."""
+        """Indexe une liste de documents (texte + métadonnées).
+
+        Les identifiants étant déterministes, réindexer un document le remplace.
+        """
         if not documents:
             return
-        textes = [d["text"] for d in documents]
-        metadonnees = [d["metadata"] for d in documents]
-        ids = [str(uuid.uuid4()) for _ in documents]
-        embeddings = self.embedder.encoder(textes)
-        self.collection.add(
-            ids=ids,
-            embeddings=embeddings,
-            documents=textes,
-            metadatas=metadonnees,
-        )
+        ids, textes, metadonnees, _ = self._preparer(documents)
+        self._ecrire(ids, textes, metadonnees)
 
     # Alias pour compatibilité avec l'interface existante
     def add_documents(self, documents: list[dict]) -> None:
         return self.ajouter_documents(documents)
 
-    def rechercher(self, texte_requete: str, n_resultats: int = config.MAX_RESULTS) -> list[dict]:
-        """Retourne les k documents les plus proches pour une requête."""
-        vecteur_requete = self.embedder.encoder_requete(texte_requete)
-        resultats = self.collection.query(
-            query_embeddings=[vecteur_requete],
-            n_results=n_resultats,
-            include=["documents", "metadatas", "distances"],
+    def synchroniser(
+        self,
+        documents: list[dict],
+        supprimer_absents: bool = True,
+        embeddings: np.ndarray | None = None,
+        avec_embeddings: bool = False,
+    ) -> dict:
+        """
+        Met à jour l'index de façon incrémentale à partir d'un jeu de documents.
+
+        Seuls les morceaux nouveaux ou modifiés sont encodés et écrits ; si
+        supprimer_absents est vrai, les morceaux absents du jeu sont supprimés.
+        embeddings (une ligne par document), s'il est fourni, évite l'encodage.
+
+        Returns:
+            Dict avec les clés : ajoutes, modifies, inchanges, supprimes. Si
+            avec_embeddings est vrai, aussi ids, textes, metadonnees et embeddings
+            de tous les morceaux du jeu, inchangés compris.
+        """
+        ids, textes, metadonnees, vecteurs = self._preparer(documents, embeddings)
+        with metriques.span("empreintes"):
+            existants = self._empreintes_existantes(ids)
+
+        a_ecrire = [
+            i for i, (id_, meta) in enumerate(zip(ids, metadonnees))
+            if existants.get(id_) != meta["empreinte"]
+        ]
+        modifies = sum(1 for i in a_ecrire if ids[i] in existants)
+        ecrits = self._ecrire(
+            [ids[i] for i in a_ecrire],
+            [textes[i] for i in a_ecrire],
+            [metadonnees[i] for i in a_ecrire],
+            None if vecteurs is None else vecteurs[a_ecrire],
         )
-        sortie = []
-        for texte, meta, dist in zip(
-            resultats["documents"][0],
-            resultats["metadatas"][0],
-            resultats["distances"][0],
-        ):
-            sortie.append({"text": texte, "metadata": meta, "distance": dist})
-        return sortie
+
+        supprimes = self.supprimer_absents(set(ids)) if supprimer_absents else 0
+
+        bilan = {
+            "ajoutes": len(a_ecrire) - modifies,
+            "modifies": modifies,
+            "inchanges": len(ids) - len(a_ecrire),
+            "supprimes": supprimes,
+        }
+        if avec_embeddings:
+            if vecteurs is None:
+                vecteurs = self._embeddings_jeu(ids, a_ecrire, ecrits)
+            bilan.update(ids=ids, textes=textes, metadonnees=metadonnees, embeddings=vecteurs)
+        return bilan
 
     # Alias pour compatibilité avec l'interface existante
-    def query(self, texte_requete: str, n_results: int = config.MAX_RESULTS) -> list[dict]:
-        return self.rechercher(texte_requete, n_results)
+    def sync(self, documents: list[dict], delete_missing: bool = True) -> dict:
+        return self.synchroniser(documents, supprimer_absents=delete_missing)
+
+    def supprimer(self, ids: list[str]) -> None:
+        if ids:
+            self._nouvelle_generation()
+            self.index_lexical.supprimer(ids)
+        taille = self.backend.taille_lot_max()
+        for debut in range(0, len(ids), taille):
+            self.backend.delete(ids=ids[debut: debut + taille])
+
+    def supprimer_absents(self, ids_gardes: set[str]) -> int:
+        """Supprime tous les morceaux dont l'id n'est pas dans ids_gardes ; retourne leur nombre."""
+        obsoletes = [id_ for id_ in self._lister_ids() if id_ not in ids_gardes]
+        self.supprimer(obsoletes)
+        return len(obsoletes)
+
+    def rechercher(
+        self,
+        texte_requete: str,
+        n_resultats: int = config.MAX_RESULTS,
+        filtre: dict | None = None,
+        vecteur_requete: np.ndarray | None = None,
+    ) -> list[dict]:
+        """
+        Retourne les k documents les plus proches pour une requête.
+
+        Args:
+            filtre: Clause where Chroma (voir construire_filtre) appliquée pendant la recherche.
+            vecteur_requete: Embedding de la requête s'il a déjà été calculé.
+        """
+        if vecteur_requete is None:
+            with metriques.span("encodage_requete"):
+                vecteur_requete = self.planificateur.encoder_requete(texte_requete)
+        with metriques.span("requete_vectorielle"):
+            return self._requeter(vecteur_requete[np.newaxis, :], n_resultats, filtre)[0]
+
+    # Alias pour compatibilité avec l'interface existante
+    def query(
+        self, texte_requete: str, n_results: int = config.MAX_RESULTS, where: dict | None = None
+    ) -> list[dict]:
+        return self.rechercher(texte_requete, n_results, filtre=where)
+
+    def rechercher_lot(
+        self,
+        textes_requetes: list[str],
+        n_resultats: int = config.MAX_RESULTS,
+        filtre: dict | None = None,
+    ) -> list[list[dict]]:
+        """Recherche plusieurs requêtes en un seul encodage et une seule requête Chroma."""
+        if not textes_requetes:
+            return []
+        with metriques.span("encodage_requete"):
+            vecteurs = self.embedder.encoder_requetes(textes_requetes)
+        with metriques.span("requete_vectorielle"):
+            return self._requeter(vecteurs, n_resultats, filtre)
+
+    # Alias pour compatibilité avec l'interface existante
+    def query_batch(
+        self, textes_requetes: list[str], n_results: int = config.MAX_RESULTS, where: dict | None = None
+    ) -> list[list[dict]]:
+        return self.rechercher_lot(textes_requetes, n_results, filtre=where)
+
+    def rechercher_lexicale(
+        self,
+        texte_requete: str,
+        n_resultats: int = config.MAX_RESULTS,
+        note_min: float | None = None,
+        note_max: float | None = None,
+        asin: str | list[str] | None = None,
+    ) -> list[tuple[str, float]]:
+        """Recherche BM25 dans l'index lexical ; retourne des tuples (id, score) sans lire Chroma."""
+        with metriques.span("recherche_lexicale"):
+            return self.index_lexical.rechercher(
+                texte_requete, n_resultats, note_min=note_min, note_max=note_max, asin=asin
+            )
+
+    def obtenir(self, ids: list[str]) -> list[dict]:
+        """Lit des documents par id, dans l'ordre des ids (les ids absents sont ignorés)."""
+        if not ids:
+            return []
+        page = self.backend.get(ids=ids, include=["documents", "metadatas"])
+        par_id = {
+            id_: {"text": texte, "metadata": meta}
+            for id_, texte, meta in zip(page["ids"], page["documents"], page["metadatas"])
+        }
+        return [par_id[id_] for id_ in ids if id_ in par_id]
+
+    def empreintes_produits(self) -> dict[str, str]:
+        """Empreinte du contenu indexé de chaque produit, calculée à partir des seules métadonnées."""
+        par_asin: dict[str, list[str]] = {}
+        for page in self._pages(include=["metadatas"]):
+            for id_, meta in zip(page["ids"], page["metadatas"]):
+                par_asin.setdefault(meta.get("asin", ""), []).append(f"{id_}:{meta.get('empreinte')}")
+        return {asin: self.empreinte("\n".join(sorted(e))) for asin, e in par_asin.items()}
+
+    def documents_produit(self, asin: str) -> list[dict]:
+        """Tous les morceaux d'un produit, dans l'ordre des avis puis du texte."""
+        documents = [
+            {"text": texte, "metadata": meta}
+            for page in self._pages(where={"asin": {"$eq": asin}}, include=["documents", "metadatas"])
+            for texte, meta in zip(page["documents"], page["metadatas"])
+        ]
+        return sorted(documents, key=lambda d: (str(d["metadata"].get("avis_id", "")), d["metadata"].get("morceau", 0)))
+
+    def reconstruire_index_lexical(self) -> None:
+        """Reconstruit l'index BM25 à partir du contenu de la collection."""
+        self.index_lexical.vider()
+        for page in self._pages(include=["documents", "metadatas"]):
+            self.index_lexical.ajouter(page["ids"], page["documents"], page["metadatas"])
+        self.index_lexical.sauvegarder()
+
+    @staticmethod
+    def construire_filtre(
+        note_min: float | None = None,
+        note_max: float | None = None,
+        asin: str | list[str] | None = None,
+    ) -> dict | None:
+        """Traduit les filtres produit et note en clause where Chroma (None si aucun filtre)."""
+        conditions = []
+        if asin is not None:
+            conditions.append({"asin": {"$in": list(asin)} if isinstance(asin, list) else {"$eq": asin}})
+        if note_min is not None:
+            conditions.append({"note": {"$gte": float(note_min)}})
+        if note_max is not None:
+            conditions.append({"note": {"$lte": float(note_max)}})
+        if not conditions:
+            return None
+        return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+    @property
+    def version(self) -> int:
+        """
+        Génération de l'index, persistée : change à chaque écriture, y compris depuis un autre processus
+        (indexer.py), ce qui invalide les caches de réponses.
+        """
+        try:
+            return self._fichier_generation.stat().st_size
+        except FileNotFoundError:
+            return 0
 
     def compter(self) -> int:
-        return self.collection.count()
+        return self.backend.count()
 
     # Alias pour compatibilité avec l'interface existante
     def count(self) -> int:
         return self.compter()
 
     def reinitialiser(self) -> None:
-        self.client.delete_collection(self.NOM_COLLECTION)
-        self.collection = self.client.get_or_create_collection(
-            name=self.NOM_COLLECTION,
-            metadata={"hnsw:space": "cosine"},
-        )
+        self._nouvelle_generation()
+        self.index_lexical.vider()
+        self.backend.reinitialiser()
 
     # Alias pour compatibilité avec l'interface existante
     def reset(self) -> None:
         return self.reinitialiser()
+
+    def _nouvelle_generation(self) -> None:
+        # Ajout en mode append : atomique entre processus, la taille ne fait que croître
+        with open(self._fichier_generation, "ab") as f:
+            f.write(b".")
+
+    @staticmethod
+    def empreinte(texte: str) -> str:
+        return hashlib.blake2b(texte.encode("utf-8"), digest_size=8).hexdigest()
+
+    @classmethod
+    def identifiant(cls, texte: str, metadonnees: dict) -> str:
+        """Identifiant déterministe d'un morceau : (asin, avis, index du morceau)."""
+        avis_id = metadonnees.get("avis_id") or cls.empreinte(texte)
+        cle = f"{metadonnees.get('asin', '')}\x00{avis_id}\x00{metadonnees.get('morceau', 0)}"
+        return hashlib.blake2b(cle.encode("utf-8"), digest_size=16).hexdigest()
+
+    @staticmethod
+    def _formater_resultats(resultats: dict) -> list[list[dict]]:
+        """Convertit une réponse de backend.query en une liste de résultats par requête."""
+        return [
+            [
+                {"text": texte, "metadata": meta, "distance": dist}
+                for texte, meta, dist in zip(textes, metas, distances)
+            ]
+            for textes, metas, distances in zip(
+                resultats["documents"], resultats["metadatas"], resultats["distances"]
+            )
+        ]
+
+    def _requeter(self, vecteurs: np.ndarray, n_resultats: int, filtre: dict | None) -> list[list[dict]]:
+        """
+        Recherche filtrée adaptative : un ensemble filtré petit est parcouru exactement,
+        sinon le filtre est appliqué dans l'index HNSW, avec repli exact s'il ne trouve pas k voisins.
+        Un backend à recherche exacte est interrogé directement.
+        """
+        if self.backend.recherche_exacte:
+            return self._formater_resultats(
+                self.backend.query(
+                    query_embeddings=vecteurs,
+                    n_results=n_resultats,
+                    where=filtre,
+                    include=["documents", "metadatas", "distances"],
+                )
+            )
+        if filtre is not None:
+            candidats = self.backend.get(
+                where=filtre, include=[], limit=self.seuil_recherche_exacte + 1
+            )["ids"]
+            if len(candidats) <= self.seuil_recherche_exacte:
+                return self._recherche_exacte(vecteurs, n_resultats, ids=candidats)
+        try:
+            resultats = self.backend.query(
+                query_embeddings=vecteurs,
+                n_results=n_resultats,
+                where=filtre,
+                include=["documents", "metadatas", "distances"],
+            )
+        except RuntimeError:
+            # hnswlib échoue lorsque le filtre écarte trop de voisins du graphe
+            return self._recherche_exacte(vecteurs, n_resultats, filtre=filtre)
+        sortie = self._formater_resultats(resultats)
+        if filtre is not None and any(len(r) < n_resultats for r in sortie):
+            return self._recherche_exacte(vecteurs, n_resultats, filtre=filtre)
+        return sortie
+
+    def _recherche_exacte(
+        self,
+        vecteurs: np.ndarray,
+        n_resultats: int,
+        ids: list[str] | None = None,
+        filtre: dict | None = None,
+    ) -> list[list[dict]]:
+        """Parcours exhaustif (distance cosinus) des documents désignés par ids ou par filtre."""
+        with metriques.span("recherche_exacte"):
+            return self._parcourir(vecteurs, n_resultats, ids, filtre)
+
+    def _parcourir(
+        self,
+        vecteurs: np.ndarray,
+        n_resultats: int,
+        ids: list[str] | None,
+        filtre: dict | None,
+    ) -> list[list[dict]]:
+        requetes = vecteurs / (np.linalg.norm(vecteurs, axis=1, keepdims=True) + 1e-10)
+        meilleurs: list[list[tuple]] = [[] for _ in range(len(requetes))]
+        if ids is not None:
+            pages = [self.backend.get(ids=ids, include=["embeddings", "documents", "metadatas"])] if ids else []
+        else:
+            pages = self._pages(where=filtre, include=["embeddings", "documents", "metadatas"])
+        for page in pages:
+            embeddings = np.asarray(page["embeddings"], dtype=np.float32)
+            embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True) + 1e-10
+            similarites = requetes @ embeddings.T
+            for q, ligne in enumerate(similarites):
+                candidats = [
+                    (float(ligne[j]), page["documents"][j], page["metadatas"][j])
+                    for j in np.argsort(-ligne)[:n_resultats]
+                ]
+                meilleurs[q] = heapq.nlargest(n_resultats, meilleurs[q] + candidats, key=itemgetter(0))
+        return [
+            [{"text": texte, "metadata": meta, "distance": 1.0 - sim} for sim, texte, meta in top]
+            for top in meilleurs
+        ]
+
+    def _pages(self, **kwargs):
+        """Parcourt backend.get par pages de la taille maximale d'un lot du backend."""
+        taille = self.backend.taille_lot_max()
+        offset = 0
+        while True:
+            page = self.backend.get(limit=taille, offset=offset, **kwargs)
+            if page["ids"]:
+                yield page
+            if len(page["ids"]) < taille:
+                return
+            offset += taille
+
+    def _preparer(
+        self, documents: list[dict], embeddings: np.ndarray | None = None
+    ) -> tuple[list[str], list[str], list[dict], np.ndarray | None]:
+        """Calcule ids et empreintes ; en cas de doublon, le dernier document l'emporte.
+
+        L'empreinte couvre le texte et l'embedder : après un changement de modèle,
+        tous les morceaux sont considérés comme modifiés et leurs vecteurs réécrits.
+        """
+        modele = signature_embedder(self.embedder)
+        par_id = {}
+        for i, d in enumerate(documents):
+            meta = {**d["metadata"], "empreinte": self.empreinte(f"{modele}\n{d['text']}")}
+            par_id[self.identifiant(d["text"], meta)] = (d["text"], meta, i)
+        ids = list(par_id)
+        textes = [t for t, _, _ in par_id.values()]
+        metadonnees = [m for _, m, _ in par_id.values()]
+        if embeddings is not None:
+            embeddings = np.asarray(embeddings, dtype=np.float32)[[i for _, _, i in par_id.values()]]
+        return ids, textes, metadonnees, embeddings
+
+    def _ecrire(
+        self, ids: list[str], textes: list[str], metadonnees: list[dict], embeddings: np.ndarray | None = None
+    ) -> np.ndarray | None:
+        if not ids:
+            return None
+        self._nouvelle_generation()
+        if embeddings is None:
+            with metriques.span("encodage"):
+                embeddings = self.embedder.encoder(textes)
+        taille = self.backend.taille_lot_max()
+        with metriques.span("ecriture"):
+            for debut in range(0, len(ids), taille):
+                fin = debut + taille
+                self.backend.upsert(
+                    ids=ids[debut:fin],
+                    embeddings=embeddings[debut:fin],
+                    documents=textes[debut:fin],
+                    metadatas=metadonnees[debut:fin],
+                )
+        with metriques.span("index_lexical"):
+            self.index_lexical.ajouter(ids, textes, metadonnees)
+        return embeddings
+
+    def _embeddings_jeu(self, ids: list[str], a_ecrire: list[int], ecrits: np.ndarray | None) -> np.ndarray:
+        """Embeddings de tout un jeu : ceux qui viennent d'être calculés, les autres relus dans le backend."""
+        if not ids:
+            return np.empty((0, 0), dtype=np.float32)
+        calcules = dict(zip(a_ecrire, ecrits)) if a_ecrire else {}
+        relus = {}
+        inchanges = [id_ for i, id_ in enumerate(ids) if i not in calcules]
+        taille = self.backend.taille_lot_max()
+        for debut in range(0, len(inchanges), taille):
+            page = self.backend.get(ids=inchanges[debut: debut + taille], include=["embeddings"])
+            relus.update(zip(page["ids"], page["embeddings"]))
+        lignes = [calcules[i] if i in calcules else relus[id_] for i, id_ in enumerate(ids)]
+        return np.asarray(lignes, dtype=np.float32)
+
+    def _empreintes_existantes(self, ids: list[str]) -> dict[str, str]:
+        empreintes = {}
+        taille = self.backend.taille_lot_max()
+        for debut in range(0, len(ids), taille):
+            existants = self.backend.get(ids=ids[debut: debut + taille], include=["metadatas"])
+            for id_, meta in zip(existants["ids"], existants["metadatas"]):
+                empreintes[id_] = (meta or {}).get("empreinte")
+        return empreintes
+
+    def _lister_ids(self) -> list[str]:
+        return [id_ for page in self._pages(include=[]) for id_ in page["ids"]]
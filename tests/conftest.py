@@ -0,0 +1,49 @@
+import hashlib
+
+import numpy as np
+import pytest
+
+from src.vector_backends import creer_backend
+from src.vector_store import ReviewVectorStore
+
+
+class FakeEmbedder:
+    """Embedder déterministe sans modèle : sac de mots haché sur 32 dimensions."""
+
+    model_name = "fake"
+    dimension = 32
+
+    def __init__(self):
+        self.nb_encodes = 0
+
+    def _vecteur(self, texte: str) -> np.ndarray:
+        v = np.zeros(self.dimension, dtype=np.float32)
+        for mot in texte.lower().split():
+            h = int(hashlib.md5(mot.encode("utf-8")).hexdigest(), 16)
+            v[h % self.dimension] += 1.0
+        return v / (np.linalg.norm(v) + 1e-10)
+
+    def encoder(self, textes: list[str]) -> np.ndarray:
+        self.nb_encodes += len(textes)
+        return np.array([self._vecteur(t) for t in textes], dtype=np.float32).reshape(-1, self.dimension)
+
+    def encoder_requete(self, texte: str) -> np.ndarray:
+        return self._vecteur(texte)
+
+    def encoder_requetes(self, textes: list[str]) -> np.ndarray:
+        return np.array([self._vecteur(t) for t in textes], dtype=np.float32)
+
+
+@pytest.fixture
+def fake_embedder():
+    return FakeEmbedder()
+
+
+@pytest.fixture(params=["chroma", "mmap", "shards"])
+def store(request, tmp_path, fake_embedder):
+    chemin = str(tmp_path / "store")
+    if request.param == "shards":
+        backend = creer_backend("mmap", chemin, ReviewVectorStore.NOM_COLLECTION, cle_shard="asin")
+    else:
+        backend = creer_backend(request.param, chemin, ReviewVectorStore.NOM_COLLECTION)
+    return ReviewVectorStore(persist_path=chemin, embedder=fake_embedder, backend=backend)
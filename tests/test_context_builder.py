@@ -0,0 +1,70 @@
+from src.context_builder import ContextBuilder
+from src.preprocessor import ReviewPreprocessor
+
+
+def _resultat(texte, avis_id, morceau=0, note=5.0, asin="B001"):
+    return {"text": texte, "metadata": {"asin": asin, "avis_id": avis_id, "morceau": morceau, "note": note}}
+
+
+def test_near_duplicates_are_kept_once_at_best_rank():
+    builder = ContextBuilder(budget_tokens=1_000)
+    resultats = [
+        _resultat("Le moteur est très bruyant la nuit, impossible de dormir à côté.", "a"),
+        _resultat("Livraison rapide et emballage soigné.", "b"),
+        _resultat("Le moteur est très bruyant la nuit, impossible de dormir à coté !", "c"),
+    ]
+    construit = builder.construire(resultats)
+    assert construit["doublons"] == 1
+    assert construit["contexte"].count("bruyant") == 1
+    assert "[Avis 2 - Note 5.0/5]\nLivraison" in construit["contexte"]
+    assert construit["tokens_economises"] > 0
+
+
+def test_adjacent_chunks_of_a_review_are_merged_without_overlap():
+    texte = " ".join(f"Phrase numéro {i} sur la cafetière, qui chauffe vite." for i in range(30))
+    preprocessor = ReviewPreprocessor(chunk_size=200, chunk_overlap=60)
+    morceaux = preprocessor.splitter.split_text(texte)
+    assert len(morceaux) > 2
+
+    # Ordre de pertinence différent de l'ordre du texte
+    resultats = [_resultat(morceaux[1], "a", 1), _resultat(morceaux[0], "a", 0)]
+    construit = ContextBuilder(budget_tokens=1_000, chevauchement_max=60).construire(resultats)
+    assert construit["fusions"] == 1
+    assert construit["contexte"] == "[Avis 1 - Note 5.0/5]\n" + texte[: texte.index(morceaux[1]) + len(morceaux[1])]
+
+
+def test_reviews_of_different_products_by_one_reviewer_are_not_merged():
+    resultats = [
+        _resultat("Cafetière qui fuit au bout d'une semaine.", "r1", note=1.0, asin="CAFE"),
+        _resultat("Aspirateur silencieux et puissant.", "r1", note=5.0, asin="ASPI"),
+    ]
+    construit = ContextBuilder(budget_tokens=1_000).construire(resultats)
+    assert construit["fusions"] == 0
+    assert construit["contexte"] == (
+        "[Avis 1 - Note 1.0/5]\nCafetière qui fuit au bout d'une semaine.\n\n"
+        "[Avis 2 - Note 5.0/5]\nAspirateur silencieux et puissant."
+    )
+
+
+def test_budget_excludes_reviews_that_do_not_fit():
+    builder = ContextBuilder(budget_tokens=16, compteur=lambda t: len(t.split()))
+    resultats = [
+        _resultat("un deux trois quatre", "a"),
+        _resultat("un texte beaucoup trop long pour tenir dans le budget restant", "b"),
+        _resultat("court", "c", note=3.0),
+    ]
+    construit = builder.construire(resultats)
+    assert construit["exclus"] == 1
+    assert construit["tokens"] <= 16
+    assert "[Avis 2 - Note 3.0/5]\ncourt" in construit["contexte"]
+    assert builder.statistiques()["tokens_economises"] == construit["tokens_economises"]
+
+
+def test_first_review_over_budget_is_truncated_not_dropped():
+    long = " ".join(f"mot{i}" for i in range(400))
+    builder = ContextBuilder(budget_tokens=50)
+    construit = builder.construire([_resultat(long, "a"), _resultat("Court avis.", "b")])
+    assert construit["contexte"].startswith("[Avis 1 - Note 5.0/5]\nmot0 mot1")
+    assert construit["contexte"].endswith("…")
+    assert 0 < construit["tokens"] <= 50
+    assert construit["exclus"] == 1
@@ -0,0 +1,81 @@
+import numpy as np
+
+from src import embeddings
+from src.embedding_cache import EmbeddingCache
+
+
+class FakeModel:
+    def __init__(self, *args, **kwargs):
+        self.calls = []
+
+    def encode(self, textes, **kwargs):
+        self.calls.append(list(textes))
+        return np.array([[len(t), t.count("a"), 1.0] for t in textes], dtype=np.float32)
+
+
+def _make_embedder(monkeypatch, cache):
+    monkeypatch.setattr("sentence_transformers.SentenceTransformer", FakeModel)
+    return embeddings.LocalEmbedder(model_name="fake", cache=cache)
+
+
+def test_cache_roundtrip_persists_to_disk(tmp_path):
+    cache = EmbeddingCache(chemin=str(tmp_path), max_entrees=10)
+    cles = [EmbeddingCache.cle("m", "bonjour"), EmbeddingCache.cle("m", "salut")]
+    cache.stocker(cles, np.array([[1, 2], [3, 4]], dtype=np.float32))
+    cache.sauvegarder()
+
+    recharge = EmbeddingCache(chemin=str(tmp_path), max_entrees=10)
+    vecteurs, manquants = recharge.chercher(cles)
+    assert manquants == []
+    assert vecteurs.tolist() == [[1, 2], [3, 4]]
+
+
+def test_cache_key_normalizes_whitespace_and_model():
+    assert EmbeddingCache.cle("m", " très  bien\n") == EmbeddingCache.cle("m", "très bien")
+    assert EmbeddingCache.cle("m", "texte") != EmbeddingCache.cle("autre", "texte")
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = EmbeddingCache(chemin=str(tmp_path), max_entrees=2)
+    cache.stocker(["a", "b"], np.ones((2, 3), dtype=np.float32))
+    cache.chercher(["a"])
+    cache.stocker(["c"], np.zeros((1, 3), dtype=np.float32))
+    _, manquants = cache.chercher(["a", "b", "c"])
+    assert manquants == [1]
+    assert len(cache) == 2
+
+
+def test_slot_reused_by_another_process_is_a_miss(tmp_path):
+    premier = EmbeddingCache(chemin=str(tmp_path), max_entrees=10)
+    second = EmbeddingCache(chemin=str(tmp_path), max_entrees=10)
+    premier.stocker(["a"], np.ones((1, 3), dtype=np.float32))
+    # Même ligne allouée par un autre processus, qui ne voit pas l'index du premier
+    second.stocker(["b"], np.zeros((1, 3), dtype=np.float32))
+    premier.sauvegarder()
+
+    for cache in (premier, EmbeddingCache(chemin=str(tmp_path), max_entrees=10)):
+        assert cache.chercher(["a"])[1] == [0]
+    vecteurs, manquants = second.chercher(["b"])
+    assert manquants == [] and vecteurs.tolist() == [[0, 0, 0]]
+
+
+def test_embedder_returns_contiguous_float32(monkeypatch, tmp_path):
+    embedder = _make_embedder(monkeypatch, EmbeddingCache(chemin=str(tmp_path)))
+    embedder.encoder(["aaa"])
+    vecteurs = embedder.encoder(["aaa", "bb"])
+    assert vecteurs.dtype == np.float32
+    assert vecteurs.flags["C_CONTIGUOUS"]
+    assert embedder.embed(["bb"]) == [vecteurs[1].tolist()]
+
+
+def test_embedder_only_encodes_misses(monkeypatch, tmp_path):
+    embedder = _make_embedder(monkeypatch, EmbeddingCache(chemin=str(tmp_path)))
+    premier = embedder.encoder(["aaa", "bb"])
+    second = embedder.encoder(["bb", "abc", "aaa"])
+
+    assert embedder.model.calls == [["aaa", "bb"], ["abc"]]
+    assert np.array_equal(second[0], premier[1])
+    assert np.array_equal(second[2], premier[0])
+    stats = embedder.cache.statistiques()
+    assert stats["hits"] == 2
+    assert stats["misses"] == 3
@@ -0,0 +1,69 @@
+import threading
+
+import numpy as np
+import pytest
+
+from src.embedding_scheduler import EmbeddingScheduler
+
+
+class CountingEmbedder:
+    def __init__(self):
+        self.lots = []
+
+    def encoder_requetes(self, textes):
+        self.lots.append(list(textes))
+        if any(t == "boom" for t in textes):
+            raise RuntimeError("échec d'encodage")
+        return np.array([[len(t), 1.0] for t in textes], dtype=np.float32)
+
+
+def test_concurrent_queries_are_encoded_together():
+    embedder = CountingEmbedder()
+    planificateur = EmbeddingScheduler(embedder, fenetre_ms=200, taille_max=8)
+    textes = [f"requête {'x' * i}" for i in range(8)]
+    depart = threading.Barrier(len(textes))
+    resultats = {}
+
+    def appeler(texte):
+        depart.wait()
+        resultats[texte] = planificateur.encoder_requete(texte)
+
+    threads = [threading.Thread(target=appeler, args=(t,)) for t in textes]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    planificateur.fermer()
+
+    assert len(embedder.lots) < len(textes)
+    for texte in textes:
+        assert resultats[texte].tolist() == [len(texte), 1.0]
+    stats = planificateur.statistiques()
+    assert stats["requetes"] == len(textes)
+    assert sum(stats["histogramme_profondeur"].values()) == stats["lots"]
+    assert max(stats["histogramme_lots"]) > 1
+
+
+def test_batch_size_is_capped():
+    embedder = CountingEmbedder()
+    planificateur = EmbeddingScheduler(embedder, fenetre_ms=50, taille_max=3)
+    futurs = [planificateur.soumettre(str(i)) for i in range(7)]
+    assert [f.result(timeout=5).tolist() for f in futurs] == [[1, 1.0]] * 7
+    planificateur.fermer()
+    assert max(len(lot) for lot in embedder.lots) <= 3
+
+
+def test_encoding_error_is_propagated_to_callers():
+    planificateur = EmbeddingScheduler(CountingEmbedder(), fenetre_ms=50)
+    futurs = [planificateur.soumettre("boom"), planificateur.soumettre("ok")]
+    for futur in futurs:
+        with pytest.raises(RuntimeError):
+            futur.result(timeout=5)
+    assert planificateur.encoder_requete("ok").tolist() == [2, 1.0]
+    planificateur.fermer()
+
+
+def test_store_search_goes_through_scheduler(store):
+    store.ajouter_documents([{"text": "Très bon son", "metadata": {"asin": "A", "note": 5.0}}])
+    assert store.rechercher("bon son", n_resultats=1)[0]["text"] == "Très bon son"
+    assert store.planificateur.statistiques()["requetes"] == 1
@@ -0,0 +1,98 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from src.embeddings import LocalEmbedder
+
+
+class FakeModel:
+    def __init__(self, nom, backend="torch", model_kwargs=None):
+        self.nom = nom
+        self.backend = backend
+        self.model_kwargs = model_kwargs or {}
+
+    def encode(self, textes, **kwargs):
+        # Le modèle quantifié donne des vecteurs orthogonaux à ceux de PyTorch
+        quantifie = "qint8" in self.model_kwargs.get("file_name", "")
+        return np.array([[0.0, 1.0] if quantifie else [1.0, 0.0] for _ in textes], dtype=np.float32)
+
+    def save_pretrained(self, chemin):
+        Path(chemin, "onnx").mkdir(parents=True, exist_ok=True)
+
+
+def _exporter(modele, quantification, chemin):
+    Path(chemin, "onnx", f"model_qint8_{quantification}.onnx").touch()
+
+
+@pytest.fixture
+def fake_models(monkeypatch):
+    monkeypatch.setattr("sentence_transformers.SentenceTransformer", FakeModel)
+    monkeypatch.setattr("sentence_transformers.export_dynamic_quantized_onnx_model", _exporter)
+
+
+def test_onnx_backend_uses_cpu_session_with_thread_count(fake_models):
+    embedder = LocalEmbedder(model_name="fake", backend="onnx", threads=3)
+    assert embedder.model.backend == "onnx"
+    assert embedder.model.model_kwargs["provider"] == "CPUExecutionProvider"
+    assert embedder.model.model_kwargs["session_options"].intra_op_num_threads == 3
+    assert embedder.signature == "fake@onnx+normalise"
+
+
+def test_quantized_model_is_rejected_outside_tolerance(fake_models, tmp_path):
+    embedder = LocalEmbedder(model_name="fake", backend="onnx", quantification="avx2", chemin_onnx=str(tmp_path))
+    assert embedder.signature == "fake@onnx+qint8_avx2+normalise"
+    with pytest.raises(ValueError, match="tolérance"):
+        embedder.model
+    assert not (tmp_path / "fake" / "onnx" / "model_qint8_avx2.onnx").exists()
+
+
+def test_signature_separates_normalized_vectors_and_backends():
+    signatures = {
+        LocalEmbedder(model_name="fake").signature,
+        LocalEmbedder(model_name="fake", normaliser=False).signature,
+        LocalEmbedder(model_name="fake", backend="onnx").signature,
+    }
+    assert signatures == {"fake@torch+normalise", "fake@torch", "fake@onnx+normalise"}
+
+
+def test_quantization_requires_onnx_backend():
+    with pytest.raises(ValueError):
+        LocalEmbedder(model_name="fake", backend="torch", quantification="avx2")
+
+
+def test_encoding_nothing_does_not_load_the_model(monkeypatch):
+    monkeypatch.setattr(LocalEmbedder, "_charger_modele", lambda self: pytest.fail("modèle chargé"))
+    assert LocalEmbedder().encoder([]).shape == (0, 384)
+    assert LocalEmbedder(model_name="fake", dimension=8).encoder([]).shape == (0, 8)
+
+
+class FakeTokenizer:
+    def __call__(self, textes, max_length, **kwargs):
+        return {"length": [min(max_length, len(t.split()) + 2) for t in textes]}
+
+
+class FakeBatchModel:
+    max_seq_length = 16
+    tokenizer = FakeTokenizer()
+
+    def __init__(self, *args, **kwargs):
+        self.lots = []
+
+    def encode(self, textes, **kwargs):
+        self.lots.append(list(textes))
+        return np.array([[len(t.split()), 1.0] for t in textes], dtype=np.float32)
+
+
+def test_ingestion_batches_by_length_within_token_budget(monkeypatch):
+    monkeypatch.setattr("sentence_transformers.SentenceTransformer", FakeBatchModel)
+    embedder = LocalEmbedder(model_name="fake", budget_tokens=24, taille_lot=4)
+    textes = ["mot " * n for n in (1, 14, 2, 1, 9, 3, 1, 14)]
+
+    vecteurs = embedder.encoder(textes)
+
+    assert vecteurs[:, 0].tolist() == [1, 14, 2, 1, 9, 3, 1, 14]
+    for lot in embedder.model.lots:
+        assert max(len(t.split()) + 2 for t in lot) * len(lot) <= 24 or len(lot) == 1
+    stats = embedder.statistiques_lots()
+    assert stats["efficacite"] > stats["efficacite_lots_fixes"]
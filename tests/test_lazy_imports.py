@@ -0,0 +1,28 @@
+import subprocess
+import sys
+
+MODULES_LOURDS = ["torch", "sentence_transformers", "transformers", "chromadb"]
+
+
+def _modules_charges(code: str) -> set[str]:
+    sortie = subprocess.run(
+        [sys.executable, "-c", f"import sys\n{code}\nprint(','.join(sys.modules))"],
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.strip().splitlines()[-1]
+    return set(sortie.split(",")) & set(MODULES_LOURDS)
+
+
+def test_pipeline_modules_do_not_import_heavy_dependencies():
+    charges = _modules_charges("import src.vector_store, src.llm_chain, src.pipeline, src.retriever")
+    assert charges == set()
+
+
+def test_embedder_loads_model_on_first_use_only():
+    charges = _modules_charges(
+        "from src.embeddings import LocalEmbedder\n"
+        "embedder = LocalEmbedder()\n"
+        "assert embedder._model is None"
+    )
+    assert charges == set()
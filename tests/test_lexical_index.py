@@ -0,0 +1,142 @@
+import pytest
+
+from src.lexical_index import LexicalIndex, tokeniser
+from src.retriever import ReviewRetriever
+
+
+def _meta(asin="A", note=5.0):
+    return {"asin": asin, "note": note}
+
+
+def test_tokenizer_handles_french_text():
+    termes = tokeniser("L'écran du lave-vaisselle Bosch SMS46 est très bruyant, les assiettes sont sèches.")
+    assert "ecran" in termes
+    assert "lave-vaisselle" in termes and "vaisselle" in termes
+    assert "sms46" in termes
+    assert "assiette" in termes
+    assert not {"l", "est", "tres", "les", "sont"} & set(termes)
+
+
+def test_bm25_ranks_keyword_matches(tmp_path):
+    index = LexicalIndex(str(tmp_path))
+    index.ajouter(
+        ["1", "2", "3"],
+        [
+            "Le lave-vaisselle est silencieux",
+            "Machine à café bruyante, le café est tiède",
+            "Café correct mais lave-vaisselle bruyant",
+        ],
+        [_meta(), _meta(), _meta()],
+    )
+    assert [id_ for id_, _ in index.rechercher("café", 5)] == ["2", "3"]
+    assert index.rechercher("lave-vaisselle bruyant", 1)[0][0] == "3"
+    assert index.rechercher("inconnu", 5) == []
+
+
+def test_filters_are_applied(tmp_path):
+    index = LexicalIndex(str(tmp_path))
+    index.ajouter(
+        ["1", "2", "3"],
+        ["batterie faible", "batterie solide", "batterie moyenne"],
+        [_meta("A", 1.0), _meta("B", 5.0), _meta("A", 3.0)],
+    )
+    assert {i for i, _ in index.rechercher("batterie", 5, note_min=3)} == {"2", "3"}
+    assert {i for i, _ in index.rechercher("batterie", 5, asin="A", note_max=2)} == {"1"}
+    assert {i for i, _ in index.rechercher("batterie", 5, asin=["B", "Z"])} == {"2"}
+
+
+def test_updates_and_deletes_survive_reload(tmp_path):
+    index = LexicalIndex(str(tmp_path))
+    index.ajouter(["1", "2"], ["écran lumineux", "écran terne"], [_meta(), _meta()])
+    index.rechercher("écran", 5)
+    index.ajouter(["1"], ["clavier confortable"], [_meta()])
+    index.supprimer(["2"])
+
+    for courant in (index, LexicalIndex(str(tmp_path))):
+        assert courant.rechercher("écran", 5) == []
+        assert [i for i, _ in courant.rechercher("clavier", 5)] == ["1"]
+        assert len(courant) == 1
+    assert LexicalIndex(str(tmp_path)).statistiques()["segments"] == 0
+
+
+def test_queries_after_writes_do_not_recompile(tmp_path, monkeypatch):
+    index = LexicalIndex(str(tmp_path))
+    index.ajouter(["1", "2"], ["écran lumineux", "écran terne"], [_meta(), _meta()])
+    monkeypatch.setattr(index, "_compiler", lambda: pytest.fail("compilation complète sur le chemin des requêtes"))
+
+    index.ajouter(["3", "1"], ["écran géant", "clavier confortable"], [_meta("B"), _meta()])
+    index.supprimer(["2"])
+    assert [i for i, _ in index.rechercher("écran", 5)] == ["3"]
+    assert [i for i, _ in index.rechercher("clavier", 5, asin="A")] == ["1"]
+    assert len(index) == 2
+
+
+def test_reader_follows_segments_and_compactions_of_another_instance(tmp_path):
+    ecrivain = LexicalIndex(str(tmp_path))
+    ecrivain.ajouter(["1"], ["écran lumineux"], [_meta()])
+    lecteur = LexicalIndex(str(tmp_path))
+    assert [i for i, _ in lecteur.rechercher("écran", 5)] == ["1"]
+
+    ecrivain.ajouter(["2"], ["écran terne"], [_meta()])
+    ecrivain.supprimer(["1"])
+    assert [i for i, _ in lecteur.rechercher("écran", 5)] == ["2"]
+
+    ecrivain.ajouter(["3"], ["clavier confortable"], [_meta()])
+    ecrivain.sauvegarder()
+    lecteur.rechercher("clavier", 5)
+    lecteur._rechargement.join()
+    assert [i for i, _ in lecteur.rechercher("clavier", 5)] == ["3"]
+    assert lecteur.statistiques()["segments"] == 0 and len(lecteur) == 2
+
+
+def test_compaction_merges_other_writers_segments_and_keeps_later_ones(tmp_path, monkeypatch):
+    premier = LexicalIndex(str(tmp_path))
+    second = LexicalIndex(str(tmp_path))
+    premier.ajouter(["1"], ["écran lumineux"], [_meta()])
+    second.ajouter(["2"], ["écran terne"], [_meta()])
+
+    compiler = premier._compiler
+
+    def compiler_pendant_une_ecriture():
+        second.ajouter(["3"], ["écran géant"], [_meta()])
+        compiler()
+
+    monkeypatch.setattr(premier, "_compiler", compiler_pendant_une_ecriture)
+    premier.sauvegarder()
+
+    relu = LexicalIndex(str(tmp_path))
+    assert {i for i, _ in relu.rechercher("écran", 5)} == {"1", "2", "3"}
+    assert {i for i, _ in premier.rechercher("écran", 5)} == {"1", "2", "3"}
+
+
+def test_store_keeps_lexical_index_in_sync(tmp_path, store):
+    store.ajouter_documents(
+        [
+            {"text": "Aspirateur Dyson V11 très puissant", "metadata": {"asin": "A", "note": 5.0, "avis_id": "r1"}},
+            {"text": "Aspirateur bruyant et lourd", "metadata": {"asin": "B", "note": 2.0, "avis_id": "r2"}},
+        ]
+    )
+    ids = [id_ for id_, _ in store.rechercher_lexicale("v11", 5)]
+    assert [d["text"] for d in store.obtenir(ids)] == ["Aspirateur Dyson V11 très puissant"]
+
+    store.supprimer(ids)
+    assert store.rechercher_lexicale("v11", 5) == []
+
+    store.index_lexical.vider()
+    store.reconstruire_index_lexical()
+    assert len(store.index_lexical) == 1
+
+
+def test_hybrid_retriever_fuses_lexical_hits(store):
+    store.ajouter_documents(
+        [
+            {"text": f"avis générique numéro {i} sur la qualité", "metadata": {"asin": "A", "note": 4.0, "avis_id": f"g{i}"}}
+            for i in range(30)
+        ]
+        + [{"text": "Le modèle XR-2000 chauffe", "metadata": {"asin": "A", "note": 2.0, "avis_id": "x"}}]
+    )
+    retriever = ReviewRetriever(store=store, max_results=3, hybride=True, n_candidats=3)
+    resultats = retriever.rechercher("avis qualité XR-2000")
+    assert "Le modèle XR-2000 chauffe" in [r["text"] for r in resultats]
+    assert all("score" in r for r in resultats)
+    assert retriever.rechercher_lot(["avis qualité XR-2000"])[0] == resultats
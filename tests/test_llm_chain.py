@@ -0,0 +1,44 @@
+import numpy as np
+from unittest.mock import MagicMock
+
+from src.llm_chain import ReviewQAChain
+from src.response_cache import ResponseCache
+
+
+REPONSE = {"answer": "Oui, assez silencieux.", "sources": []}
+
+
+def test_chain_serves_repeated_question_from_cache(monkeypatch):
+    retriever = MagicMock()
+    retriever.store.version = 1
+    retriever.store.planificateur.encoder_requete.return_value = np.array([1.0, 0.0])
+    chaine = ReviewQAChain(retriever=retriever, cache=ResponseCache())
+    generer = MagicMock(return_value=REPONSE)
+    monkeypatch.setattr(chaine, "_generer", generer)
+
+    assert chaine.executer("Est-il bruyant ?") == REPONSE
+    assert chaine.executer("est-il bruyant") == REPONSE
+    assert generer.call_count == 1
+
+    retriever.store.version = 2
+    chaine.executer("est-il bruyant")
+    assert generer.call_count == 2
+
+
+def test_stream_yields_sources_then_tokens_and_fills_cache():
+    retriever = MagicMock()
+    retriever.store.version = 1
+    retriever.store.planificateur.encoder_requete.return_value = np.array([1.0, 0.0])
+    retriever.rechercher.return_value = [{"text": "Silencieux.", "metadata": {"note": 5.0}}]
+    retriever.construire_contexte.return_value = {"contexte": "[Avis 1 - Note 5.0/5]\nSilencieux."}
+    chaine = ReviewQAChain(retriever=retriever, cache=ResponseCache())
+    chaine.llm = MagicMock()
+    chaine.llm.stream.return_value = iter(["Oui, ", "très ", "silencieux."])
+
+    evenements = list(chaine.executer_flux("Est-il bruyant ?"))
+    assert evenements[0] == {"type": "sources", "sources": retriever.rechercher.return_value}
+    assert "".join(e["texte"] for e in evenements[1:]) == "Oui, très silencieux."
+
+    en_cache = list(chaine.executer_flux("Est-il bruyant ?"))
+    assert en_cache[1] == {"type": "token", "texte": "Oui, très silencieux."}
+    assert chaine.llm.stream.call_count == 1
@@ -0,0 +1,59 @@
+from unittest.mock import MagicMock
+
+from src.llm_chain import ReviewQAChain
+from src.materialized_answers import MaterializedAnswers
+from src.materializer import MaterializationJob
+from src.retriever import ReviewRetriever
+
+
+def _doc(texte, asin, avis_id, morceau=0):
+    return {"text": texte, "metadata": {"asin": asin, "note": 4.0, "resume": "", "avis_id": avis_id, "morceau": morceau}}
+
+
+def _make_job(store, tmp_path, **kwargs):
+    chaine = ReviewQAChain(retriever=ReviewRetriever(store=store))
+    chaine.llm = MagicMock()
+    chaine.llm.batch.side_effect = lambda prompts, **_: [f"résumé {i}" for i in range(len(prompts))]
+    chaine.chaines[ReviewQAChain.MODE_FAQ] = MagicMock()
+    chaine.chaines[ReviewQAChain.MODE_FAQ].run.return_value = "Réponse FAQ"
+    reponses = MaterializedAnswers(str(tmp_path / "materialise"))
+    return MaterializationJob(chaine, reponses, questions_faq=["Est-il bruyant ?"], **kwargs), reponses
+
+
+def test_only_changed_products_are_regenerated(store, tmp_path):
+    store.ajouter_documents([_doc("Silencieux et efficace.", "A", "r1"), _doc("Solide, dure des années.", "B", "r2")])
+    job, reponses = _make_job(store, tmp_path)
+
+    assert job.executer() == {"produits": 2, "generes": 2, "inchanges": 0, "supprimes": 0}
+    assert reponses.chercher("A", ReviewQAChain.MODE_FAQ, "est-il  bruyant")["answer"] == "Réponse FAQ"
+
+    store.ajouter_documents([_doc("Devenu bruyant après un mois.", "B", "r2")])
+    assert job.executer() == {"produits": 2, "generes": 1, "inchanges": 1, "supprimes": 0}
+
+    store.supprimer([store.identifiant(d["text"], d["metadata"]) for d in store.documents_produit("A")])
+    assert job.executer()["supprimes"] == 1
+    assert reponses.chercher("A", ReviewQAChain.MODE_RESUME, "") is None
+
+
+def test_large_products_are_summarized_hierarchically(store, tmp_path):
+    store.ajouter_documents([_doc(f"Avis numéro {i} sur la cafetière.", "A", f"r{i:02d}") for i in range(25)])
+    job, reponses = _make_job(store, tmp_path, morceaux_par_appel=10, resumes_par_fusion=2)
+    job.executer()
+
+    lots = [appel.args[0] for appel in job.chaine.llm.batch.call_args_list]
+    assert [len(prompts) for prompts in lots] == [3, 2, 1]
+    assert "Avis numéro 24" in lots[0][2]
+    assert "[Résumé 2]\nrésumé 1" in lots[1][0]
+    assert reponses.chercher("A", ReviewQAChain.MODE_RESUME, "")["answer"] == "résumé 0"
+
+
+def test_chain_serves_materialized_answers_without_retrieval(tmp_path):
+    reponses = MaterializedAnswers(str(tmp_path))
+    reponses.ecrire("A", "e", {ReviewQAChain.MODE_FAQ: {"Est-il bruyant ?": {"answer": "Non.", "sources": []}}})
+    retriever = MagicMock()
+    chaine = ReviewQAChain(retriever=retriever, materialisees=reponses)
+
+    assert chaine.executer("Est-il bruyant", mode=ReviewQAChain.MODE_FAQ, asin="A")["answer"] == "Non."
+    evenements = list(chaine.executer_flux("est-il bruyant ?", mode=ReviewQAChain.MODE_FAQ, asin="A"))
+    assert evenements[0]["materialized"] and evenements[1]["texte"] == "Non."
+    retriever.rechercher.assert_not_called()
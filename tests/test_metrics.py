@@ -0,0 +1,71 @@
+import urllib.request
+
+import pytest
+from langchain_community.llms.fake import FakeListLLM, FakeStreamingListLLM
+
+from src.data_loader import ReviewLoader
+from src.llm_chain import ReviewQAChain
+from src.metrics import metriques
+from src.pipeline import IngestionPipeline
+from src.retriever import ReviewRetriever
+
+
+@pytest.fixture
+def metriques_actives(monkeypatch):
+    monkeypatch.setattr(metriques, "actif", True)
+    metriques.reinitialiser()
+    yield metriques
+    metriques.reinitialiser()
+
+
+def _make_chain(store):
+    IngestionPipeline(store, loader=ReviewLoader(data_path="data")).executer("sample_reviews.json")
+    return ReviewQAChain(retriever=ReviewRetriever(store=store), llm=FakeListLLM(responses=["Oui."]))
+
+
+def test_disabled_metrics_add_no_timings(store):
+    chaine = _make_chain(store)
+    assert metriques.span("recherche") is metriques.span("generation")
+    assert "timings" not in chaine.executer("Est-il bruyant ?")
+    assert metriques.statistiques() == {}
+
+
+def test_request_breakdown_and_ingestion_stages(store, metriques_actives):
+    chaine = _make_chain(store)
+    reponse = chaine.executer("Est-il bruyant ?")
+
+    durees = reponse["timings"]
+    for etape in ("recherche", "encodage_requete", "requete_vectorielle", "contexte", "generation", "total"):
+        assert etape in durees
+    assert durees["total"] >= durees["recherche"] >= durees["requete_vectorielle"]
+    etapes = metriques_actives.statistiques()
+    for etape in ("chargement", "nettoyage", "decoupage", "empreintes", "encodage", "ecriture"):
+        assert etapes[etape]["appels"] >= 1
+
+
+def test_stream_records_one_generation_per_request_and_ends_with_timings(store, metriques_actives):
+    chaine = _make_chain(store)
+    chaine.llm = FakeStreamingListLLM(responses=["Oui, assez silencieux la nuit."])
+    metriques_actives.reinitialiser()
+
+    evenements = list(chaine.executer_flux("Est-il bruyant ?"))
+    assert [e["type"] for e in evenements][-1] == "timings"
+    assert sum(e["type"] == "token" for e in evenements) > 1
+    durees = evenements[-1]["timings"]
+    for etape in ("recherche", "requete_vectorielle", "generation", "total"):
+        assert etape in durees
+    assert metriques_actives.statistiques()["generation"]["appels"] == 1
+
+
+def test_prometheus_export_over_http(metriques_actives):
+    metriques_actives.enregistrer("generation", 0.003)
+    metriques_actives.enregistrer("generation", 2.0)
+    serveur = metriques_actives.servir(port=0)
+    try:
+        url = f"http://127.0.0.1:{serveur.server_address[1]}/metrics"
+        texte = urllib.request.urlopen(url).read().decode("utf-8")
+    finally:
+        serveur.shutdown()
+    assert 'rag_stage_duration_seconds_bucket{stage="generation",le="0.005"} 1' in texte
+    assert 'rag_stage_duration_seconds_bucket{stage="generation",le="+Inf"} 2' in texte
+    assert 'rag_stage_duration_seconds_count{stage="generation"} 2' in texte
@@ -0,0 +1,176 @@
+import numpy as np
+import pytest
+
+from src.mmap_backend import BackendMmap, _Partition
+
+
+def _corpus(n, dimension=16, n_asins=4, graine=0):
+    rng = np.random.default_rng(graine)
+    vecteurs = rng.normal(size=(n, dimension)).astype(np.float32)
+    ids = [f"{i:032x}" for i in range(n)]
+    metadonnees = [{"asin": f"A{i % n_asins}", "note": float(i % 5 + 1)} for i in range(n)]
+    return ids, vecteurs, [f"avis {i}" for i in range(n)], metadonnees
+
+
+def _exact(vecteurs, requete, masque, k):
+    sims = (vecteurs / np.linalg.norm(vecteurs, axis=1, keepdims=True)) @ (requete / np.linalg.norm(requete))
+    sims[~masque] = -np.inf
+    return [f"{i:032x}" for i in np.argsort(-sims)[:k]]
+
+
+def test_query_is_exact_with_filters_and_survives_reload(tmp_path):
+    ids, vecteurs, documents, metadonnees = _corpus(400)
+    backend = BackendMmap(str(tmp_path))
+    backend.upsert(ids, vecteurs, documents, metadonnees)
+    requete = vecteurs[7] + 0.1
+    filtre = {"$and": [{"asin": {"$eq": "A3"}}, {"note": {"$gte": 3.0}}]}
+    masque = np.array([m["asin"] == "A3" and m["note"] >= 3 for m in metadonnees])
+
+    for courant in (backend, BackendMmap(str(tmp_path))):
+        resultat = courant.query(requete[np.newaxis, :], n_results=5, where=filtre)
+        assert resultat["ids"][0] == _exact(vecteurs, requete, masque, 5)
+        assert all(m["asin"] == "A3" and m["note"] >= 3 for m in resultat["metadatas"][0])
+        assert courant.count() == 400
+
+
+def test_upsert_replaces_and_delete_compacts(tmp_path):
+    ids, vecteurs, documents, metadonnees = _corpus(200, n_asins=1)
+    backend = BackendMmap(str(tmp_path))
+    backend.upsert(ids, vecteurs, documents, metadonnees)
+    backend.upsert(ids[:1], vecteurs[:1], ["remplacé"], metadonnees[:1])
+    assert backend.get(ids=ids[:1], include=["documents"])["documents"] == ["remplacé"]
+
+    backend.delete(ids[1:150])
+    assert backend.count() == 51
+    recharge = BackendMmap(str(tmp_path))
+    assert sorted(recharge.get(include=[])["ids"]) == sorted([ids[0]] + ids[150:])
+    assert recharge.get(ids=ids[:1], include=["documents"])["documents"] == ["remplacé"]
+
+
+def test_failed_compaction_keeps_partition(tmp_path, monkeypatch):
+    ids, vecteurs, documents, metadonnees = _corpus(200, n_asins=1)
+    backend = BackendMmap(str(tmp_path))
+    backend.upsert(ids, vecteurs, documents, metadonnees)
+
+    def echec(*args, **kwargs):
+        raise OSError("disque plein")
+
+    monkeypatch.setattr(_Partition, "ajouter", echec)
+    with pytest.raises(OSError):
+        backend.delete(ids[:150])
+    monkeypatch.undo()
+
+    recharge = BackendMmap(str(tmp_path))
+    assert recharge.count() == 50
+    assert sorted(recharge.get(include=[])["ids"]) == sorted(ids[150:])
+
+
+def test_count_is_read_from_meta_without_loading_partitions(tmp_path):
+    ids, vecteurs, documents, metadonnees = _corpus(100)
+    backend = BackendMmap(str(tmp_path))
+    backend.upsert(ids, vecteurs, documents, metadonnees)
+    backend.delete(ids[:10])
+
+    recharge = BackendMmap(str(tmp_path))
+    assert recharge.count() == 90
+    assert not any(p._charge for p in recharge._partitions.values())
+
+
+def test_reader_follows_writes_and_compactions_of_another_instance(tmp_path):
+    ids, vecteurs, documents, metadonnees = _corpus(200, n_asins=1)
+    ecrivain = BackendMmap(str(tmp_path))
+    ecrivain.upsert(ids, vecteurs, documents, metadonnees)
+    lecteur = BackendMmap(str(tmp_path))
+    assert lecteur.query(vecteurs[:1], n_results=1)["ids"][0] == [ids[0]]
+    ancien = lecteur._partitions["A0"].dossier
+
+    ecrivain.delete(ids[:150])
+    # Compacté, mais l'ancien dossier est encore chargé par le lecteur
+    assert ancien.exists() and ecrivain._partitions["A0"].dossier != ancien
+    assert lecteur.query(vecteurs[:1], n_results=1, include=["documents"])["documents"][0] != ["avis 0"]
+    assert lecteur.count() == 50
+
+    _, autres_vecteurs, autres_documents, _ = _corpus(2, graine=1)
+    nouveaux = [f"b{i:031x}" for i in range(2)]
+    ecrivain.upsert(nouveaux, autres_vecteurs, autres_documents, [{"asin": "B1", "note": 5.0}] * 2)
+    assert not ancien.exists()
+    assert lecteur.get(where={"asin": "B1"}, include=[])["ids"] == nouveaux
+
+
+def test_get_pages_across_partitions(tmp_path):
+    ids, vecteurs, documents, metadonnees = _corpus(50, n_asins=3)
+    backend = BackendMmap(str(tmp_path))
+    backend.upsert(ids, vecteurs, documents, metadonnees)
+    pages = [backend.get(limit=7, offset=o, include=[])["ids"] for o in range(0, 56, 7)]
+    assert sorted(i for page in pages for i in page) == sorted(ids)
+    filtres = backend.get(where={"note": {"$lte": 2.0}}, include=["metadatas"])
+    assert len(filtres["ids"]) == 20
+
+
+def test_ivf_keeps_high_recall(tmp_path):
+    ids, vecteurs, documents, metadonnees = _corpus(2000, dimension=32, n_asins=1)
+    backend = BackendMmap(str(tmp_path), n_sondes=8)
+    backend.upsert(ids, vecteurs, documents, metadonnees)
+    backend.construire_ivf(n_listes=16)
+
+    requetes = vecteurs[:20] + 0.05
+    resultats = backend.query(requetes, n_results=10)["ids"]
+    rappel = np.mean([
+        len(set(r) & set(_exact(vecteurs, q, np.ones(len(ids), bool), 10))) / 10
+        for r, q in zip(resultats, requetes)
+    ])
+    assert rappel >= 0.8
+    assert BackendMmap(str(tmp_path)).query(requetes[:1], n_results=1)["ids"][0] == [ids[0]]
+
+
+def test_ivf_probes_only_read_their_lists(tmp_path, monkeypatch):
+    ids, vecteurs, documents, metadonnees = _corpus(2000, dimension=32, n_asins=2)
+    backend = BackendMmap(str(tmp_path), n_sondes=2)
+    backend.upsert(ids[:1900], vecteurs[:1900], documents[:1900], metadonnees[:1900])
+    backend.construire_ivf(n_listes=16)
+    backend.upsert(ids[1900:], vecteurs[1900:], documents[1900:], metadonnees[1900:])
+    partition = backend._partitions["A0"]
+    assert np.all(np.diff(partition.listes[: partition.debuts[-1]]) >= 0)
+
+    lues = []
+    lignes_sondees = _Partition.lignes_sondees
+
+    def espion(partition, listes):
+        lignes = lignes_sondees(partition, listes)
+        lues.append(len(lignes))
+        return lignes
+
+    monkeypatch.setattr(_Partition, "lignes_sondees", espion)
+    assert backend.query(vecteurs[1950:1951], n_results=1)["ids"][0] == [ids[1950]]
+    assert sum(lues) < 2000 // 2
+
+
+@pytest.mark.parametrize("quantification,octets_par_vecteur", [("int8", 256 + 4), ("binaire", 32)])
+def test_quantized_search_reranks_in_float32(tmp_path, quantification, octets_par_vecteur):
+    ids, vecteurs, documents, metadonnees = _corpus(1000, dimension=256, n_asins=1)
+    # Groupes de 20 vecteurs voisins, comme des avis sur un même thème
+    vecteurs = np.repeat(vecteurs[:50], 20, axis=0) + 0.5 * vecteurs
+    backend = BackendMmap(str(tmp_path), quantification=quantification, facteur_reclassement=10)
+    backend.upsert(ids, vecteurs, documents, metadonnees)
+    assert backend.octets_index() == 1000 * octets_par_vecteur
+
+    requetes = vecteurs[:20] + 0.05
+    resultats = backend.query(requetes, n_results=5, include=["distances"])
+    rappel = np.mean([
+        len(set(r) & set(_exact(vecteurs, q, np.ones(len(ids), bool), 5))) / 5
+        for r, q in zip(resultats["ids"], requetes)
+    ])
+    assert rappel >= 0.9
+    # Les distances retournées sont les distances exactes, après reclassement
+    premier = vecteurs[int(resultats["ids"][0][0], 16)]
+    attendu = 1 - premier @ requetes[0] / (np.linalg.norm(premier) * np.linalg.norm(requetes[0]))
+    assert resultats["distances"][0][0] == pytest.approx(attendu, abs=1e-5)
+
+
+def test_quantization_codes_are_built_for_existing_partitions(tmp_path):
+    ids, vecteurs, documents, metadonnees = _corpus(100)
+    BackendMmap(str(tmp_path)).upsert(ids, vecteurs, documents, metadonnees)
+    backend = BackendMmap(str(tmp_path), quantification="int8")
+    assert backend.query(vecteurs[3:4], n_results=1)["ids"][0] == [ids[3]]
+    backend.upsert(ids[:2], vecteurs[:2], documents[:2], metadonnees[:2])
+    assert backend.octets_index() == backend.count() * (16 + 4) + 2 * (16 + 4)
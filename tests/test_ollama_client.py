@@ -0,0 +1,128 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import MagicMock
+
+import httpx
+import pytest
+
+from src.llm_chain import ReviewQAChain
+from src.ollama_client import AsyncOllamaClient
+
+
+class StubOllama(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    delai = 0.05
+    en_vol = 0
+    max_en_vol = 0
+    connexions = set()
+    prompts = []
+    verrou = threading.Lock()
+
+    def do_POST(self):
+        corps = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        cls = type(self)
+        with cls.verrou:
+            cls.en_vol += 1
+            cls.max_en_vol = max(cls.max_en_vol, cls.en_vol)
+            cls.connexions.add(self.client_address)
+            cls.prompts.append(corps["prompt"])
+        time.sleep(cls.delai)
+        with cls.verrou:
+            cls.en_vol -= 1
+
+        if corps["stream"]:
+            lignes = [{"response": m, "done": False} for m in ("Oui", ", ", "silencieux")]
+            donnees = "".join(json.dumps(l) + "\n" for l in lignes + [{"response": "", "done": True}])
+        else:
+            donnees = json.dumps({"response": " Réponse du stub. ", "done": True})
+        donnees = donnees.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(donnees)))
+        self.end_headers()
+        self.wfile.write(donnees)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def serveur():
+    StubOllama.delai, StubOllama.max_en_vol = 0.05, 0
+    StubOllama.connexions, StubOllama.prompts = set(), []
+    serveur = ThreadingHTTPServer(("127.0.0.1", 0), StubOllama)
+    thread = threading.Thread(target=serveur.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{serveur.server_address[1]}"
+    serveur.shutdown()
+    serveur.server_close()
+
+
+def test_concurrency_is_bounded_and_connections_reused(serveur):
+    client = AsyncOllamaClient(model="stub", base_url=serveur, max_concurrence=2)
+
+    async def lancer():
+        reponses = await asyncio.gather(*(client.generer(f"prompt {i}") for i in range(8)))
+        await client.fermer()
+        return reponses
+
+    reponses = asyncio.run(lancer())
+    assert len(reponses) == 8
+    assert StubOllama.max_en_vol == 2
+    assert len(StubOllama.connexions) <= 2
+
+
+def test_stream_yields_tokens(serveur):
+    client = AsyncOllamaClient(model="stub", base_url=serveur)
+
+    async def lancer():
+        morceaux = [m async for m in client.generer_flux("prompt")]
+        await client.fermer()
+        return morceaux
+
+    assert asyncio.run(lancer()) == ["Oui", ", ", "silencieux"]
+
+
+def test_request_timeout(serveur):
+    StubOllama.delai = 0.5
+    client = AsyncOllamaClient(model="stub", base_url=serveur, timeout=0.1)
+
+    async def lancer():
+        try:
+            await client.generer("prompt")
+        finally:
+            await client.fermer()
+
+    with pytest.raises(httpx.TimeoutException):
+        asyncio.run(lancer())
+
+
+def test_pool_is_closed_when_its_event_loop_ends(serveur):
+    client = AsyncOllamaClient(model="stub", base_url=serveur)
+    assert asyncio.run(client.generer("prompt")) == " Réponse du stub. "
+    premier = client._client
+    assert premier.is_closed
+
+    assert asyncio.run(client.generer("prompt")) == " Réponse du stub. "
+    assert client._client is not premier
+    assert client._client.is_closed
+
+
+def test_aexecuter_uses_async_client(serveur):
+    retriever = MagicMock()
+    retriever.rechercher.return_value = [{"text": "Silencieux.", "metadata": {"note": 5.0}}]
+    retriever.construire_contexte.return_value = {"contexte": "[Avis 1 - Note 5.0/5]\nSilencieux."}
+    chaine = ReviewQAChain(retriever=retriever, base_url=serveur, max_concurrence=2)
+
+    async def lancer():
+        reponses = await asyncio.gather(*(chaine.aexecuter(f"Question {i} ?") for i in range(4)))
+        await chaine.afermer()
+        return reponses
+
+    reponses = asyncio.run(lancer())
+    assert [r["answer"] for r in reponses] == ["Réponse du stub."] * 4
+    assert all(any(f"Question {i} ?" in p for p in StubOllama.prompts) for i in range(4))
+    assert all(r["sources"] == retriever.rechercher.return_value for r in reponses)
@@ -0,0 +1,66 @@
+import json
+
+import pandas as pd
+
+from src.data_loader import ReviewLoader
+from src.pipeline import IngestionPipeline, par_lots
+
+
+AVIS = [
+    {"asin": "B001", "reviewText": f"Avis numéro {i} : produit très facile à nettoyer.", "summary": "ok", "rating": 4}
+    for i in range(7)
+]
+
+
+def test_iter_json_array_in_batches(tmp_path):
+    (tmp_path / "avis.json").write_text(json.dumps(AVIS, indent=2), encoding="utf-8")
+    loader = ReviewLoader(data_path=str(tmp_path))
+    lots = list(loader.iterer("avis.json", taille_lot=3))
+    assert [len(df) for df in lots] == [3, 3, 1]
+    assert pd.concat(lots, ignore_index=True).equals(loader.load_json("avis.json"))
+
+
+def test_iter_json_array_across_read_blocks(tmp_path):
+    (tmp_path / "avis.json").write_text(json.dumps(AVIS), encoding="utf-8")
+    avis = list(ReviewLoader._iterer_tableau_json(tmp_path / "avis.json", taille_bloc=16))
+    assert avis == AVIS
+
+
+def test_iter_jsonl_and_csv(tmp_path):
+    (tmp_path / "avis.jsonl").write_text("\n".join(json.dumps(a) for a in AVIS), encoding="utf-8")
+    pd.DataFrame(AVIS).to_csv(tmp_path / "avis.csv", index=False)
+    loader = ReviewLoader(data_path=str(tmp_path))
+    assert sum(len(df) for df in loader.iterer("avis.jsonl", taille_lot=4)) == len(AVIS)
+    assert sum(len(df) for df in loader.iterer("avis.csv", taille_lot=4)) == len(AVIS)
+
+
+def test_par_lots():
+    assert list(par_lots(range(5), 2)) == [[0, 1], [2, 3], [4]]
+
+
+def test_pipeline_indexes_in_batches(tmp_path, store):
+    (tmp_path / "avis.jsonl").write_text("\n".join(json.dumps(a) for a in AVIS), encoding="utf-8")
+    etapes = []
+    pipeline = IngestionPipeline(
+        store,
+        loader=ReviewLoader(data_path=str(tmp_path)),
+        taille_lot_avis=3,
+        taille_lot_morceaux=2,
+        progression=lambda s: etapes.append(s.morceaux),
+    )
+    stats = pipeline.executer("avis.jsonl", supprimer_absents=True)
+
+    assert stats.avis_lus == len(AVIS)
+    assert stats.morceaux == store.compter() == len(AVIS)
+    assert etapes == sorted(etapes) and len(etapes) > 3
+
+    stats = pipeline.executer("avis.jsonl", supprimer_absents=True)
+    assert stats.ajoutes == stats.modifies == stats.supprimes == 0
+
+
+def test_parallel_splitting_matches_serial(store):
+    pipeline = IngestionPipeline(store, workers=2)
+    df = pipeline.preprocessor.nettoyer(pd.DataFrame(AVIS * 3))
+    with pipeline._pool_decoupage() as pool:
+        paralleles = list(pipeline._documents(df, pool))
+    assert paralleles == pipeline.preprocessor.vers_documents(df)
@@ -0,0 +1,64 @@
+import numpy as np
+import pandas as pd
+
+from src.preprocessor import ReviewPreprocessor
+
+
+AVIS = pd.DataFrame(
+    {
+        "asin": ["B001", "B001", "B002", "B003", "B003"],
+        "reviewText": [
+            "Très <b>facile</b> à nettoyer,   voir http://exemple.fr/x pour le mode d'emploi.",
+            "Un peu bruyant au démarrage mais on s'y fait vite. " * 20,
+            None,
+            "Solide et durable, fonctionne encore après deux années.",
+            "Court",
+        ],
+        "summary": ["Pratique", np.nan, "Rien", "", None],
+        "rating": [5, 3, 4, 0, 2],
+    }
+)
+
+
+def _reference(preprocessor, df):
+    """Implémentation ligne par ligne d'origine."""
+    documents = []
+    for _, row in df.iterrows():
+        texte = preprocessor._construire_texte(row)
+        metadonnees = {
+            "asin": str(row.get("asin", "")),
+            "note": float(row.get("rating", 0)),
+            "resume": str(row.get("summary", "")),
+            "avis_id": preprocessor._identifiant_avis(row.get("reviewerID"), texte),
+        }
+        for i, morceau in enumerate(preprocessor.splitter.split_text(texte)):
+            documents.append({"text": morceau, "metadata": {**metadonnees, "morceau": i}})
+    return documents
+
+
+def test_clean_matches_row_by_row_cleaning():
+    preprocessor = ReviewPreprocessor(min_rating=None)
+    df = preprocessor.nettoyer(AVIS)
+    attendu = AVIS.dropna(subset=["reviewText"])["reviewText"].apply(preprocessor._nettoyer_texte)
+    assert df["reviewText"].tolist() == [t for t in attendu if len(t) > 20]
+    assert "<b>" not in df["reviewText"][0] and "http" not in df["reviewText"][0]
+
+
+def test_documents_match_row_by_row_reference():
+    preprocessor = ReviewPreprocessor(chunk_size=200, chunk_overlap=20, min_rating=None)
+    df = preprocessor.nettoyer(AVIS)
+    assert preprocessor.vers_documents(df) == _reference(preprocessor, df)
+
+
+def test_documents_match_reference_with_review_ids_and_float_ratings():
+    preprocessor = ReviewPreprocessor(min_rating=None)
+    df = preprocessor.nettoyer(AVIS).assign(rating=[4.5, 1.0, 0.0], reviewerID=["A1", None, "A3"])
+    documents = preprocessor.vers_documents(df)
+    assert documents == _reference(preprocessor, df)
+    assert documents[0]["metadata"]["avis_id"] == "A1"
+
+
+def test_documents_handle_missing_optional_columns():
+    preprocessor = ReviewPreprocessor(min_rating=None)
+    df = preprocessor.nettoyer(AVIS).drop(columns=["summary"])
+    assert preprocessor.vers_documents(df) == _reference(preprocessor, df)
@@ -0,0 +1,105 @@
+import json
+
+import numpy as np
+
+from src.data_loader import ReviewLoader
+from src.pipeline import IngestionPipeline
+from src.processed_store import ProcessedReviews
+from src.vector_backends import creer_backend
+from src.vector_store import ReviewVectorStore
+from tests.conftest import FakeEmbedder
+
+
+AVIS = [
+    {
+        "asin": f"B00{i % 3}",
+        "reviewText": f"Avis numéro {i} : l'aspirateur est silencieux et la batterie tient longtemps. " * (1 + i % 4),
+        "summary": "ok",
+        "rating": 3 + i % 3,
+        "reviewerID": f"R{i}",
+    }
+    for i in range(9)
+]
+
+
+def _indexer(tmp_path, store):
+    (tmp_path / "avis.jsonl").write_text("\n".join(json.dumps(a) for a in AVIS), encoding="utf-8")
+    etape = ProcessedReviews(chemin=str(tmp_path / "processed"))
+    pipeline = IngestionPipeline(
+        store,
+        loader=ReviewLoader(data_path=str(tmp_path)),
+        taille_lot_avis=4,
+        taille_lot_morceaux=5,
+        etape_traitee=etape,
+    )
+    return pipeline, pipeline.executer("avis.jsonl"), etape
+
+
+def test_ingestion_writes_partitioned_tables_with_embeddings(tmp_path, store):
+    _, stats, etape = _indexer(tmp_path, store)
+
+    assert etape.sources() == ["avis.jsonl"]
+    assert etape.manifeste("avis.jsonl") == {"modele": "fake", "dimension": 32, "avis": 9, "morceaux": stats.morceaux}
+    assert sorted(p.name for p in (tmp_path / "processed" / "avis.jsonl" / "morceaux").iterdir()) == [
+        "asin=B000", "asin=B001", "asin=B002"
+    ]
+    table = etape.lire("avis.jsonl", colonnes=["id", "embedding"], asins=["B001"])
+    assert table.column_names == ["id", "embedding"]
+    vecteurs = ProcessedReviews.vecteurs(table["embedding"])
+    attendus = store.backend.get(ids=table["id"].to_pylist(), include=["embeddings"])
+    par_id = dict(zip(attendus["ids"], attendus["embeddings"]))
+    assert np.allclose(vecteurs, [par_id[i] for i in table["id"].to_pylist()], atol=1e-2)
+    assert len(etape.lire("avis.jsonl", "avis", asins=["B001"])) == 3
+
+
+def test_reindex_from_processed_stage_skips_parsing_and_encoding(tmp_path, store):
+    _, stats, etape = _indexer(tmp_path, store)
+    embedder = FakeEmbedder()
+    chemin = str(tmp_path / "autre")
+    autre = ReviewVectorStore(
+        persist_path=chemin, embedder=embedder, backend=creer_backend("mmap", chemin, ReviewVectorStore.NOM_COLLECTION)
+    )
+    pipeline = IngestionPipeline(autre, loader=ReviewLoader(data_path=str(tmp_path / "absent")), etape_traitee=etape)
+
+    reindexation = pipeline.reindexer("avis.jsonl")
+    assert reindexation.morceaux == reindexation.ajoutes == autre.compter() == stats.morceaux
+    assert embedder.nb_encodes == 0
+
+    redecoupage = pipeline.reindexer("avis.jsonl", redecouper=True)
+    assert redecoupage.avis_lus == 9 and redecoupage.ajoutes == 0
+    assert etape.manifeste("avis.jsonl")["morceaux"] == stats.morceaux
+
+
+def test_reencode_replaces_embeddings_and_model(tmp_path, store):
+    _, stats, etape = _indexer(tmp_path, store)
+
+    class AutreEmbedder(FakeEmbedder):
+        model_name = "autre"
+
+        def encoder(self, textes):
+            return np.ones((len(textes), 8), dtype=np.float32)
+
+    assert etape.reencoder("avis.jsonl", AutreEmbedder()) == stats.morceaux
+    assert etape.manifeste("avis.jsonl")["modele"] == "autre"
+    vecteurs = ProcessedReviews.vecteurs(etape.lire("avis.jsonl", colonnes=["embedding"])["embedding"])
+    assert vecteurs.shape == (stats.morceaux, 8) and np.all(vecteurs == 1)
+    assert len(etape.lire("avis.jsonl", "avis")) == 9
+
+
+def test_reindex_after_model_change_rewrites_vectors(tmp_path, store):
+    pipeline, stats, _ = _indexer(tmp_path, store)
+
+    class AutreEmbedder(FakeEmbedder):
+        model_name = "autre"
+
+        def _vecteur(self, texte):
+            return super()._vecteur(texte)[::-1].copy()
+
+    store.embedder = AutreEmbedder()
+    reindexation = pipeline.reindexer("avis.jsonl")
+    assert reindexation.modifies == stats.morceaux and reindexation.ajoutes == 0
+
+    stockes = store.backend.get(include=["documents", "embeddings"])
+    attendus = store.embedder.encoder(stockes["documents"])
+    assert np.allclose(np.asarray(stockes["embeddings"]), attendus, atol=1e-2)
+    assert pipeline.reindexer("avis.jsonl").modifies == 0
@@ -0,0 +1,66 @@
+import time
+
+from src import reranker as module_reranker
+from src.retriever import ReviewRetriever
+
+
+class FakeCrossEncoder:
+    """Score = nombre de mots de la requête présents dans le morceau."""
+
+    delai = 0.0
+
+    def __init__(self, *args, **kwargs):
+        self.paires = []
+
+    def predict(self, paires, **kwargs):
+        time.sleep(self.delai)
+        self.paires.extend(paires)
+        return [float(len(set(q.lower().split()) & set(t.lower().split()))) for q, t in paires]
+
+
+def _make_reranker(monkeypatch, **kwargs):
+    monkeypatch.setattr("sentence_transformers.CrossEncoder", FakeCrossEncoder)
+    return module_reranker.CrossEncoderReranker(model_name="fake", **kwargs)
+
+
+CANDIDATS = [
+    {"text": "Livraison rapide", "metadata": {}},
+    {"text": "Très bruyant la nuit", "metadata": {}},
+    {"text": "Le moteur est bruyant", "metadata": {}},
+]
+
+
+def test_rerank_orders_by_cross_encoder_and_caches(monkeypatch):
+    reranker = _make_reranker(monkeypatch, budget_ms=None)
+    resultats = reranker.reclasser("moteur bruyant", CANDIDATS, k=2)
+    assert [r["text"] for r in resultats] == ["Le moteur est bruyant", "Très bruyant la nuit"]
+    assert resultats[0]["score_reranker"] == 2.0
+
+    reranker.reclasser("Moteur  bruyant", CANDIDATS, k=2)
+    assert len(reranker.model.paires) == 3
+    assert reranker.statistiques()["hits"] == 3
+
+
+def test_budget_keeps_unscored_candidates_in_retrieval_order(monkeypatch):
+    reranker = _make_reranker(monkeypatch, budget_ms=1, taille_lot=1)
+    reranker.model.delai = 0.01
+    resultats = reranker.reclasser("moteur bruyant", CANDIDATS, k=3)
+    assert len(reranker.model.paires) == 1
+    assert [r["text"] for r in resultats] == [c["text"] for c in CANDIDATS]
+    assert [r["score_reranker"] for r in resultats] == [0.0, None, None]
+    assert reranker.statistiques()["budgets_depasses"] == 1
+
+
+def test_retriever_fetches_candidates_then_keeps_max_results(monkeypatch, store):
+    store.ajouter_documents(
+        [{"text": f"avis {i} sur la livraison", "metadata": {"asin": "A", "avis_id": str(i)}} for i in range(10)]
+        + [{"text": "moteur bruyant", "metadata": {"asin": "A", "avis_id": "m"}}]
+    )
+    retriever = ReviewRetriever(
+        store=store, max_results=2, n_candidats=11, reranker=_make_reranker(monkeypatch, budget_ms=None)
+    )
+    resultats = retriever.rechercher("livraison moteur bruyant")
+    assert len(retriever.reranker.model.paires) == 11
+    assert resultats[0]["text"] == "moteur bruyant"
+    assert len(resultats) == 2
+    assert retriever.rechercher_lot(["livraison moteur bruyant"]) == [resultats]
@@ -0,0 +1,58 @@
+import numpy as np
+
+from src.response_cache import ResponseCache
+
+
+class Horloge:
+    def __init__(self):
+        self.t = 0.0
+
+    def __call__(self):
+        return self.t
+
+
+REPONSE = {"answer": "Oui, assez silencieux.", "sources": []}
+
+
+def test_exact_hit_ignores_case_and_punctuation():
+    cache = ResponseCache()
+    cache.stocker("qa", (None, None), 1, "Est-il bruyant ?", REPONSE)
+    assert cache.chercher("qa", (None, None), 1, "est-il  bruyant") == REPONSE
+    assert cache.chercher("faq", (None, None), 1, "est-il bruyant") is None
+    assert cache.chercher("qa", (4, None), 1, "est-il bruyant") is None
+
+
+def test_semantic_hit_above_threshold_only():
+    cache = ResponseCache(seuil_similarite=0.9)
+    cache.stocker("qa", (), 1, "Est-il bruyant ?", REPONSE, vecteur=np.array([1.0, 0.0]))
+    assert cache.chercher("qa", (), 1, "Fait-il du bruit ?", np.array([0.99, 0.05])) == REPONSE
+    assert cache.chercher("qa", (), 1, "Se nettoie-t-il bien ?", np.array([0.0, 1.0])) is None
+    assert cache.statistiques()["hits_semantiques"] == 1
+
+
+def test_semantic_matching_is_off_by_default():
+    cache = ResponseCache()
+    cache.stocker("qa", (), 1, "Est-il bruyant ?", REPONSE, vecteur=np.array([1.0, 0.0]))
+    assert cache.chercher("qa", (), 1, "Est-il bruyant ?", np.array([1.0, 0.0])) == REPONSE
+    assert cache.chercher("qa", (), 1, "Fait-il du bruit ?", np.array([1.0, 0.0])) is None
+
+
+def test_entries_expire_after_ttl():
+    horloge = Horloge()
+    cache = ResponseCache(ttl=10, horloge=horloge)
+    cache.stocker("qa", (), 1, "q", REPONSE)
+    horloge.t = 11
+    assert cache.chercher("qa", (), 1, "q") is None
+
+
+def test_lru_eviction_and_version_invalidation():
+    cache = ResponseCache(max_entrees=2)
+    for q in ("a", "b"):
+        cache.stocker("qa", (), 1, q, REPONSE)
+    cache.chercher("qa", (), 1, "a")
+    cache.stocker("qa", (), 1, "c", REPONSE)
+    assert cache.chercher("qa", (), 1, "b") is None
+    assert cache.chercher("qa", (), 1, "a") == REPONSE
+
+    assert cache.chercher("qa", (), 2, "a") is None
+    assert len(cache) == 0
@@ -2,6 +2,7 @@ import pytest
 from unittest.mock import MagicMock
 
 from src.retriever import ReviewRetriever
+from src.vector_store import ReviewVectorStore
 
 
 FAKE_RESULTS = [
@@ -48,3 +49,24 @@ def test_format_context_contains_rating():
     results = retriever.retrieve("test")
     context = retriever.format_context(results)
     assert "/5" in context
+
+
+def test_retrieve_batch_pushes_filters_to_store():
+    store = MagicMock()
+    store.construire_filtre = ReviewVectorStore.construire_filtre
+    store.rechercher_lot.return_value = [FAKE_RESULTS, FAKE_RESULTS[1:]]
+    retriever = ReviewRetriever(store=store, max_results=3)
+    lots = retriever.rechercher_lot(["q1", "q2"], filtre_note=3.0, asin="B001")
+    assert len(lots) == 2
+    store.rechercher_lot.assert_called_once_with(
+        ["q1", "q2"],
+        n_resultats=3,
+        filtre={"$and": [{"asin": {"$eq": "B001"}}, {"note": {"$gte": 3.0}}]},
+    )
+
+
+def test_search_without_filters_sends_no_where_clause():
+    store = MagicMock()
+    store.construire_filtre = ReviewVectorStore.construire_filtre
+    ReviewRetriever(store=store, max_results=4).rechercher("q")
+    store.rechercher.assert_called_once_with("q", n_resultats=4, filtre=None, vecteur_requete=None)
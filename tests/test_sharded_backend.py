@@ -0,0 +1,128 @@
+import numpy as np
+import pytest
+
+from src import sharded_backend
+from src.sharded_backend import BackendShards
+
+
+def _corpus(n, dimension=16, n_asins=4, graine=0):
+    rng = np.random.default_rng(graine)
+    vecteurs = rng.normal(size=(n, dimension)).astype(np.float32)
+    ids = [f"{i:032x}" for i in range(n)]
+    metadonnees = [{"asin": f"A{i % n_asins}", "note": float(i % 5 + 1)} for i in range(n)]
+    return ids, vecteurs, [f"avis {i}" for i in range(n)], metadonnees
+
+
+def _exact(vecteurs, requete, masque, k):
+    sims = (vecteurs / np.linalg.norm(vecteurs, axis=1, keepdims=True)) @ (requete / np.linalg.norm(requete))
+    sims[~masque] = -np.inf
+    return [f"{i:032x}" for i in np.argsort(-sims)[:k]]
+
+
+def test_product_query_opens_one_shard_and_fan_out_merges(tmp_path):
+    ids, vecteurs, documents, metadonnees = _corpus(200)
+    backend = BackendShards("mmap", str(tmp_path), "avis")
+    backend.upsert(ids, vecteurs, documents, metadonnees)
+    assert backend.shards() == {f"A{i}": 50 for i in range(4)}
+    requete = vecteurs[5] + 0.1
+
+    recharge = BackendShards("mmap", str(tmp_path), "avis")
+    resultat = recharge.query(requete[np.newaxis, :], n_results=5, where={"asin": {"$eq": "A1"}})
+    assert list(recharge.ouverts) == ["A1"]
+    assert all(m["asin"] == "A1" for m in resultat["metadatas"][0])
+    assert recharge.count() == 200
+
+    masque = np.ones(len(ids), dtype=bool)
+    tout = recharge.query(requete[np.newaxis, :], n_results=5)
+    assert tout["ids"][0] == _exact(vecteurs, requete, masque, 5)
+    assert tout["distances"][0] == sorted(tout["distances"][0])
+    assert list(recharge.ouverts) == ["A1"]
+
+
+def test_lru_bounds_open_shards(tmp_path):
+    ids, vecteurs, documents, metadonnees = _corpus(100, n_asins=5)
+    backend = BackendShards("mmap", str(tmp_path), "avis", max_ouverts=2)
+    backend.upsert(ids, vecteurs, documents, metadonnees)
+    assert len(backend.ouverts) == 2
+
+    for asin in ("A0", "A1", "A0", "A2"):
+        backend.query(vecteurs[:1], n_results=3, where={"asin": asin})
+    assert list(backend.ouverts) == ["A0", "A2"]
+
+    # Une requête sur tout le catalogue ne chasse pas les shards chauds
+    backend.query(vecteurs[:1], n_results=3)
+    backend.get(limit=30, include=[])
+    assert list(backend.ouverts) == ["A0", "A2"]
+
+
+def test_unscoped_queries_reuse_long_lived_handles(tmp_path, monkeypatch):
+    ids, vecteurs, documents, metadonnees = _corpus(100, n_asins=5)
+    BackendShards("mmap", str(tmp_path), "avis").upsert(ids, vecteurs, documents, metadonnees)
+    backend = BackendShards("mmap", str(tmp_path), "avis", max_ouverts=2)
+    ouvertures = []
+    creer = sharded_backend.creer_backend
+
+    def compter(*args):
+        ouvertures.append(args)
+        return creer(*args)
+
+    monkeypatch.setattr(sharded_backend, "creer_backend", compter)
+
+    for _ in range(3):
+        backend.query(vecteurs[:1], n_results=3)
+    backend.query(vecteurs[:1], n_results=3, where={"asin": "A0"})
+    assert len(ouvertures) == 5
+    assert list(backend.ouverts) == ["A0"]
+
+
+def test_get_delete_and_pagination_across_shards(tmp_path):
+    ids, vecteurs, documents, metadonnees = _corpus(50, n_asins=3)
+    backend = BackendShards("mmap", str(tmp_path), "avis", max_ouverts=1)
+    backend.upsert(ids, vecteurs, documents, metadonnees)
+    pages = [backend.get(limit=7, offset=o, include=[])["ids"] for o in range(0, 56, 7)]
+    assert sorted(i for page in pages for i in page) == sorted(ids)
+    filtres = [backend.get(where={"note": {"$lte": 2.0}}, limit=6, offset=o, include=[])["ids"] for o in (0, 6, 12, 18)]
+    assert len({i for page in filtres for i in page}) == 20
+
+    backend.delete(ids[:10])
+    recharge = BackendShards("mmap", str(tmp_path), "avis")
+    assert recharge.count() == 40
+    assert recharge.get(ids=ids[:12], include=["documents"])["documents"] == ["avis 10", "avis 11"]
+
+
+def test_upsert_moves_chunk_whose_key_changed(tmp_path):
+    ids, vecteurs, documents, metadonnees = _corpus(8, n_asins=2)
+    backend = BackendShards("mmap", str(tmp_path), "avis")
+    backend.upsert(ids, vecteurs, documents, metadonnees)
+    backend.upsert(ids[:1], vecteurs[:1], ["déplacé"], [{"asin": "A1", "note": 1.0}])
+
+    assert backend.shards() == {"A0": 3, "A1": 5}
+    assert backend.get(ids=ids[:1], include=["metadatas"])["metadatas"] == [{"asin": "A1", "note": 1.0}]
+
+
+def test_changing_shard_key_requires_reset(tmp_path):
+    ids, vecteurs, documents, metadonnees = _corpus(4)
+    BackendShards("mmap", str(tmp_path), "avis").upsert(ids, vecteurs, documents, metadonnees)
+    with pytest.raises(ValueError):
+        BackendShards("mmap", str(tmp_path), "avis", cle="note")
+
+
+def test_reader_follows_writes_of_another_instance(tmp_path):
+    ids, vecteurs, documents, metadonnees = _corpus(40, n_asins=2)
+    ecrivain = BackendShards("mmap", str(tmp_path), "avis")
+    ecrivain.upsert(ids[:20], vecteurs[:20], documents[:20], metadonnees[:20])
+    lecteur = BackendShards("mmap", str(tmp_path), "avis")
+    assert lecteur.count() == 20
+    lecteur.query(vecteurs[:1], n_results=3, where={"asin": "A0"})
+
+    ecrivain.upsert(ids[20:], vecteurs[20:], documents[20:], metadonnees[20:])
+    ecrivain.delete(ids[:2])
+    assert lecteur.shards() == {"A0": 19, "A1": 19}
+    resultat = lecteur.query(vecteurs[20:21], n_results=1, where={"asin": "A0"})
+    assert resultat["ids"][0] == [ids[20]]
+    assert lecteur.get(ids=ids[:3], include=[])["ids"] == [ids[2]]
+
+
+def test_chroma_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        BackendShards("chroma", str(tmp_path), "avis")
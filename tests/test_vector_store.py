@@ -0,0 +1,104 @@
+from src.vector_store import ReviewVectorStore
+
+
+def _doc(texte, asin="B001", avis_id="r1", morceau=0, note=5.0):
+    return {
+        "text": texte,
+        "metadata": {"asin": asin, "note": note, "resume": "", "avis_id": avis_id, "morceau": morceau},
+    }
+
+
+DOCS = [
+    _doc("Très facile à nettoyer.", avis_id="r1"),
+    _doc("Un peu bruyant au démarrage.", avis_id="r2", note=3.0),
+    _doc("Solide et durable.", asin="B002", avis_id="r3"),
+]
+
+
+def test_ids_are_deterministic():
+    meta = DOCS[0]["metadata"]
+    assert ReviewVectorStore.identifiant("a", meta) == ReviewVectorStore.identifiant("b", meta)
+    autre = {**meta, "morceau": 1}
+    assert ReviewVectorStore.identifiant("a", meta) != ReviewVectorStore.identifiant("a", autre)
+
+
+def test_add_documents_twice_is_idempotent(store):
+    store.ajouter_documents(DOCS)
+    store.ajouter_documents(DOCS)
+    assert store.compter() == len(DOCS)
+
+
+def test_sync_only_embeds_changes(store, fake_embedder):
+    store.synchroniser(DOCS)
+    fake_embedder.nb_encodes = 0
+
+    nouveaux = [DOCS[0], _doc("Bruyant en permanence.", avis_id="r2", note=2.0), _doc("Nouveau.", avis_id="r4")]
+    bilan = store.synchroniser(nouveaux)
+
+    assert bilan == {"ajoutes": 1, "modifies": 1, "inchanges": 1, "supprimes": 1}
+    assert fake_embedder.nb_encodes == 2
+    assert store.compter() == 3
+
+
+def test_sync_without_deletion_keeps_absent_chunks(store):
+    store.synchroniser(DOCS)
+    bilan = store.synchroniser(DOCS[:1], supprimer_absents=False)
+    assert bilan["supprimes"] == 0
+    assert store.compter() == len(DOCS)
+
+
+def test_batch_search_matches_single_searches(store):
+    store.ajouter_documents(DOCS)
+    questions = ["facile à nettoyer ?", "est-il bruyant ?", "durable ?"]
+    lots = store.rechercher_lot(questions, n_resultats=2)
+    assert len(lots) == len(questions)
+    for question, resultats in zip(questions, lots):
+        attendus = store.rechercher(question, n_resultats=2)
+        assert [r["text"] for r in resultats] == [r["text"] for r in attendus]
+
+
+def test_filtered_search_honours_k(store):
+    docs = [_doc(f"Avis négatif numéro {i}.", avis_id=f"n{i}", note=1.0) for i in range(30)]
+    docs += [_doc("Excellent, je recommande.", avis_id="p1"), _doc("Parfait.", avis_id="p2")]
+    store.ajouter_documents(docs)
+
+    filtre = ReviewVectorStore.construire_filtre(note_min=5)
+    resultats = store.rechercher("avis négatif", n_resultats=2, filtre=filtre)
+    assert sorted(r["text"] for r in resultats) == ["Excellent, je recommande.", "Parfait."]
+
+
+def test_filtered_search_by_asin_matches_exact_and_hnsw_paths(store):
+    store.ajouter_documents(DOCS + [_doc(f"Produit deux, avis {i}.", asin="B002", avis_id=f"b{i}") for i in range(10)])
+    filtre = ReviewVectorStore.construire_filtre(asin="B002")
+
+    exacts = store.rechercher("avis produit", n_resultats=3, filtre=filtre)
+    store.seuil_recherche_exacte = 0
+    hnsw = store.rechercher("avis produit", n_resultats=3, filtre=filtre)
+
+    assert all(r["metadata"]["asin"] == "B002" for r in exacts)
+    assert all(r["metadata"]["asin"] == "B002" for r in hnsw)
+    assert [round(r["distance"], 4) for r in exacts] == [round(r["distance"], 4) for r in hnsw]
+
+
+def test_build_filter():
+    assert ReviewVectorStore.construire_filtre() is None
+    assert ReviewVectorStore.construire_filtre(note_min=4) == {"note": {"$gte": 4.0}}
+    assert ReviewVectorStore.construire_filtre(asin=["A", "B"], note_max=2) == {
+        "$and": [{"asin": {"$in": ["A", "B"]}}, {"note": {"$lte": 2.0}}]
+    }
+
+
+def test_version_changes_only_on_writes(store):
+    store.synchroniser(DOCS)
+    version = store.version
+    store.synchroniser(DOCS)
+    assert store.version == version
+    store.synchroniser(DOCS[:2])
+    assert store.version > version
+
+
+def test_version_is_shared_with_other_processes(store, tmp_path, fake_embedder):
+    autre = ReviewVectorStore(persist_path=str(tmp_path / "store"), embedder=fake_embedder, backend=store.backend)
+    version = autre.version
+    store.synchroniser(DOCS)
+    assert autre.version > version